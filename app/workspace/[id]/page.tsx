@@ -15,35 +15,23 @@ export default function WorkspacePage() {
   const [error, setError] = useState<string | null>(null);
 
   useEffect(() => {
-    // Try to fetch workspace data from backend
-    // For now, if workspaceId starts with "ws_", try to fetch it
-    // Otherwise, treat it as a query and create a new workspace
+    // Workspace IDs ("ws_...") are fetched from the backend's workspace store;
+    // anything else is treated as a query and a new workspace is created
     const fetchWorkspace = async () => {
       setIsLoading(true);
       setError(null);
       
       try {
         if (workspaceId.startsWith("ws_")) {
-          // TODO: Implement GET endpoint for fetching existing workspace
-          // For now, we'll need to store workspace data or recreate it
-          setError("Workspace fetching not yet implemented. Creating new workspace...");
-          // Fallback: treat as query
-          const query = decodeURIComponent(workspaceId);
-          const response = await fetch(`${BACKEND_URL}/api/workspace/create`, {
-            method: "POST",
-            headers: {
-              "Content-Type": "application/json",
-            },
-            body: JSON.stringify({ query }),
-          });
+          const response = await fetch(`${BACKEND_URL}/api/workspace/${encodeURIComponent(workspaceId)}`);
           
           if (response.ok) {
             const data = await response.json();
-            console.log("Workspace data received:", data);
-            console.log("Suggestions:", data.suggestions);
             setWorkspace(data);
+          } else if (response.status === 404) {
+            throw new Error("Workspace not found. It may have been created on another server.");
           } else {
-            throw new Error("Failed to create workspace");
+            throw new Error("Failed to load workspace");
           }
         } else {
           // Treat as query and create workspace
@@ -0,0 +1,125 @@
+"""
+Batch workspace generation for Atlas - pre-generates workspaces for many queries
+
+Usage:
+    cd backend
+    python batch.py queries.txt > workspaces.ndjson
+    python batch.py queries.txt --concurrency 8 --per-minute 120
+
+queries.txt has one query per line. Each output line is one workspace (the
+same payload /api/workspace/create returns) or {"query": ..., "error": ...}.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from rate_limiter import PRIORITY_BATCH, llm_priority, use_priority
+from result_cache import normalize_query
+
+
+class RateBudget:
+    """Spaces out starts so no more than `per_minute` happen in any minute"""
+
+    def __init__(self, per_minute: Optional[float]):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+def dedupe_queries(queries: Iterable[str]) -> List[str]:
+    """Drop blank queries and queries that normalize to one already seen, keeping order"""
+    seen = set()
+    unique = []
+    for query in queries:
+        normalized = normalize_query(query)
+        if normalized and normalized not in seen:
+            seen.add(normalized)
+            unique.append(query.strip())
+    return unique
+
+
+async def run_batch(
+    queries: Iterable[str],
+    classify_many: Callable[[List[str]], Awaitable[Dict[str, object]]],
+    build_one: Callable[[str, object], Awaitable[dict]],
+    concurrency: int = 8,
+    per_minute: Optional[float] = None,
+) -> AsyncIterator[dict]:
+    """
+    Generate a workspace for every unique query, yielding each one as it finishes.
+
+    `classify_many` classifies all queries up front (in batched prompts) and
+    returns {query: classification}. `build_one(query, classification)` then
+    generates the rest of the workspace. At most `concurrency` workspaces are
+    built at once, and at most `per_minute` are started per minute. All LLM
+    calls made here run at batch priority, behind interactive requests.
+    """
+    unique = dedupe_queries(queries)
+    if not unique:
+        return
+    with use_priority(PRIORITY_BATCH):
+        classifications = await classify_many(unique)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    budget = RateBudget(per_minute)
+
+    async def build(query: str) -> dict:
+        llm_priority.set(PRIORITY_BATCH)  # Each task has its own context
+        async with semaphore:
+            await budget.acquire()
+            try:
+                return await build_one(query, classifications[query])
+            except Exception as e:
+                return {"query": query, "error": str(e)}
+
+    tasks = [asyncio.create_task(build(query)) for query in unique]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def _run_cli(args) -> None:
+    with open(args.queries, encoding="utf-8") as f:
+        queries = f.read().splitlines()
+
+    import main  # Imported here so importing batch from main doesn't loop
+
+    results = run_batch(
+        queries,
+        main.classify_queries_batch,
+        main.build_workspace_for,
+        concurrency=args.concurrency,
+        per_minute=args.per_minute,
+    )
+    try:
+        async for workspace in results:
+            sys.stdout.write(json.dumps(workspace) + "\n")
+            sys.stdout.flush()
+    finally:
+        # Workspaces are written on a daemon thread, which exiting would cut short
+        main.workspace_store.flush(timeout=None)
+        main.workspace_store.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-generate Atlas workspaces as NDJSON")
+    parser.add_argument("queries", help="File with one query per line")
+    parser.add_argument("--concurrency", type=int, default=8, help="Workspaces generated at once")
+    parser.add_argument("--per-minute", type=float, default=None, help="Max workspaces started per minute")
+    asyncio.run(_run_cli(parser.parse_args()))
@@ -0,0 +1,303 @@
+"""
+Offline load test for Atlas - drives the API in-process against the mock LLM backend
+
+Usage:
+    cd backend
+    python benchmark.py
+    python benchmark.py --endpoint create --concurrency 1,8,32 --requests 200
+    python benchmark.py --endpoint suggestions --latency-ms 1200 --error-rate 0.05 --json
+    python benchmark.py --cold-start --runs 5 --cold-start-ms 1500
+
+No network access or API key is needed: requests go straight to the ASGI app
+and every LLM call is answered by MockLLMBackend. Reports throughput,
+p50/p95/p99 latency, upstream LLM calls per request and stage fallbacks (stages
+that failed and returned a placeholder) for each concurrency. The mock offers
+the router two models, so --error-rate exercises failover and the breakers;
+--rate-limit-rate simulates 429s, which are retried with backoff.
+
+--cold-start instead starts fresh worker processes and measures the import
+time of main.py, startup (lifespan warm-up) time and the latency of the first
+and second requests, with the warm-up off and on. The mock's --cold-start-ms
+stands in for model discovery and connection setup; the SDK import time is
+measured for real.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from typing import List, Optional, Tuple
+from urllib.parse import urlencode
+
+SAMPLE_QUERIES = [
+    "plan a trip to japan",
+    "best laptop for coding",
+    "learn react in 4 weeks",
+    "organize my startup idea",
+    "weekend in lisbon on a budget",
+    "which espresso machine to buy",
+    "study plan for the gre",
+    "plan a product launch",
+    "things to see near the grand canyon",
+    "help me think about quantum computing",
+]
+
+ENDPOINTS = {
+    "create": ("/api/workspace/create", {}),
+    "stream": ("/api/workspace/create/stream", {}),
+    "classify": ("/api/workspace/classify", {}),
+    "schema": ("/api/workspace/schema", {"workspace_type": "travel_research"}),
+    "suggestions": ("/api/workspace/suggestions", {"workspace_type": "travel_research"}),
+}
+
+
+async def asgi_request(app, method: str, path: str, params: dict, body: Optional[dict]) -> Tuple[int, bytes]:
+    """Send one HTTP request straight to an ASGI app and collect the full response"""
+    payload = json.dumps(body).encode("utf-8") if body is not None else b""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode("utf-8"),
+        "query_string": urlencode(params).encode("utf-8"),
+        "root_path": "",
+        "headers": [(b"host", b"benchmark"), (b"content-type", b"application/json")],
+        "client": ("127.0.0.1", 0),
+        "server": ("benchmark", 80),
+    }
+    finished = asyncio.Event()
+    sent_body = False
+    status = 500
+    chunks: List[bytes] = []
+
+    async def receive():
+        nonlocal sent_body
+        if not sent_body:
+            sent_body = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                finished.set()
+
+    await app(scope, receive, send)
+    finished.set()
+    return status, b"".join(chunks)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+async def run_level(main, endpoint: str, concurrency: int, total: int, repeat_ratio: float, seed: int) -> dict:
+    """Fire `total` requests with `concurrency` in flight and summarize them"""
+    path, params = ENDPOINTS[endpoint]
+    rng = random.Random(seed)
+    queries = []
+    for i in range(total):
+        base = rng.choice(SAMPLE_QUERIES)
+        # Repeated queries can hit the caches; the rest are made unique
+        queries.append(base if rng.random() < repeat_ratio else f"{base} #{concurrency}-{i}")
+
+    latencies: List[float] = []
+    errors = 0
+    calls_before = main.llm_backend.calls
+    fallbacks_before = stage_fallbacks(main)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(query: str):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            status, _ = await asgi_request(main.app, "POST", path, params, {"query": query})
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one(q) for q in queries])
+    elapsed = time.perf_counter() - started
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "throughput_rps": total / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "upstream_calls_per_request": (main.llm_backend.calls - calls_before) / total,
+        "stage_fallbacks": int(stage_fallbacks(main) - fallbacks_before),
+    }
+
+
+def stage_fallbacks(main) -> float:
+    """Stage results that came from an error fallback; those requests still answer 200"""
+    return sum(
+        main.STAGE_RESULTS.value(stage=stage, source="error")
+        for stage in ("classify", "schema", "suggestions", "suggestions_refresh")
+    )
+
+
+def configure_env(args) -> None:
+    os.environ["ATLAS_LLM_BACKEND"] = "mock"
+    os.environ["ATLAS_MOCK_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["ATLAS_MOCK_LATENCY_SIGMA"] = str(args.latency_sigma)
+    os.environ["ATLAS_MOCK_ERROR_RATE"] = str(args.error_rate)
+    os.environ["ATLAS_MOCK_RATE_LIMIT_RATE"] = str(args.rate_limit_rate)
+    os.environ["ATLAS_MOCK_SEED"] = str(args.seed)
+    os.environ["ATLAS_MOCK_MODELS"] = "mock-primary,mock-secondary"
+    # Never persist benchmark results or pick up a shared cache file
+    os.environ["ATLAS_CACHE_DB"] = ""
+    os.environ["ATLAS_WORKSPACE_DB"] = ""
+    # Mock evidence links point at example.com; don't measure the network
+    os.environ["ATLAS_VALIDATE_LINKS"] = "false"
+    # The unique queries are the sample queries plus a suffix; measure the full pipeline for them
+    os.environ["ATLAS_NEAR_DUP"] = "false"
+    if not args.verbose:
+        os.environ["ATLAS_LOG_LEVEL"] = "ERROR"
+
+
+async def run(args) -> List[dict]:
+    configure_env(args)
+    import main
+
+    results = []
+    for level in [int(c) for c in args.concurrency.split(",")]:
+        results.append(await run_level(main, args.endpoint, level, args.requests, args.repeat_ratio, args.seed))
+    return results
+
+
+async def cold_start_child(args) -> dict:
+    """One fresh worker: import, start up (with args.warmup), then two requests; run in a subprocess"""
+    configure_env(args)
+    os.environ["ATLAS_WARMUP"] = args.warmup
+    os.environ["ATLAS_MOCK_COLD_START_MS"] = str(args.cold_start_ms)
+    start = time.perf_counter()
+    import main
+    result = {"warmup": args.warmup, "import_ms": (time.perf_counter() - start) * 1000}
+    result["sdk_imported"] = "google.generativeai" in sys.modules
+
+    start = time.perf_counter()
+    async with main.app.router.lifespan_context(main.app):
+        result["startup_ms"] = (time.perf_counter() - start) * 1000
+        path, params = ENDPOINTS[args.endpoint]
+        for label, query in [("first_request_ms", "plan a trip to japan"), ("second_request_ms", "learn go")]:
+            start = time.perf_counter()
+            await asgi_request(main.app, "POST", path, params, {"query": query})
+            result[label] = (time.perf_counter() - start) * 1000
+
+    # What importing the SDK eagerly at startup would have added
+    if not result["sdk_imported"]:
+        start = time.perf_counter()
+        import google.generativeai  # noqa: F401
+        result["sdk_import_ms"] = (time.perf_counter() - start) * 1000
+    return result
+
+
+def cold_start(args) -> List[dict]:
+    """Median cold-start timings over args.runs fresh processes, per warm-up mode"""
+    results = []
+    for warmup in ["off", "blocking"]:
+        runs = []
+        for _ in range(args.runs):
+            child = subprocess.run(
+                [
+                    sys.executable, os.path.abspath(__file__), "--cold-start-child", "--warmup", warmup,
+                    "--endpoint", args.endpoint, "--latency-ms", str(args.latency_ms),
+                    "--latency-sigma", "0", "--cold-start-ms", str(args.cold_start_ms),
+                ],
+                capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+            )
+            runs.append(json.loads(child.stdout.strip().splitlines()[-1]))
+        summary = {"warmup": warmup, "runs": len(runs), "sdk_imported": any(r["sdk_imported"] for r in runs)}
+        for key in ["import_ms", "startup_ms", "first_request_ms", "second_request_ms", "sdk_import_ms"]:
+            values = [r[key] for r in runs if key in r]
+            if values:
+                summary[key] = statistics.median(values)
+        results.append(summary)
+    return results
+
+
+def print_cold_start(results: List[dict]) -> None:
+    header = f"{'warmup':<10}{'import ms':>11}{'startup ms':>12}{'1st req ms':>12}{'2nd req ms':>12}{'sdk import ms':>15}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['warmup']:<10}{r['import_ms']:>11.0f}{r['startup_ms']:>12.0f}{r['first_request_ms']:>12.0f}"
+            f"{r['second_request_ms']:>12.0f}{r.get('sdk_import_ms', 0):>15.0f}"
+        )
+    print("(sdk import ms: what an eager google.generativeai import would add to every worker start)")
+
+
+def print_table(results: List[dict]) -> None:
+    header = (
+        f"{'endpoint':<12}{'conc':>6}{'reqs':>7}{'errs':>6}{'fallbk':>8}{'req/s':>9}"
+        f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'calls/req':>11}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['endpoint']:<12}{r['concurrency']:>6}{r['requests']:>7}{r['errors']:>6}{r['stage_fallbacks']:>8}"
+            f"{r['throughput_rps']:>9.1f}{r['p50_ms']:>9.0f}{r['p95_ms']:>9.0f}{r['p99_ms']:>9.0f}"
+            f"{r['upstream_calls_per_request']:>11.2f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline Atlas load test against the mock LLM backend")
+    parser.add_argument("--endpoint", choices=sorted(ENDPOINTS), default="create")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per concurrency level")
+    parser.add_argument("--latency-ms", type=float, default=800, help="Median mock LLM latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.4, help="Log-normal latency spread")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of mock calls that fail (503)")
+    parser.add_argument(
+        "--rate-limit-rate", type=float, default=0.0, help="Fraction of mock calls rejected with a 429 (retried)"
+    )
+    parser.add_argument("--repeat-ratio", type=float, default=0.0, help="Fraction of requests reusing a popular query")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument("--verbose", action="store_true", help="Show backend logs")
+    parser.add_argument("--cold-start", action="store_true", help="Measure import, startup and first-request time")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh processes per warm-up mode with --cold-start")
+    parser.add_argument("--cold-start-ms", type=float, default=1000, help="Mock one-time setup cost with --cold-start")
+    parser.add_argument("--cold-start-child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--warmup", default="blocking", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cold_start_child:
+        print(json.dumps(asyncio.run(cold_start_child(args))))
+    elif args.cold_start:
+        results = cold_start(args)
+        if args.json:
+            print(json.dumps(results, indent=2))
+        else:
+            print_cold_start(results)
+    else:
+        results = asyncio.run(run(args))
+        if args.json:
+            print(json.dumps(results, indent=2))
+        else:
+            print_table(results)
@@ -0,0 +1,254 @@
+"""
+Evidence post-processing for Atlas - canonical URLs, cross-suggestion dedup and link checks
+"""
+
+import asyncio
+import json
+import re
+import socket
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import httpx
+
+from result_cache import ResultCache, content_hash
+from singleflight import AsyncSingleFlight
+
+# Query parameters that only track where a click came from
+_TRACKING_PARAMS = re.compile(
+    r"^(utm_\w+|fbclid|gclid|dclid|msclkid|mc_cid|mc_eid|igshid|ref|ref_src|ref_url|src|si|_ga|_hsenc|_hsmi)$",
+    re.I,
+)
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Normal form of a URL: lowercase scheme and host, no default port, no
+    fragment, no tracking parameters, sorted query and no trailing slash
+    (except for the root path). Returns the input unchanged if it isn't an
+    http(s) URL.
+    """
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    if scheme not in _DEFAULT_PORTS or not parts.hostname:
+        return url
+    host = parts.hostname.lower()
+    if port and port != _DEFAULT_PORTS[scheme]:
+        host = f"{host}:{port}"
+    path = re.sub(r"/{2,}", "/", parts.path) or "/"
+    if len(path) > 1:
+        path = path.rstrip("/")
+    query = urlencode(sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not _TRACKING_PARAMS.match(k)
+    ))
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+def _dedup_key(canonical: str) -> str:
+    """Hash under which URL variants collide: http/https and www./bare host are treated as one"""
+    try:
+        parts = urlsplit(canonical)
+    except ValueError:
+        return content_hash(canonical)
+    host = parts.netloc[4:] if parts.netloc.startswith("www.") else parts.netloc
+    return content_hash(host, parts.path, parts.query)
+
+
+class EvidenceIndex:
+    """
+    Hashed index of evidence URLs already shown. `dedupe` rewrites a suggestion's
+    evidence to canonical URLs and drops any URL an earlier suggestion (or an
+    earlier entry of the same one) already cited.
+    """
+
+    def __init__(self, seen: Iterable = ()):
+        self._seen: Dict[str, str] = {}
+        for suggestion in seen:
+            self.dedupe(suggestion)
+
+    def __contains__(self, url: str) -> bool:
+        return _dedup_key(canonicalize_url(url)) in self._seen
+
+    def dedupe(self, suggestion):
+        evidence = []
+        for item in suggestion.evidence:
+            canonical = canonicalize_url(item.url)
+            key = _dedup_key(canonical)
+            if key in self._seen:
+                continue
+            self._seen[key] = canonical
+            evidence.append(item.model_copy(update={"url": canonical}))
+        return suggestion.model_copy(update={"evidence": evidence})
+
+
+def dedupe_evidence(suggestions: Sequence, index: Optional[EvidenceIndex] = None) -> List:
+    """Canonicalize and dedupe evidence across a list of suggestions, in order"""
+    index = index or EvidenceIndex()
+    return [index.dedupe(s) for s in suggestions]
+
+
+# getaddrinfo codes meaning the name doesn't exist, as opposed to a resolver failure like EAI_AGAIN
+_NO_SUCH_HOST = {socket.EAI_NONAME} | ({socket.EAI_NODATA} if hasattr(socket, "EAI_NODATA") else set())
+
+
+def _host_not_found(error: BaseException) -> bool:
+    """Whether a connect error was caused by the host name not resolving"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, socket.gaierror):
+            return error.errno in _NO_SUCH_HOST
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def _hostname(url: str) -> Optional[str]:
+    """A URL's host name ("" if it has none), or None if it can't be parsed (e.g. "http://[::1")"""
+    try:
+        return urlsplit(url).hostname or ""
+    except ValueError:
+        return None
+
+
+class LinkChecker:
+    """
+    Checks that evidence URLs exist with cached HEAD requests.
+
+    A URL is dead if it answers 404/410, its host doesn't resolve or it isn't
+    a valid URL at all; anything else (including 403/405 from sites that block
+    bots, and timeouts) counts as alive, since the check can't tell. Results
+    are cached per URL, and unresolvable hosts per host, so a popular domain
+    is only looked up once: `ok_ttl` for live URLs, the shorter `bad_ttl` for
+    dead ones (negative caching) and `unsure_ttl` for inconclusive ones, so a
+    slow site isn't re-probed on every request. With `db_path` the live and
+    dead results persist in SQLite across restarts. Requests share one pooled
+    client, at most `max_concurrency` run at once, and concurrent checks of
+    the same URL are coalesced.
+
+    `filter` waits at most `deadline` seconds (None: no limit) for the whole
+    batch; links still being checked then are kept, and their checks finish
+    in the background to fill the cache.
+    """
+
+    def __init__(
+        self,
+        timeout: float = 2.0,
+        max_concurrency: int = 16,
+        ok_ttl: float = 7 * 24 * 3600,
+        bad_ttl: float = 3600,
+        unsure_ttl: float = 300,
+        cache_entries: int = 8192,
+        db_path: Optional[str] = None,
+        deadline: Optional[float] = 1.0,
+    ):
+        self.timeout = timeout
+        self.deadline = deadline
+        # Both tiers can share one SQLite file; their keys never collide
+        self._ok = ResultCache(max_entries=cache_entries, ttl=ok_ttl, db_path=db_path)
+        self._bad = ResultCache(max_entries=cache_entries, ttl=bad_ttl, db_path=db_path)
+        # Only worth remembering for this process
+        self._unsure = ResultCache(max_entries=cache_entries, ttl=unsure_ttl)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._flight = AsyncSingleFlight()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._background: Set[asyncio.Task] = set()
+        self.max_concurrency = max_concurrency
+        self.checked = 0
+        self.deadline_misses = 0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                headers={"User-Agent": "Atlas/0.1 (link check)"},
+                limits=httpx.Limits(max_connections=self.max_concurrency),
+                timeout=self.timeout,
+                follow_redirects=True,
+            )
+        return self._client
+
+    def _cached(self, url: str) -> Optional[bool]:
+        host = _hostname(url)
+        if host is None:
+            return False  # Nothing to check, and nothing a reader could open either
+        if self._bad.get(ResultCache.make_key("dead-host", host)):
+            return False
+        if self._bad.get(ResultCache.make_key("dead", url)):
+            return False
+        if self._ok.get(ResultCache.make_key("ok", url)):
+            return True
+        if self._unsure.get(ResultCache.make_key("unsure", url)):
+            return True
+        return None
+
+    async def check(self, url: str) -> bool:
+        cached = self._cached(url)
+        if cached is not None:
+            return cached
+        return await self._flight.do(url, lambda: self._check(url))
+
+    async def _check(self, url: str) -> bool:
+        async with self._semaphore:
+            self.checked += 1
+            try:
+                response = await self._get_client().head(url)
+            except (httpx.InvalidURL, ValueError) as e:
+                # Model output that isn't a usable URL (control characters, bad port, ...)
+                self._bad.set(ResultCache.make_key("dead", url), json.dumps(type(e).__name__))
+                return False
+            except httpx.HTTPError as e:
+                if isinstance(e, httpx.ConnectError) and _host_not_found(e):
+                    self._bad.set(ResultCache.make_key("dead-host", _hostname(url)), json.dumps(False))
+                    return False
+                # Timeouts and the like say nothing about the link
+                self._unsure.set(ResultCache.make_key("unsure", url), json.dumps(type(e).__name__))
+                return True
+        if response.status_code in (404, 410):
+            self._bad.set(ResultCache.make_key("dead", url), json.dumps(response.status_code))
+            return False
+        self._ok.set(ResultCache.make_key("ok", url), json.dumps(response.status_code))
+        return True
+
+    async def filter(self, suggestions: Sequence) -> List:
+        """Suggestions with evidence pointing at dead links removed"""
+        results: Dict[str, bool] = {}
+        pending: Dict[asyncio.Task, str] = {}
+        for url in {item.url for s in suggestions for item in s.evidence}:
+            cached = self._cached(url)
+            if cached is not None:
+                results[url] = cached
+            else:
+                pending[asyncio.ensure_future(self.check(url))] = url
+        if pending:
+            done, unfinished = await asyncio.wait(pending, timeout=self.deadline)
+            for task in done:
+                results[pending[task]] = task.result()
+            self.deadline_misses += len(unfinished)
+            for task in unfinished:
+                self._background.add(task)
+                task.add_done_callback(self._background.discard)
+        return [
+            s.model_copy(update={"evidence": [item for item in s.evidence if results.get(item.url, True)]})
+            for s in suggestions
+        ]
+
+    async def aclose(self) -> None:
+        for task in list(self._background):
+            task.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "checked": self.checked,
+            "deadline_misses": self.deadline_misses,
+            "ok_cache": self._ok.stats(),
+            "bad_cache": self._bad.stats(),
+            "unsure_cache": self._unsure.stats(),
+        }
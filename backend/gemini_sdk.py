@@ -0,0 +1,75 @@
+"""
+Gemini SDK access for Atlas - imported on first use, configured once, models built once
+"""
+
+import importlib
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+class GeminiSDK:
+    """
+    Lazy handle on google.generativeai.
+
+    Importing the SDK takes most of a second, so it is only imported (and
+    configured with `api_key`) the first time something needs it: a Gemini
+    call, model discovery or the startup warm-up. Routes that never touch
+    Gemini, and the mock backend, never pay for it. `GenerativeModel`
+    instances are built once per model name and shared by every call; they
+    share the SDK's client, so warmed-up connections are reused too.
+    """
+
+    def __init__(self, api_key: Optional[str] = None):
+        self.api_key = api_key
+        self._lock = threading.Lock()
+        self._module = None
+        self._models: Dict[str, Any] = {}
+        self.import_seconds: Optional[float] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    @property
+    def genai(self):
+        """The configured google.generativeai module, imported on first access"""
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    start = time.perf_counter()
+                    module = importlib.import_module("google.generativeai")
+                    if self.api_key:
+                        module.configure(api_key=self.api_key)
+                    self.import_seconds = time.perf_counter() - start
+                    self._module = module
+        return self._module
+
+    @property
+    def GenerationConfig(self):
+        return self.genai.types.GenerationConfig
+
+    def list_models(self):
+        return self.genai.list_models()
+
+    def model(self, name: str):
+        """The shared GenerativeModel for `name`"""
+        model = self._models.get(name)
+        if model is None:
+            genai = self.genai
+            with self._lock:
+                model = self._models.get(name)
+                if model is None:
+                    model = self._models[name] = genai.GenerativeModel(name)
+        return model
+
+    def connect(self, name: str) -> None:
+        """
+        Open the upstream connection with a token count, which costs no
+        generation quota, so the first real call doesn't pay for TLS setup
+        """
+        self.model(name).count_tokens("ping")
+
+    def models(self) -> List[str]:
+        """Names of the models built so far"""
+        return list(self._models)
@@ -0,0 +1,283 @@
+"""
+LLM backends for Atlas - the interface behind call_gemini, plus an offline mock
+"""
+
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+WORKSPACE_TYPES = ["travel_research", "purchase_research", "learning_plan", "project_planner"]
+
+
+class LLMBackend:
+    """
+    Something that turns a prompt into text. call_gemini and the streaming
+    endpoint go through the configured backend, so Gemini can be swapped for
+    the mock below (ATLAS_LLM_BACKEND=mock) in benchmarks and offline runs.
+    """
+
+    name = "base"
+
+    @property
+    def model_id(self) -> str:
+        """Identifies the model in cache keys"""
+        return self.name
+
+    def models(self) -> List[str]:
+        """Models the router may send a call to, in preference order"""
+        return [self.model_id]
+
+    def generate(
+        self,
+        prompt: str,
+        system_instruction: str = "",
+        response_schema: Optional[dict] = None,
+        max_output_tokens: Optional[int] = None,
+    ) -> str:
+        """
+        Text for a prompt. `response_schema` (Gemini's OpenAPI subset) asks for
+        JSON matching it, where the backend supports a JSON mode, and
+        `max_output_tokens` cuts the response off at that length.
+        """
+        raise NotImplementedError
+
+    def generate_with_model(
+        self,
+        model: str,
+        prompt: str,
+        system_instruction: str = "",
+        response_schema: Optional[dict] = None,
+        max_output_tokens: Optional[int] = None,
+    ) -> str:
+        """One attempt on one model, with no fallback; errors propagate to the router"""
+        return self.generate(prompt, system_instruction, response_schema, max_output_tokens)
+
+    def stream(
+        self, prompt: str, system_instruction: str = "", max_output_tokens: Optional[int] = None
+    ) -> Iterator[str]:
+        yield self.generate(prompt, system_instruction, max_output_tokens=max_output_tokens)
+
+    def warm_up(self) -> Dict[str, float]:
+        """
+        Pay one-time setup costs (SDK import, model discovery, connections)
+        before the first request does; returns seconds spent per step
+        """
+        return {}
+
+
+class MockLLMError(Exception):
+    """Simulated upstream failure"""
+
+
+class MockLLMBackend(LLMBackend):
+    """
+    Offline stand-in for Gemini with configurable latency and failures.
+
+    Latency is log-normal with median `latency_ms` and shape `latency_sigma`
+    (0 gives a fixed latency). A fraction `error_rate` of calls fail with a
+    MockLLMError that looks like a 503 (so the router fails over and trips
+    breakers), a fraction `rate_limit_rate` with one that looks like a 429
+    (which the client retries with backoff), and a fraction `fence_rate` of
+    responses are wrapped in
+    markdown code fences the way Gemini often does. The first call (or
+    `warm_up`) also waits `cold_start_ms`, standing in for the SDK import,
+    model discovery and connection setup of a real cold start. Responses come from
+    `responses` ({substring of the prompt: response text}) when one matches,
+    otherwise a canned JSON answer for whichever Atlas prompt was sent.
+    With more than one name in `model_names` the router has models to fail
+    over between. `calls` counts upstream calls.
+    """
+
+    name = "mock"
+
+    def __init__(
+        self,
+        latency_ms: float = 800.0,
+        latency_sigma: float = 0.4,
+        error_rate: float = 0.0,
+        fence_rate: float = 0.3,
+        rate_limit_rate: float = 0.0,
+        responses: Optional[Dict[str, str]] = None,
+        seed: Optional[int] = None,
+        stream_chunk_chars: int = 40,
+        cold_start_ms: float = 0.0,
+        model_names: Optional[List[str]] = None,
+    ):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.fence_rate = fence_rate
+        self.responses = responses or {}
+        self.stream_chunk_chars = stream_chunk_chars
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.cold_start_ms = cold_start_ms
+        self._cold = cold_start_ms > 0
+        self.model_names = model_names or [self.name]
+
+    @classmethod
+    def from_env(cls) -> "MockLLMBackend":
+        responses = None
+        responses_path = os.getenv("ATLAS_MOCK_RESPONSES")
+        if responses_path:
+            with open(responses_path, encoding="utf-8") as f:
+                responses = json.load(f)
+        seed = os.getenv("ATLAS_MOCK_SEED")
+        return cls(
+            latency_ms=float(os.getenv("ATLAS_MOCK_LATENCY_MS", "800")),
+            latency_sigma=float(os.getenv("ATLAS_MOCK_LATENCY_SIGMA", "0.4")),
+            error_rate=float(os.getenv("ATLAS_MOCK_ERROR_RATE", "0")),
+            fence_rate=float(os.getenv("ATLAS_MOCK_FENCE_RATE", "0.3")),
+            rate_limit_rate=float(os.getenv("ATLAS_MOCK_RATE_LIMIT_RATE", "0")),
+            responses=responses,
+            seed=int(seed) if seed else None,
+            cold_start_ms=float(os.getenv("ATLAS_MOCK_COLD_START_MS", "0")),
+            model_names=[m.strip() for m in os.getenv("ATLAS_MOCK_MODELS", "").split(",") if m.strip()] or None,
+        )
+
+    def models(self) -> List[str]:
+        return list(self.model_names)
+
+    def warm_up(self) -> Dict[str, float]:
+        start = time.perf_counter()
+        self._setup()
+        return {"setup": time.perf_counter() - start}
+
+    def _setup(self) -> None:
+        """The simulated cold start, paid once"""
+        with self._lock:
+            if self._cold:
+                time.sleep(self.cold_start_ms / 1000.0)
+                self._cold = False
+
+    def _draw(self) -> tuple:
+        """Latency in seconds, the error to raise (or None) and whether to fence, drawn under one lock"""
+        if self._cold:
+            self._setup()
+        with self._lock:
+            self.calls += 1
+            latency = self.latency_ms / 1000.0
+            if self.latency_sigma > 0:
+                latency *= math.exp(self._random.gauss(0, self.latency_sigma))
+            roll = self._random.random()
+            if roll < self.error_rate:
+                error = MockLLMError("503 The model is overloaded (mock)")
+            elif roll < self.error_rate + self.rate_limit_rate:
+                error = MockLLMError("429 Resource has been exhausted (mock)")
+            else:
+                error = None
+            return latency, error, self._random.random() < self.fence_rate
+
+    def generate(
+        self,
+        prompt: str,
+        system_instruction: str = "",
+        response_schema: Optional[dict] = None,
+        max_output_tokens: Optional[int] = None,
+    ) -> str:
+        latency, error, fence = self._draw()
+        time.sleep(latency)
+        if error:
+            raise error
+        # Like Gemini's JSON mode, a response schema means no markdown around the JSON
+        return self._render(prompt, system_instruction, fence and response_schema is None, max_output_tokens)
+
+    def stream(
+        self, prompt: str, system_instruction: str = "", max_output_tokens: Optional[int] = None
+    ) -> Iterator[str]:
+        latency, error, fence = self._draw()
+        # Roughly a third of the latency before the first token, the rest spread over chunks
+        time.sleep(latency * 0.3)
+        if error:
+            raise error
+        text = self._render(prompt, system_instruction, fence, max_output_tokens)
+        size = self.stream_chunk_chars
+        chunks = [text[i:i + size] for i in range(0, len(text), size)] or [""]
+        for chunk in chunks:
+            time.sleep(latency * 0.7 / len(chunks))
+            yield chunk
+
+    def _render(self, prompt: str, system_instruction: str, fence: bool, max_output_tokens: Optional[int]) -> str:
+        text = self.respond(prompt, system_instruction)
+        text = f"```json\n{text}\n```" if fence else text
+        # Cut off at the output budget (about four characters per token), as the real API would
+        return text[:max_output_tokens * 4] if max_output_tokens else text
+
+    def respond(self, prompt: str, system_instruction: str = "") -> str:
+        """Response text for a prompt, before any fencing"""
+        full_prompt = f"{system_instruction}\n\n{prompt}"
+        for needle, response in self.responses.items():
+            if needle in full_prompt:
+                return response
+
+        query = _quoted_query(prompt)
+        if '"classification"' in system_instruction and '"schema"' in system_instruction:
+            return json.dumps({
+                "classification": _classification(query),
+                "schema": _schema(query),
+                "suggestions": _suggestions(query),
+            })
+        if '"index"' in system_instruction:
+            queries = re.findall(r'^\d+\. "(.*)"$', prompt, re.M)
+            return json.dumps([dict(index=i, **_classification(q)) for i, q in enumerate(queries, start=1)])
+        if '"suggestions"' in system_instruction:
+            # Refresh prompts list the suggestions already shown; answer with new ones
+            first = 6 if "already seen" in prompt else 1
+            return json.dumps({"suggestions": _suggestions(query, first)})
+        if '"modules"' in system_instruction:
+            return json.dumps(_schema(query))
+        if '"source_queries"' in system_instruction:
+            # Templated schemas only ask for the query-specific fields
+            schema = _schema(query)
+            return json.dumps({"title": schema["title"], "source_queries": schema["source_queries"]})
+        if '"workspace_type"' in system_instruction:
+            return json.dumps(_classification(query))
+        return json.dumps({"text": f"Mock response to: {query}"})
+
+
+def _quoted_query(prompt: str) -> str:
+    match = re.search(r'"([^"\n]*)"', prompt)
+    return match.group(1) if match else prompt.strip()[:80]
+
+
+def _classification(query: str) -> dict:
+    index = int(hashlib.md5(query.lower().encode("utf-8")).hexdigest(), 16) % len(WORKSPACE_TYPES)
+    return {"workspace_type": WORKSPACE_TYPES[index], "confidence": 0.9, "rationale": "Mock classification."}
+
+
+def _schema(query: str) -> dict:
+    return {
+        "title": f"{query.title()} Workspace",
+        "modules": [{"type": "sources_panel"}, {"type": "saved_panel"}, {"type": "suggestions_panel"}],
+        "recommended_sources": ["web", "reddit", "youtube"],
+        "source_queries": {
+            "web": [f"{query} guide"],
+            "reddit": [f"{query} tips"],
+            "youtube": [f"{query} overview"],
+        },
+    }
+
+
+def _suggestions(query: str, first: int = 1) -> List[dict]:
+    slug = re.sub(r"[^a-z0-9]+", "-", query.lower()).strip("-") or "query"
+    return [
+        {
+            "title": f"{query.title()} Resource {i}",
+            "category": "web_resource",
+            "reason": f"Mock suggestion {i} for {query}.",
+            "evidence": [
+                {"source": "web", "label": f"Guide {i}", "url": f"https://example.com/{slug}/{i}"},
+                {"source": "reddit", "label": f"Thread {i}", "url": f"https://reddit.com/r/{slug}/{i}"},
+            ],
+            "actions": ["save", "open"],
+        }
+        for i in range(first, first + 5)
+    ]
@@ -0,0 +1,251 @@
+"""
+Async LLM client for Atlas - runs blocking Gemini calls off the event loop
+"""
+
+import asyncio
+import functools
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+from model_router import ModelRouter
+from observability import LLM_RETRIES, estimate_tokens
+from rate_limiter import UpstreamLimiter, backoff_delay, is_rate_limited, retry_after
+
+
+class LLMTimeoutError(Exception):
+    """Raised when an LLM call does not finish within its timeout"""
+
+
+def _call_options(**options) -> Dict[str, Any]:
+    """Keyword arguments for the blocking call, leaving out unset ones so simple callables still work"""
+    return {name: value for name, value in options.items() if value is not None}
+
+
+class AsyncLLMClient:
+    """
+    Awaitable wrapper around a blocking `call(prompt, system_instruction)` function.
+
+    Calls run on a bounded thread pool so the uvicorn event loop keeps serving
+    other requests while Gemini is generating. At most `max_concurrency` calls
+    are in flight at once; extra callers wait their turn. `timeout` bounds how
+    long a caller waits once its call has started. The SDK call itself cannot be
+    interrupted, so a timed-out call finishes in the background and its result
+    is dropped.
+
+    `stream_call`, if given, is a blocking generator of text chunks used by
+    `stream()`; there `timeout` bounds the wait for each chunk. Streams go to
+    a single model and are not routed: a hedged duplicate would stream the
+    same text twice, and a model can't be swapped out mid-response.
+
+    With a `router`, `generate()` instead calls `model_call(model, prompt,
+    system_instruction)` on the models returned by `models()`, letting the
+    router pick the model, hedge slow calls and skip tripped ones. Hedged
+    duplicates need their own worker threads, so the pool is sized for two
+    calls per slot.
+
+    With a `limiter`, every upstream request first waits for room in the
+    shared upstream rate limits, charged with the prompt's estimated tokens
+    plus `expected_output_tokens`: each call and retry, and each failover or
+    hedge the router sends on top. Queueing for the first attempt does not
+    count against `timeout`; for the router's extra attempts it does. Calls
+    rejected with a 429 are retried up to `max_retries` times after the
+    server's retry-after, or jittered exponential backoff without one,
+    instead of moving straight on to another model. A stream is only
+    retried if the 429 came before its first chunk.
+
+    Upstream attempts beyond the first (429 retries, and the router's
+    failovers and hedges) are observed per call in LLM_RETRIES, labelled
+    with `name`.
+    """
+
+    def __init__(
+        self,
+        call: Callable[[str, str], str],
+        max_concurrency: int = 16,
+        timeout: Optional[float] = 60.0,
+        stream_call: Optional[Callable[[str, str], Iterator[str]]] = None,
+        router: Optional[ModelRouter] = None,
+        models: Optional[Callable[[], List[str]]] = None,
+        model_call: Optional[Callable[[str, str, str], str]] = None,
+        limiter: Optional[UpstreamLimiter] = None,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        expected_output_tokens: int = 512,
+        name: str = "llm",
+    ):
+        self.name = name
+        self._call = call
+        self._stream_call = stream_call
+        self.router = router if models is not None and model_call is not None else None
+        self._models = models
+        self._model_call = model_call
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.expected_output_tokens = expected_output_tokens
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        workers = max_concurrency * 2 if self.router else max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm")
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def generate(
+        self,
+        prompt: str,
+        system_instruction: str = "",
+        timeout: Optional[float] = None,
+        response_schema: Optional[dict] = None,
+        max_output_tokens: Optional[int] = None,
+    ) -> str:
+        """
+        Run one LLM call and return its text; `response_schema` and
+        `max_output_tokens` are passed on to the call
+        """
+        timeout = self.timeout if timeout is None else timeout
+        tokens = estimate_tokens(system_instruction + prompt) + (max_output_tokens or self.expected_output_tokens)
+        options = _call_options(response_schema=response_schema, max_output_tokens=max_output_tokens)
+        attempts = [0]  # upstream attempts, counted where they are made
+        try:
+            for attempt in itertools.count():
+                if self.limiter:
+                    await self.limiter.acquire(tokens)
+                try:
+                    return await self._generate_once(prompt, system_instruction, timeout, options, tokens, attempts)
+                except Exception as e:
+                    if not is_rate_limited(e) or attempt >= self.max_retries:
+                        raise
+                    await self._back_off(e, attempt)
+        finally:
+            if attempts[0]:
+                LLM_RETRIES.observe(attempts[0] - 1, backend=self.name)
+
+    async def _back_off(self, error: Exception, attempt: int) -> None:
+        """Wait before retrying a call rejected with a 429"""
+        delay = retry_after(error)
+        if delay is not None and self.limiter:
+            # The quota is shared, so everyone waits, not just this caller
+            self.limiter.pause(delay)
+        await asyncio.sleep(delay if delay is not None else backoff_delay(attempt, self.backoff_base))
+
+    async def _generate_once(
+        self,
+        prompt: str,
+        system_instruction: str,
+        timeout: Optional[float],
+        options: Dict[str, Any],
+        tokens: int,
+        attempts: List[int],
+    ) -> str:
+        loop = asyncio.get_running_loop()
+        async with self._semaphore:
+            if self.router:
+                call = self._routed(prompt, system_instruction, options, tokens, attempts)
+            else:
+                attempts[0] += 1
+                func = functools.partial(self._call, **options)
+                call = loop.run_in_executor(self._executor, func, prompt, system_instruction)
+            try:
+                return await asyncio.wait_for(call, timeout)
+            except asyncio.TimeoutError:
+                raise LLMTimeoutError(f"LLM call timed out after {timeout}s") from None
+
+    async def _routed(
+        self, prompt: str, system_instruction: str, options: Dict[str, Any], tokens: int, attempts: List[int]
+    ) -> str:
+        loop = asyncio.get_running_loop()
+        # Listing models can hit the network the first time, so keep it off the loop too
+        models = await loop.run_in_executor(self._executor, self._models)
+        launched = 0
+
+        async def admit() -> None:
+            nonlocal launched
+            launched += 1
+            if launched > 1 and self.limiter:
+                # Failovers and hedges are upstream requests too; generate() paid for the first
+                await self.limiter.acquire(tokens)
+
+        async def attempt(model: str) -> str:
+            attempts[0] += 1
+            return await loop.run_in_executor(
+                self._executor, functools.partial(self._model_call, **options), model, prompt, system_instruction
+            )
+
+        return await self.router.call(models, attempt, admit)
+
+    async def stream(
+        self,
+        prompt: str,
+        system_instruction: str = "",
+        timeout: Optional[float] = None,
+        max_output_tokens: Optional[int] = None,
+    ) -> AsyncIterator[str]:
+        """Run one LLM call and yield its text chunks as they arrive"""
+        if self._stream_call is None:
+            yield await self.generate(prompt, system_instruction, timeout, max_output_tokens=max_output_tokens)
+            return
+
+        timeout = self.timeout if timeout is None else timeout
+        tokens = estimate_tokens(system_instruction + prompt) + (max_output_tokens or self.expected_output_tokens)
+        options = _call_options(max_output_tokens=max_output_tokens)
+        for attempt in itertools.count():
+            if self.limiter:
+                await self.limiter.acquire(tokens)
+            started = False
+            try:
+                # aclosing: stop the worker thread as soon as our own consumer goes away
+                async with aclosing(self._stream_once(prompt, system_instruction, timeout, options)) as chunks:
+                    async for chunk in chunks:
+                        started = True
+                        yield chunk
+                return
+            except Exception as e:
+                # Chunks already handed out can't be taken back, so only a stream that hasn't started is retried
+                if started or not is_rate_limited(e) or attempt >= self.max_retries:
+                    raise
+                await self._back_off(e, attempt)
+
+    async def _stream_once(
+        self, prompt: str, system_instruction: str, timeout: Optional[float], options: Dict[str, Any]
+    ) -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+
+        def put(item):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                stop.set()  # Event loop already closed
+
+        def produce():
+            try:
+                for chunk in self._stream_call(prompt, system_instruction, **options):
+                    if stop.is_set():
+                        break
+                    put(("chunk", chunk))
+                put(("done", None))
+            except Exception as e:
+                put(("error", e))
+
+        async with self._semaphore:
+            loop.run_in_executor(self._executor, produce)
+            try:
+                while True:
+                    try:
+                        kind, value = await asyncio.wait_for(queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        raise LLMTimeoutError(f"LLM stream stalled for {timeout}s") from None
+                    if kind == "done":
+                        return
+                    if kind == "error":
+                        raise value
+                    yield value
+            finally:
+                # Let the worker thread stop reading if the consumer went away early
+                stop.set()
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
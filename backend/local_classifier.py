@@ -0,0 +1,246 @@
+"""
+Local query classifier for Atlas - classifies obvious queries without calling Gemini
+
+Usage:
+    cd backend
+    python local_classifier.py eval classifier_data.jsonl
+    python local_classifier.py train my_data.jsonl -o classifier_model.json
+
+Training data is JSONL with {"query": ..., "workspace_type": ...} per line.
+Set ATLAS_LOCAL_CLASSIFIER_MODEL to a trained model file to use it instead of
+training on the bundled classifier_data.jsonl at startup.
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+WORKSPACE_TYPES = ["travel_research", "purchase_research", "learning_plan", "project_planner"]
+
+DEFAULT_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "classifier_data.jsonl")
+
+# Strong signal words per workspace type. Each list is compiled into one regex,
+# and a match becomes an extra feature for the naive Bayes model.
+KEYWORDS = {
+    "travel_research": [
+        "trip", "travel", "visit", "vacation", "itinerary", "hotel", "hotels", "flight", "flights",
+        "getaway", "honeymoon", "backpacking", "destination", "destinations", "cruise", "beaches",
+    ],
+    "purchase_research": [
+        "buy", "purchase", "choose", "laptop", "product", "best .* for", "reviews?", "compare",
+        "under \\d+", "cheapest", "recommendations",
+    ],
+    "learning_plan": [
+        "learn", "learning", "study", "course", "tutorial", "curriculum", "exam", "exams",
+        "certification", "beginners", "roadmap",
+    ],
+    "project_planner": [
+        "organize", "project", "launch", "plan an?", "roadmap for", "renovat\\w*", "set up",
+        "coordinate", "manage",
+    ],
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_KEYWORD_RES = {
+    workspace_type: re.compile(r"\b(?:%s)\b" % "|".join(words))
+    for workspace_type, words in KEYWORDS.items()
+}
+
+
+def features(query: str) -> List[str]:
+    """Unigrams, bigrams and keyword-match flags for a query"""
+    text = query.lower()
+    tokens = _TOKEN_RE.findall(text)
+    feats = tokens + [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+    feats += [f"__kw_{t}" for t, pattern in _KEYWORD_RES.items() if pattern.search(text)]
+    return feats
+
+
+class NaiveBayesClassifier:
+    """
+    Multinomial naive Bayes over `features()` with temperature-scaled probabilities.
+
+    Raw naive Bayes posteriors are badly overconfident on short queries, so
+    `temperature` is fitted on held-out folds at training time; confidences
+    from `predict` are meant to be read as probabilities of being correct.
+    """
+
+    def __init__(self, alpha: float = 0.5):
+        self.alpha = alpha
+        self.temperature = 1.0
+        self.log_priors: Dict[str, float] = {}
+        self.log_likelihoods: Dict[str, Dict[str, float]] = {}
+        self.log_unseen: Dict[str, float] = {}
+
+    def fit(self, examples: Sequence[Tuple[str, str]]) -> "NaiveBayesClassifier":
+        counts: Dict[str, Counter] = defaultdict(Counter)
+        docs: Counter = Counter()
+        for query, label in examples:
+            docs[label] += 1
+            counts[label].update(features(query))
+        vocabulary = set().union(*counts.values()) if counts else set()
+        total_docs = sum(docs.values())
+
+        self.log_priors = {label: math.log(n / total_docs) for label, n in docs.items()}
+        self.log_likelihoods = {}
+        self.log_unseen = {}
+        for label, counter in counts.items():
+            denominator = sum(counter.values()) + self.alpha * (len(vocabulary) + 1)
+            self.log_likelihoods[label] = {
+                feat: math.log((n + self.alpha) / denominator) for feat, n in counter.items()
+            }
+            self.log_unseen[label] = math.log(self.alpha / denominator)
+        return self
+
+    def _scores(self, query: str) -> Dict[str, float]:
+        feats = features(query)
+        return {
+            label: prior + sum(
+                self.log_likelihoods[label].get(f, self.log_unseen[label]) for f in feats
+            )
+            for label, prior in self.log_priors.items()
+        }
+
+    def probabilities(self, query: str) -> Dict[str, float]:
+        scores = self._scores(query)
+        top = max(scores.values())
+        exps = {label: math.exp((s - top) / self.temperature) for label, s in scores.items()}
+        total = sum(exps.values())
+        return {label: e / total for label, e in exps.items()}
+
+    def predict(self, query: str) -> Tuple[str, float]:
+        """Most likely workspace type and its calibrated confidence"""
+        probs = self.probabilities(query)
+        label = max(probs, key=probs.get)
+        return label, probs[label]
+
+    def calibrate(self, examples: Sequence[Tuple[str, str]], folds: int = 5, seed: int = 0) -> float:
+        """Fit the temperature that minimizes held-out log loss; returns it"""
+        examples = list(examples)
+        random.Random(seed).shuffle(examples)
+        held_out: List[Tuple[Dict[str, float], str]] = []
+        for k in range(folds):
+            train = [e for i, e in enumerate(examples) if i % folds != k]
+            test = [e for i, e in enumerate(examples) if i % folds == k]
+            model = NaiveBayesClassifier(self.alpha).fit(train)
+            held_out += [(model._scores(q), label) for q, label in test]
+
+        def log_loss(temperature: float) -> float:
+            loss = 0.0
+            for scores, label in held_out:
+                top = max(scores.values())
+                total = sum(math.exp((s - top) / temperature) for s in scores.values())
+                own = math.exp((scores.get(label, top - 1e6) - top) / temperature)
+                loss -= math.log(max(own / total, 1e-12))
+            return loss
+
+        candidates = [0.5 * 1.15 ** i for i in range(40)]
+        self.temperature = min(candidates, key=log_loss)
+        return self.temperature
+
+    def to_dict(self) -> dict:
+        return {
+            "alpha": self.alpha,
+            "temperature": self.temperature,
+            "log_priors": self.log_priors,
+            "log_likelihoods": self.log_likelihoods,
+            "log_unseen": self.log_unseen,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "NaiveBayesClassifier":
+        model = cls(data["alpha"])
+        model.temperature = data["temperature"]
+        model.log_priors = data["log_priors"]
+        model.log_likelihoods = data["log_likelihoods"]
+        model.log_unseen = data["log_unseen"]
+        return model
+
+
+def load_examples(path: str) -> List[Tuple[str, str]]:
+    examples = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                examples.append((row["query"], row["workspace_type"]))
+    return examples
+
+
+def train(examples: Sequence[Tuple[str, str]]) -> NaiveBayesClassifier:
+    model = NaiveBayesClassifier()
+    model.calibrate(examples)
+    return model.fit(examples)
+
+
+def load_default_model() -> NaiveBayesClassifier:
+    """Trained model from ATLAS_LOCAL_CLASSIFIER_MODEL, or one trained on the bundled data"""
+    model_path = os.getenv("ATLAS_LOCAL_CLASSIFIER_MODEL")
+    if model_path:
+        with open(model_path, encoding="utf-8") as f:
+            return NaiveBayesClassifier.from_dict(json.load(f))
+    return train(load_examples(DEFAULT_DATA_PATH))
+
+
+def evaluate(
+    examples: Sequence[Tuple[str, str]],
+    thresholds: Iterable[float] = (0.7, 0.8, 0.9, 0.95),
+    folds: int = 5,
+) -> dict:
+    """Cross-validated accuracy, calibration error and per-threshold coverage/accuracy"""
+    examples = list(examples)
+    random.Random(0).shuffle(examples)
+    predictions: List[Tuple[str, float, str]] = []
+    for k in range(folds):
+        train_set = [e for i, e in enumerate(examples) if i % folds != k]
+        model = train(train_set)
+        for i, (query, label) in enumerate(examples):
+            if i % folds == k:
+                predicted, confidence = model.predict(query)
+                predictions.append((predicted, confidence, label))
+
+    total = len(predictions)
+    correct = sum(p == label for p, _, label in predictions)
+
+    # Expected calibration error over 10 confidence bins
+    bins: Dict[int, List[Tuple[float, bool]]] = defaultdict(list)
+    for predicted, confidence, label in predictions:
+        bins[min(int(confidence * 10), 9)].append((confidence, predicted == label))
+    ece = sum(
+        len(b) / total * abs(sum(c for c, _ in b) / len(b) - sum(ok for _, ok in b) / len(b))
+        for b in bins.values()
+    )
+
+    by_threshold = {}
+    for threshold in thresholds:
+        confident = [(p, label) for p, c, label in predictions if c >= threshold]
+        by_threshold[threshold] = {
+            "coverage": len(confident) / total,
+            "accuracy": sum(p == label for p, label in confident) / len(confident) if confident else None,
+        }
+    return {"examples": total, "accuracy": correct / total, "ece": ece, "thresholds": by_threshold}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train or evaluate the local query classifier")
+    sub = parser.add_subparsers(dest="command", required=True)
+    train_cmd = sub.add_parser("train", help="Train a model and write it as JSON")
+    train_cmd.add_argument("data", help="JSONL training data")
+    train_cmd.add_argument("-o", "--output", default="classifier_model.json")
+    eval_cmd = sub.add_parser("eval", help="Cross-validate on labelled data")
+    eval_cmd.add_argument("data", help="JSONL labelled data")
+    args = parser.parse_args()
+
+    data = load_examples(args.data)
+    if args.command == "train":
+        trained = train(data)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(trained.to_dict(), f)
+        print(f"Trained on {len(data)} examples (temperature {trained.temperature:.2f}) -> {args.output}")
+    else:
+        print(json.dumps(evaluate(data), indent=2))
@@ -2,28 +2,133 @@
 Atlas Backend - FastAPI server for workspace generation and AI orchestration
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional, List, Dict
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+from typing import Annotated, Any, AsyncIterator, Optional, List, Dict, Iterator, Tuple
+import asyncio
+import logging
 import os
+import threading
 import json
-import google.generativeai as genai
+import time
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
+from batch import run_batch
+from gemini_sdk import GeminiSDK
+from evidence import EvidenceIndex, LinkChecker, dedupe_evidence
+from llm_backends import LLMBackend, MockLLMBackend
+from llm_client import AsyncLLMClient, LLMTimeoutError
+from local_classifier import load_default_model as load_local_classifier
+from model_resolver import ModelResolver
+from model_router import ModelRouter
+from observability import (
+    LLM_ATTEMPTS, NEAR_DUP_LOOKUPS, PARSE_DURATION, PROMPT_CALL_DURATION, REGISTRY, STAGE_RESULTS,
+    configure_logging, fields, observe_llm_call, should_log_prompt, timed_stage,
+)
+from prompts import COMPACT, PromptRegistry, PromptTemplate
+from query_index import NearDuplicateIndex
+from rate_limiter import RateLimitExceeded, UpstreamLimiter, is_rate_limited, retry_after
+from result_cache import ResultCache, content_hash, normalize_query
+from saved_items import SavedItemStore, saved_item_id
+from schema_templates import SCHEMA_TEMPLATES, TEMPLATES_VERSION, SchemaTemplate, default_template, template_for
+from source_fetch import create_source_pipeline
+from singleflight import AsyncSingleFlight, SingleFlight
+from stages import StageGraph
+from workspace_store import WorkspaceStore, workspace_id
+from structured_output import gemini_schema, generation_config, parse_json_model
+from streaming_json import StreamingArrayParser
 
 load_dotenv()
 
+configure_logging(os.getenv("ATLAS_LOG_LEVEL", "INFO"), os.getenv("ATLAS_LOG_FORMAT", "json"))
+logger = logging.getLogger("atlas")
+# Fraction of LLM calls whose full prompts are logged (all of them at ATLAS_LOG_LEVEL=DEBUG)
+PROMPT_LOG_SAMPLE_RATE = float(os.getenv("ATLAS_LOG_PROMPT_SAMPLE_RATE", "0"))
+
 # Initialize Gemini API
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 # Support both GEMINI_MODEL and AI_MODEL env vars
 GEMINI_MODEL = os.getenv("GEMINI_MODEL") or os.getenv("AI_MODEL") or "gemini-pro"
 if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-    print(f"Gemini API configured. Model: {GEMINI_MODEL}")
+    logger.info("Gemini API configured", extra=fields(model=GEMINI_MODEL))
 else:
-    print("Warning: GEMINI_API_KEY not found in environment variables")
+    logger.warning("GEMINI_API_KEY not found in environment variables")
+# google.generativeai is imported on first use (or by the startup warm-up), not here
+gemini_sdk = GeminiSDK(GEMINI_API_KEY)
+
+# Warm-up before serving: "blocking" (default) finishes it before the worker
+# accepts requests, "background" serves right away and reports ready later, "off" skips it
+WARMUP_MODE = os.getenv("ATLAS_WARMUP", "blocking").lower()
+WARMUP_TIMEOUT = float(os.getenv("ATLAS_WARMUP_TIMEOUT", "20"))
+warmup_state: Dict[str, Any] = {"ready": WARMUP_MODE == "off", "mode": WARMUP_MODE, "steps_ms": {}}
+
+
+def _run_in_daemon_thread(func) -> "asyncio.Future":
+    """
+    Run a blocking call on its own daemon thread. Unlike an executor thread,
+    a call stuck on the network there (warm-up without connectivity) can't
+    hold up interpreter exit.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def settle(method, value):
+        if not future.done():
+            method(value)
+
+    def run():
+        try:
+            result = func()
+        except Exception as e:
+            outcome = (future.set_exception, e)
+        else:
+            outcome = (future.set_result, result)
+        try:
+            loop.call_soon_threadsafe(settle, *outcome)
+        except RuntimeError:
+            pass  # Event loop already closed
+
+    threading.Thread(target=run, name="warm-up", daemon=True).start()
+    return future
 
-app = FastAPI(title="Atlas API", version="0.1.0")
+
+async def warm_up() -> None:
+    """Run the LLM backend's warm-up off the event loop; readiness is reported even if it fails"""
+    start = time.perf_counter()
+    try:
+        steps = await asyncio.wait_for(_run_in_daemon_thread(llm_backend.warm_up), WARMUP_TIMEOUT)
+        warmup_state["steps_ms"] = {step: round(seconds * 1000, 1) for step, seconds in steps.items()}
+    except Exception as e:
+        logger.warning(f"Warm-up failed: {e}")
+        warmup_state["error"] = str(e) or type(e).__name__
+    warmup_state["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    warmup_state["ready"] = True
+    logger.info("Warm-up finished", extra=fields(**{k: v for k, v in warmup_state.items() if k != "ready"}))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warmup_task = None
+    if query_index is not None and NEAR_DUP_SEED:
+        threading.Thread(target=seed_query_index, name="near-dup-seed", daemon=True).start()
+    if WARMUP_MODE == "blocking":
+        await warm_up()
+    elif WARMUP_MODE == "background":
+        warmup_task = asyncio.create_task(warm_up())
+    yield
+    if warmup_task:
+        warmup_task.cancel()
+    llm_client.shutdown()
+    workspace_store.close()
+    saved_item_store.close()
+    await source_pipeline.aclose()
+    if link_checker:
+        await link_checker.aclose()
+
+
+app = FastAPI(title="Atlas API", version="0.1.0", lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -40,6 +145,12 @@ class WorkspaceCreateRequest(BaseModel):
     query: str
 
 
+class BatchCreateRequest(BaseModel):
+    queries: List[str]
+    concurrency: int = 8
+    per_minute: Optional[float] = None
+
+
 class WorkspaceType(BaseModel):
     workspace_type: str
     confidence: float
@@ -59,10 +170,16 @@ class SourceQueries(BaseModel):
 
 
 class WorkspaceSchema(BaseModel):
-    title: str
-    modules: List[Module]
-    recommended_sources: List[str]
-    source_queries: SourceQueries
+    title: str = ""
+    modules: List[Module] = []
+    recommended_sources: List[str] = ["web"]
+    source_queries: SourceQueries = SourceQueries()
+
+
+class SchemaFields(BaseModel):
+    """The query-specific part of a templated schema, which is all the LLM writes"""
+    title: str = ""
+    source_queries: SourceQueries = SourceQueries()
 
 
 class Evidence(BaseModel):
@@ -72,17 +189,92 @@ class Evidence(BaseModel):
 
 
 class Suggestion(BaseModel):
-    title: str
-    category: str
-    reason: str
-    evidence: List[Evidence]
-    actions: List[str]
+    title: str = "Untitled"
+    category: str = "general"
+    reason: str = ""
+    evidence: List[Evidence] = []
+    actions: List[str] = ["save", "open"]
 
 
 class SuggestionsResponse(BaseModel):
+    suggestions: List[Suggestion] = []
+
+
+class WorkspaceResponse(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    id: str
+    query: str
+    workspace_type: str
+    # "schema" would shadow BaseModel.schema(), so it is only the JSON name
+    workspace_schema: WorkspaceSchema = Field(alias="schema")
+    suggestions: List[Suggestion]
+    enabled_sources: List[str]
+    saved_items: List[dict] = []
+    # Some stage fell back to a placeholder; stored so the ID resolves, but never cached or reused
+    degraded: bool = False
+
+
+class SavedItem(BaseModel):
+    type: str
+    title: str
+    notes: Optional[str] = None
+    links: List[str] = []
+    tags: List[str] = []
+
+
+class StoredSavedItem(SavedItem):
+    id: str
+    workspace_id: str
+
+
+class SavedItemResult(BaseModel):
+    item: StoredSavedItem
+    score: float
+
+
+class WorkspaceRefreshRequest(BaseModel):
+    enabled_sources: Optional[List[str]] = None
+    workspace_type: Optional[str] = None
+    more_suggestions: bool = False
+
+
+class WorkspaceDelta(BaseModel):
+    id: str
+    workspace_type: str
+    enabled_sources: List[str]
+    regenerated: List[str]
+    added_suggestions: List[Suggestion] = []
+    removed_suggestions: List[str] = []
+    added_modules: List[Module] = []
+    removed_modules: List[str] = []
+
+
+class SourceFetchRequest(BaseModel):
+    sources: Optional[List[str]] = None
+
+
+class BatchClassification(WorkspaceType):
+    index: int
+
+
+class FusedResponse(BaseModel):
+    classification: WorkspaceType
+    workspace_schema: WorkspaceSchema = Field(alias="schema")
     suggestions: List[Suggestion]
 
 
+# response_schema constraints per LLM call, used when the SDK supports JSON mode
+RESPONSE_SCHEMAS = {
+    "classify": gemini_schema(WorkspaceType),
+    "schema": gemini_schema(WorkspaceSchema),
+    "schema_fields": gemini_schema(SchemaFields),
+    "suggestions": gemini_schema(SuggestionsResponse),
+    "fused": gemini_schema(FusedResponse),
+    "classify_batch": gemini_schema(List[BatchClassification]),
+}
+
+
 # API Endpoints
 
 @app.get("/")
@@ -90,13 +282,60 @@ def root():
     return {"message": "Atlas API is running"}
 
 
+@app.get("/api/ready")
+def readiness():
+    """Readiness probe: 503 until the startup warm-up has finished"""
+    body = dict(warmup_state, sdk_loaded=gemini_sdk.loaded)
+    if gemini_sdk.import_seconds is not None:
+        body["sdk_import_ms"] = round(gemini_sdk.import_seconds * 1000, 1)
+    return JSONResponse(body, status_code=200 if warmup_state["ready"] else 503)
+
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics: stage and LLM call latency, token counts, retries and cache outcomes"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/cache/stats")
+def cache_stats():
+    """Hit/miss counters for the stage result cache and in-flight coalescing"""
+    stats = result_cache.stats()
+    stats["coalesced_calls"] = stage_flight.shared
+    stats["saved_items"] = saved_item_store.stats()
+    if link_checker:
+        stats["link_checks"] = link_checker.stats()
+    if query_index is not None:
+        stats["near_duplicates"] = query_index.stats()
+    return stats
+
+
+@app.get("/api/prompts")
+def list_prompts():
+    """Registered prompt templates: version hash, size in (estimated) tokens and output budget per stage and variant"""
+    return {
+        "compact_fraction": prompt_registry.compact_fraction,
+        "force_variant": prompt_registry.force_variant,
+        "prompts": prompt_registry.describe(),
+        "schema_templates": [t.describe() for t in SCHEMA_TEMPLATES.values()] if TEMPLATED_SCHEMAS else [],
+    }
+
+
+@app.get("/api/router/stats")
+def router_stats():
+    """Per-model EWMA latency, error rate, p95 and circuit-breaker state, plus hedge and rate-limit counts"""
+    stats = model_router.snapshot()
+    stats["upstream"] = upstream_limiter.stats()
+    return stats
+
+
 @app.get("/api/models")
 def list_models():
     """List available Gemini models"""
     try:
         if not GEMINI_API_KEY:
             return {"error": "Gemini API key not configured"}
-        models = genai.list_models()
+        models = gemini_sdk.list_models()
         available_models = []
         for model in models:
             if "generateContent" in model.supported_generation_methods:
@@ -110,108 +349,521 @@ def list_models():
             "model_names": [m["name"] for m in available_models]
         }
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error listing models")
         return {"error": str(e)}
 
 
 def get_available_models():
     """Get list of available model names"""
+    # Concurrent discovery calls (e.g. several requests on a cold worker) share one list_models()
+    return discovery_flight.do("list_models", _fetch_available_models)
+
+
+def _fetch_available_models():
     try:
         if not GEMINI_API_KEY:
             return []
-        models = genai.list_models()
+        models = gemini_sdk.list_models()
         return [
             model.name.split("/")[-1]  # Extract just the model name part
             for model in models
             if "generateContent" in model.supported_generation_methods
         ]
     except Exception as e:
-        print(f"Error listing models: {e}")
+        logger.warning(f"Error listing models: {e}")
         return []
 
 
-def call_gemini(prompt: str, system_instruction: str = "") -> str:
-    """Helper function to call Gemini API"""
-    if not GEMINI_API_KEY:
-        raise HTTPException(status_code=500, detail="Gemini API key not configured")
-    
-    # Get available models first
-    available_models = get_available_models()
-    print(f"Available models: {available_models}")
-    
-    # Map user-friendly names to actual API model names
-    model_name_mapping = {
-        "gemini-2.5-flash": "gemini-1.5-flash",  # Try flash if 2.5 doesn't exist
-        "gemini-flash": "gemini-1.5-flash",
-        "gemini-2.0-flash": "gemini-1.5-flash",
-    }
-    
-    # Get the actual model name to try
-    model_to_try = model_name_mapping.get(GEMINI_MODEL.lower(), GEMINI_MODEL)
-    
-    # Build list of models to try, prioritizing available ones
-    model_names_to_try = []
-    
-    # First, try models that are actually available
-    if available_models:
-        # Try available models first
-        for avail_model in available_models:
-            if avail_model not in model_names_to_try:
-                model_names_to_try.append(avail_model)
-    
-    # Then try common fallbacks
-    fallback_models = [
-        model_to_try,
+discovery_flight = SingleFlight()
+
+
+# Map user-friendly names to actual API model names
+MODEL_NAME_MAPPING = {
+    "gemini-2.5-flash": "gemini-1.5-flash",  # Try flash if 2.5 doesn't exist
+    "gemini-flash": "gemini-1.5-flash",
+    "gemini-2.0-flash": "gemini-1.5-flash",
+}
+
+# Discovered models are cached and the last model that worked is tried first,
+# so call_gemini doesn't hit genai.list_models() on every request
+model_resolver = ModelResolver(
+    list_models=get_available_models,
+    fallback_models=[
+        MODEL_NAME_MAPPING.get(GEMINI_MODEL.lower(), GEMINI_MODEL),
         "gemini-1.5-flash",
         "gemini-1.5-pro",
         "gemini-pro",
         "gemini-1.0-pro",
-    ]
+    ],
+    ttl=float(os.getenv("GEMINI_MODEL_CACHE_TTL", "600")),
+    failure_cooldown=float(os.getenv("GEMINI_MODEL_FAILURE_COOLDOWN", "30")),
+)
+
+
+class GeminiBackend(LLMBackend):
+    """The real backend: Gemini via google.generativeai, with model fallback"""
+    
+    name = "gemini"
+    
+    @property
+    def model_id(self) -> str:
+        return GEMINI_MODEL
     
-    for fb_model in fallback_models:
-        if fb_model not in model_names_to_try:
-            model_names_to_try.append(fb_model)
+    def models(self) -> List[str]:
+        return model_resolver.candidates()
     
-    last_error = None
-    for model_name in model_names_to_try:
+    def warm_up(self) -> Dict[str, float]:
+        """Import the SDK, resolve the model list, build the likeliest models and connect upstream"""
+        steps = {}
+        start = time.perf_counter()
+        gemini_sdk.genai
+        steps["sdk_import"] = time.perf_counter() - start
+        if not GEMINI_API_KEY:
+            return steps
+        start = time.perf_counter()
+        candidates = model_resolver.candidates()
+        steps["model_discovery"] = time.perf_counter() - start
+        start = time.perf_counter()
+        # The router may hedge onto the runner-up, so build that one too
+        for model_name in candidates[:2]:
+            gemini_sdk.model(model_name)
+        steps["model_build"] = time.perf_counter() - start
+        start = time.perf_counter()
+        gemini_sdk.connect(candidates[0])
+        steps["connect"] = time.perf_counter() - start
+        return steps
+    
+    def generate_with_model(
+        self,
+        model_name: str,
+        prompt: str,
+        system_instruction: str = "",
+        response_schema: Optional[dict] = None,
+        max_output_tokens: Optional[int] = None,
+    ) -> str:
+        """One Gemini call on one model; records the outcome with the model resolver"""
+        if not GEMINI_API_KEY:
+            raise HTTPException(status_code=500, detail="Gemini API key not configured")
+        
         try:
-            print(f"Trying Gemini model: {model_name}")
-            model = genai.GenerativeModel(model_name)
+            logger.debug(f"Trying Gemini model: {model_name}")
+            model = gemini_sdk.model(model_name)
             full_prompt = f"{system_instruction}\n\n{prompt}" if system_instruction else prompt
-            print(f"\n=== PROMPT SENT TO AI ===")
-            print(f"System Instruction:\n{system_instruction}\n")
-            print(f"User Prompt:\n{prompt}\n")
-            print(f"Full Prompt:\n{full_prompt}\n")
-            print("=" * 50)
-            response = model.generate_content(full_prompt)
-            print(f"Successfully used model: {model_name}")
-            return response.text
+            config = generation_config(gemini_sdk.GenerationConfig, response_schema, max_output_tokens)
+            if config is not None:
+                response = model.generate_content(full_prompt, generation_config=config)
+            else:
+                response = model.generate_content(full_prompt)
+            text = response.text
         except Exception as e:
-            print(f"Model {model_name} failed: {e}")
-            last_error = e
-            continue
+            logger.warning(f"Model {model_name} failed: {e}", extra=fields(model=model_name))
+            if is_rate_limited(e):
+                # Quota errors are retried with backoff by the client, not held against the model
+                LLM_ATTEMPTS.inc(model=model_name, outcome="rate_limited")
+                raise
+            model_resolver.record_failure(model_name)
+            LLM_ATTEMPTS.inc(model=model_name, outcome="error")
+            raise
+        model_resolver.record_success(model_name)
+        LLM_ATTEMPTS.inc(model=model_name, outcome="ok")
+        return text
     
-    # If all models failed, provide helpful error message
-    error_msg = f"Error calling Gemini API: {str(last_error)}"
-    if available_models:
-        error_msg += f"\nAvailable models: {', '.join(available_models)}"
-    else:
-        error_msg += "\nNo models found. Check your API key and permissions."
-    
-    print(f"All model attempts failed. Last error: {last_error}")
-    import traceback
-    traceback.print_exc()
-    raise HTTPException(status_code=500, detail=error_msg)
+    def generate(
+        self,
+        prompt: str,
+        system_instruction: str = "",
+        response_schema: Optional[dict] = None,
+        max_output_tokens: Optional[int] = None,
+    ) -> str:
+        """Call Gemini, falling back across models"""
+        if not GEMINI_API_KEY:
+            raise HTTPException(status_code=500, detail="Gemini API key not configured")
+        
+        model_names_to_try = self.models()
+        
+        last_error = None
+        for attempt, model_name in enumerate(model_names_to_try):
+            try:
+                text = self.generate_with_model(
+                    model_name, prompt, system_instruction, response_schema, max_output_tokens
+                )
+                logger.debug(f"Successfully used model: {model_name}", extra=fields(retries=attempt))
+                return text
+            except Exception as e:
+                if is_rate_limited(e):
+                    raise
+                last_error = e
+                continue
+        
+        # If all models failed, provide helpful error message
+        available_models = model_resolver.available_models()
+        error_msg = f"Error calling Gemini API: {str(last_error)}"
+        if available_models:
+            error_msg += f"\nAvailable models: {', '.join(available_models)}"
+        else:
+            error_msg += "\nNo models found. Check your API key and permissions."
+        
+        logger.error(f"All model attempts failed. Last error: {last_error}")
+        raise HTTPException(status_code=500, detail=error_msg)
 
+    def stream(
+        self, prompt: str, system_instruction: str = "", max_output_tokens: Optional[int] = None
+    ) -> Iterator[str]:
+        """Like generate, but yields the response text in chunks as Gemini generates it"""
+        if not GEMINI_API_KEY:
+            raise HTTPException(status_code=500, detail="Gemini API key not configured")
+        
+        full_prompt = f"{system_instruction}\n\n{prompt}" if system_instruction else prompt
+        config = generation_config(gemini_sdk.GenerationConfig, max_output_tokens=max_output_tokens)
+        last_error = None
+        for model_name in model_resolver.candidates():
+            try:
+                logger.debug(f"Streaming from Gemini model: {model_name}")
+                model = gemini_sdk.model(model_name)
+                chunks = iter(model.generate_content(full_prompt, stream=True, generation_config=config))
+                # Only fall back to another model before anything has been yielded
+                first = next(chunks, None)
+            except Exception as e:
+                logger.warning(f"Model {model_name} failed: {e}", extra=fields(model=model_name))
+                model_resolver.record_failure(model_name)
+                LLM_ATTEMPTS.inc(model=model_name, outcome="error")
+                last_error = e
+                continue
+            model_resolver.record_success(model_name)
+            LLM_ATTEMPTS.inc(model=model_name, outcome="ok")
+            if first is not None:
+                yield first.text
+            for chunk in chunks:
+                yield chunk.text
+            return
+        
+        logger.error(f"All model attempts failed. Last error: {last_error}")
+        raise HTTPException(status_code=500, detail=f"Error calling Gemini API: {str(last_error)}")
 
-@app.post("/api/workspace/classify", response_model=WorkspaceType)
-async def classify_query(request: WorkspaceCreateRequest):
+
+def create_llm_backend() -> LLMBackend:
+    """Backend selected by ATLAS_LLM_BACKEND: "gemini" (default) or "mock" for offline runs"""
+    backend_name = os.getenv("ATLAS_LLM_BACKEND", "gemini").lower()
+    if backend_name == "mock":
+        logger.info("Using mock LLM backend")
+        return MockLLMBackend.from_env()
+    return GeminiBackend()
+
+
+llm_backend = create_llm_backend()
+
+# Whether stages call the LLM at all, or use their local fallbacks
+LLM_ENABLED = llm_backend.name != "gemini" or bool(GEMINI_API_KEY)
+
+
+def _log_prompt(prompt: str, system_instruction: str) -> None:
+    if should_log_prompt(logger, PROMPT_LOG_SAMPLE_RATE):
+        logger.info(
+            "Prompt sent to LLM",
+            extra=fields(backend=llm_backend.name, system_instruction=system_instruction, user_prompt=prompt),
+        )
+
+
+def call_gemini(
+    prompt: str,
+    system_instruction: str = "",
+    response_schema: Optional[dict] = None,
+    max_output_tokens: Optional[int] = None,
+) -> str:
+    """Helper function to call the configured LLM backend (Gemini unless ATLAS_LLM_BACKEND is set)"""
+    _log_prompt(prompt, system_instruction)
+    full_prompt = f"{system_instruction}\n\n{prompt}"
+    start = time.perf_counter()
+    try:
+        text = llm_backend.generate(prompt, system_instruction, response_schema, max_output_tokens)
+    except Exception:
+        observe_llm_call(llm_backend.name, time.perf_counter() - start, full_prompt, None, outcome="error")
+        raise
+    observe_llm_call(llm_backend.name, time.perf_counter() - start, full_prompt, text)
+    return text
+
+
+def call_gemini_model(
+    model: str,
+    prompt: str,
+    system_instruction: str = "",
+    response_schema: Optional[dict] = None,
+    max_output_tokens: Optional[int] = None,
+) -> str:
+    """Like call_gemini, but a single attempt on one model; used by the model router"""
+    _log_prompt(prompt, system_instruction)
+    full_prompt = f"{system_instruction}\n\n{prompt}"
+    start = time.perf_counter()
+    try:
+        text = llm_backend.generate_with_model(model, prompt, system_instruction, response_schema, max_output_tokens)
+    except Exception:
+        observe_llm_call(llm_backend.name, time.perf_counter() - start, full_prompt, None, outcome="error")
+        raise
+    observe_llm_call(llm_backend.name, time.perf_counter() - start, full_prompt, text)
+    return text
+
+
+def call_gemini_stream(
+    prompt: str, system_instruction: str = "", max_output_tokens: Optional[int] = None
+) -> Iterator[str]:
+    """Like call_gemini, but yields the response text in chunks as it is generated"""
+    _log_prompt(prompt, system_instruction)
+    full_prompt = f"{system_instruction}\n\n{prompt}"
+    start = time.perf_counter()
+    parts: List[str] = []
+    try:
+        for chunk in llm_backend.stream(prompt, system_instruction, max_output_tokens):
+            parts.append(chunk)
+            yield chunk
+    except Exception:
+        observe_llm_call(llm_backend.name, time.perf_counter() - start, full_prompt, None, outcome="error")
+        raise
+    observe_llm_call(llm_backend.name, time.perf_counter() - start, full_prompt, "".join(parts))
+
+
+# Sends each call to the model with the best recent latency and error rate,
+# hedges calls that run past the model's p95 and stops using failing models
+model_router = ModelRouter(
+    breaker_threshold=int(os.getenv("ATLAS_ROUTER_BREAKER_THRESHOLD", "5")),
+    breaker_cooldown=float(os.getenv("ATLAS_ROUTER_BREAKER_COOLDOWN", "30")),
+    hedging=os.getenv("ATLAS_ROUTER_HEDGING", "true").lower() in ("1", "true", "yes"),
+    default_hedge_delay=float(os.getenv("ATLAS_ROUTER_HEDGE_DELAY", "5")),
+    min_hedge_delay=float(os.getenv("ATLAS_ROUTER_MIN_HEDGE_DELAY", "0.5")),
+    passthrough=lambda error: isinstance(error, RateLimitExceeded) or is_rate_limited(error),
+)
+ROUTER_ENABLED = os.getenv("ATLAS_ROUTER", "true").lower() in ("1", "true", "yes")
+
+def _optional_float(name: str) -> Optional[float]:
+    value = os.getenv(name)
+    return float(value) if value else None
+
+
+# Upstream quota shared by every stage; batch work queues behind interactive requests
+upstream_limiter = UpstreamLimiter(
+    requests_per_minute=_optional_float("ATLAS_LLM_REQUESTS_PER_MINUTE"),
+    tokens_per_minute=_optional_float("ATLAS_LLM_TOKENS_PER_MINUTE"),
+    max_queue=int(os.getenv("ATLAS_LLM_MAX_QUEUE", "256")),
+)
+
+# Endpoints await this instead of calling call_gemini directly, so a slow
+# generation doesn't block the event loop for every other request
+llm_client = AsyncLLMClient(
+    call_gemini,
+    max_concurrency=int(os.getenv("ATLAS_LLM_MAX_CONCURRENCY", "16")),
+    timeout=float(os.getenv("ATLAS_LLM_TIMEOUT", "60")),
+    stream_call=call_gemini_stream,
+    router=model_router if ROUTER_ENABLED else None,
+    models=llm_backend.models,
+    model_call=call_gemini_model,
+    limiter=upstream_limiter,
+    max_retries=int(os.getenv("ATLAS_LLM_MAX_RETRIES", "3")),
+    name=llm_backend.name,
+)
+
+
+def admit_llm_request() -> None:
+    """Dependency for LLM-backed endpoints: reject with 429 up front when the upstream queue is full"""
+    if LLM_ENABLED:
+        upstream_limiter.check_admission()
+
+
+@app.exception_handler(RateLimitExceeded)
+async def rate_limit_exceeded(request: Request, exc: RateLimitExceeded):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(int(exc.retry_after + 0.999))},
+    )
+
+
+@app.exception_handler(LLMTimeoutError)
+async def llm_timeout(request: Request, exc: LLMTimeoutError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(int(upstream_limiter.retry_after() + 0.999))},
+    )
+
+
+def raise_if_overloaded(error: Exception) -> None:
     """
-    Classify the user query into a workspace type using Gemini API.
+    Stage handlers call this before falling back to a placeholder result: an
+    overloaded upstream should fail the request fast (429 for a full queue or
+    exhausted quota, 503 for a timed-out call, both with Retry-After) rather
+    than answer 200 with a degraded workspace
+    """
+    if isinstance(error, (RateLimitExceeded, LLMTimeoutError)):
+        raise error
+    if is_rate_limited(error):
+        delay = retry_after(error)
+        raise RateLimitExceeded(
+            f"Upstream rate limit: {error}", delay if delay is not None else upstream_limiter.retry_after()
+        ) from error
+
+
+# Start schema/suggestions from the local classifier's guess instead of
+# waiting for the LLM classification (re-run if the LLM disagrees)
+SPECULATIVE_STAGES = os.getenv("ATLAS_SPECULATIVE_STAGES", "false").lower() in ("1", "true", "yes")
+
+# Stage results keyed on normalized query, model and prompt version. Set
+# ATLAS_CACHE_DB to a file path to persist them and share them across workers
+result_cache = ResultCache(
+    max_entries=int(os.getenv("ATLAS_CACHE_MAX_ENTRIES", "1024")),
+    ttl=float(os.getenv("ATLAS_CACHE_TTL", "3600")),
+    db_path=os.getenv("ATLAS_CACHE_DB") or None,
+)
+
+
+# Every created workspace, so /workspace/[id] can reopen it without regenerating.
+# Set ATLAS_WORKSPACE_DB to an empty value to keep them in memory only
+workspace_store = WorkspaceStore(
+    db_path=os.getenv("ATLAS_WORKSPACE_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "workspaces.db"))
+    or None,
+    max_entries=int(os.getenv("ATLAS_WORKSPACE_CACHE_ENTRIES", "4096")),
+)
+
+
+# Items saved from workspaces, full-text indexed for /api/items/search; kept in
+# the workspace store's SQLite file when there is one
+saved_item_store = SavedItemStore(db_path=workspace_store.db_path)
+
+
+# Paraphrases of an earlier query ("budget trips in japan" after "budget trip to
+# japan") reuse its classification and schema; only suggestions are regenerated.
+# ATLAS_NEAR_DUP_THRESHOLD is the estimated Jaccard similarity of their word,
+# bigram and trigram shingles needed to match, and ATLAS_NEAR_DUP=false turns matching off
+query_index = (
+    NearDuplicateIndex(threshold=float(os.getenv("ATLAS_NEAR_DUP_THRESHOLD", "0.8")))
+    if os.getenv("ATLAS_NEAR_DUP", "true").lower() in ("1", "true", "yes")
+    else None
+)
+# How many of the most recent stored workspaces are indexed at startup
+NEAR_DUP_SEED = int(os.getenv("ATLAS_NEAR_DUP_SEED", "10000"))
+
+
+def seed_query_index() -> None:
+    """Index stored workspaces' queries (runs on a background thread at startup)"""
+    start = time.perf_counter()
+    for row in workspace_store.list(limit=NEAR_DUP_SEED):
+        query_index.add(row["id"], row["query"], row["workspace_type"])
+    logger.info(
+        "Near-duplicate index seeded",
+        extra=fields(entries=len(query_index), elapsed_ms=round((time.perf_counter() - start) * 1000, 1)),
+    )
+
+
+def find_near_duplicate(request: WorkspaceCreateRequest) -> Optional[Tuple[WorkspaceType, WorkspaceSchema]]:
     """
-    # CUSTOMIZE THIS PROMPT: Edit the system_prompt to change how classification works
-    system_prompt = """You are a query classifier for a research workspace application called Atlas. 
+    Classification and schema of a stored workspace whose query is a near
+    duplicate of this one. Matches are looked up under the local classifier's
+    guess, so they only count when it agrees with the stored workspace type.
+    Both are cached as this query's own classify and schema results.
+    """
+    if query_index is None:
+        return None
+    guess = local_classify(request.query)
+    match = query_index.lookup(request.query, guess.workspace_type)
+    body = workspace_store.get(match.key) if match else None
+    stored = WorkspaceResponse.model_validate_json(body) if body else None
+    if stored is not None and stored.degraded:
+        stored = None  # Regenerated since it was indexed, and its schema may be a placeholder
+    NEAR_DUP_LOOKUPS.inc(outcome="hit" if stored else "miss")
+    if stored is None:
+        return None
+    logger.info(
+        "Reusing near-duplicate workspace",
+        extra=fields(matched_query=stored.query, similarity=round(match.similarity, 3)),
+    )
+    classification = WorkspaceType(
+        workspace_type=stored.workspace_type,
+        confidence=max(guess.confidence, match.similarity),
+        rationale=f'Near duplicate of "{stored.query}" (similarity {match.similarity:.2f})',
+    )
+    result_cache.set(stage_cache_key("classify", request.query), classification.model_dump_json())
+    result_cache.set(
+        stage_cache_key("schema", request.query, stored.workspace_type), stored.workspace_schema.model_dump_json()
+    )
+    return classification, stored.workspace_schema
+
+
+# Identical in-flight stage calls share one upstream request
+stage_flight = AsyncSingleFlight()
+
+
+# Every stage's prompts, registered below next to their endpoints. A fraction
+# ATLAS_PROMPT_COMPACT_FRACTION of queries get the compact variants (for A/B
+# tests); ATLAS_PROMPT_VARIANT=full|compact pins one for every query
+prompt_registry = PromptRegistry(
+    compact_fraction=float(os.getenv("ATLAS_PROMPT_COMPACT_FRACTION", "0")),
+    force_variant=os.getenv("ATLAS_PROMPT_VARIANT") or None,
+)
+
+
+def prompt_version(stage: str, query: str, workspace_type: str = "") -> str:
+    """
+    Version of the prompts behind a stage's result; a workspace depends on all
+    three stages. A templated schema depends on its template and the fields prompt.
+    """
+    if stage == "workspace":
+        # "ids-v2": workspace IDs became stable content hashes, so older cached workspaces are stale
+        return content_hash(
+            *(prompt_registry.version(part, query) for part in ("classify", "schema", "suggestions")),
+            *((prompt_registry.version("schema_fields", query), TEMPLATES_VERSION) if TEMPLATED_SCHEMAS else ()),
+            "ids-v2",
+        )
+    if stage == "schema" and TEMPLATED_SCHEMAS:
+        template = template_for(workspace_type)
+        if template:
+            return content_hash(prompt_registry.version("schema_fields", query), template.version)
+    return prompt_registry.version(stage, query)
+
+
+def stage_cache_key(stage: str, query: str, workspace_type: str = "") -> str:
+    """Cache key for one stage's result; changes whenever the stage's prompts change"""
+    return ResultCache.make_key(
+        stage,
+        normalize_query(query),
+        workspace_type,
+        llm_backend.model_id,
+        prompt_version(stage, query, workspace_type),
+    )
+
+
+async def generate_with(prompt: PromptTemplate, user_prompt: str) -> str:
+    """One LLM call with a registered prompt: its system instruction, response schema and output budget"""
+    with PROMPT_CALL_DURATION.time(stage=prompt.stage, variant=prompt.variant):
+        return await llm_client.generate(
+            user_prompt,
+            prompt.system,
+            response_schema=prompt.response_schema,
+            max_output_tokens=prompt.max_output_tokens,
+        )
+
+
+# Naive Bayes + keyword model; confident predictions skip the Gemini classification call
+query_classifier = load_local_classifier()
+LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv("ATLAS_LOCAL_CLASSIFIER_THRESHOLD", "0.9"))
+
+LOCAL_RATIONALES = {
+    "travel_research": "User is planning a trip or travel-related activity.",
+    "purchase_research": "User is researching a purchase decision.",
+    "learning_plan": "User wants to create a learning or study plan.",
+    "project_planner": "User is planning or organizing a project.",
+}
+
+
+def local_classify(query: str) -> WorkspaceType:
+    """Classify with the local model (no-key fallback, speculative guess, LLM short-circuit)"""
+    workspace_type, confidence = query_classifier.predict(query)
+    return WorkspaceType(
+        workspace_type=workspace_type,
+        confidence=round(confidence, 4),
+        rationale=LOCAL_RATIONALES.get(workspace_type, "Classified by the local model."),
+    )
+
+
+# CUSTOMIZE THIS PROMPT: Edit CLASSIFY_SYSTEM_PROMPT to change how classification works
+CLASSIFY_SYSTEM_PROMPT = """You are a query classifier for a research workspace application called Atlas. 
         Analyze the user's search query and classify it into the most appropriate workspace type.
 
         Workspace Types:
@@ -229,53 +881,75 @@ async def classify_query(request: WorkspaceCreateRequest):
         Return ONLY valid JSON, no other text.
         Return JSON format: {"workspace_type": "...", "confidence": 0.0-1.0, "rationale": "..."}"""
 
-    # CUSTOMIZE THIS PROMPT: Edit the user_prompt to change what context is sent with the query
-    user_prompt = f"""Analyze this search query and classify it:
-"{request.query}"
+# CUSTOMIZE THIS PROMPT: Edit CLASSIFY_USER_PROMPT to change what context is sent with the query
+CLASSIFY_USER_PROMPT = """Analyze this search query and classify it:
+"{query}"
 
 What type of research workspace does this query need?"""
-    
+
+# Compact variant, for A/B tests against the full prompts above
+CLASSIFY_COMPACT_SYSTEM_PROMPT = """Classify a search query for Atlas, a research workspace app, into one workspace type:
+- travel_research: trips, destinations, itineraries, hotels, restaurants, attractions
+- purchase_research: buying, comparing, reviewing products
+- learning_plan: skills, courses, tutorials, study plans
+- project_planner: projects, tasks, anything else
+
+Return ONLY JSON: {"workspace_type": "...", "confidence": 0.0-1.0, "rationale": "one sentence"}"""
+
+CLASSIFY_COMPACT_USER_PROMPT = 'Query: "{query}"'
+
+prompt_registry.register(
+    "classify",
+    CLASSIFY_SYSTEM_PROMPT,
+    CLASSIFY_USER_PROMPT,
+    max_output_tokens=256,
+    response_schema=RESPONSE_SCHEMAS["classify"],
+)
+prompt_registry.register(
+    "classify",
+    CLASSIFY_COMPACT_SYSTEM_PROMPT,
+    CLASSIFY_COMPACT_USER_PROMPT,
+    variant=COMPACT,
+    max_output_tokens=256,
+    response_schema=RESPONSE_SCHEMAS["classify"],
+)
+
+
+@app.post("/api/workspace/classify", response_model=WorkspaceType, dependencies=[Depends(admit_llm_request)])
+@timed_stage("classify")
+async def classify_query(request: WorkspaceCreateRequest):
+    """
+    Classify the user query into a workspace type using Gemini API.
+    """
     try:
-        if GEMINI_API_KEY:
-            response_text = call_gemini(user_prompt, system_prompt)
-            # Extract JSON from response (handle markdown code blocks)
-            response_text = response_text.strip()
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1].split("```")[0].strip()
+        if LLM_ENABLED:
+            local = local_classify(request.query)
+            if local.confidence >= LOCAL_CLASSIFIER_THRESHOLD:
+                STAGE_RESULTS.inc(stage="classify", source="local")
+                return local
+            
+            key = stage_cache_key("classify", request.query)
+            cached = result_cache.get(key)
+            if cached:
+                STAGE_RESULTS.inc(stage="classify", source="cache")
+                return WorkspaceType.model_validate_json(cached)
             
-            result = json.loads(response_text)
-            return WorkspaceType(**result)
+            prompt = prompt_registry.get("classify", request.query)
+            user_prompt = prompt.render(query=request.query)
+            response_text = await stage_flight.do(key, lambda: generate_with(prompt, user_prompt))
+            with PARSE_DURATION.time(stage="classify"):
+                classification = parse_json_model(WorkspaceType, response_text)
+            result_cache.set(key, classification.model_dump_json())
+            STAGE_RESULTS.inc(stage="classify", source="llm")
+            return classification
         else:
-            # Fallback to rule-based classification
-            query_lower = request.query.lower()
-            if any(word in query_lower for word in ["trip", "travel", "visit", "vacation"]):
-                return WorkspaceType(
-                    workspace_type="travel_research",
-                    confidence=0.85,
-                    rationale="User is planning a trip or travel-related activity."
-                )
-            elif any(word in query_lower for word in ["buy", "purchase", "choose", "laptop", "product"]):
-                return WorkspaceType(
-                    workspace_type="purchase_research",
-                    confidence=0.80,
-                    rationale="User is researching a purchase decision."
-                )
-            elif any(word in query_lower for word in ["learn", "study", "plan", "course", "tutorial"]):
-                return WorkspaceType(
-                    workspace_type="learning_plan",
-                    confidence=0.75,
-                    rationale="User wants to create a learning or study plan."
-                )
-            else:
-                return WorkspaceType(
-                    workspace_type="project_planner",
-                    confidence=0.70,
-                    rationale="Default to project planner workspace type."
-                )
+            # Fallback to the local classifier
+            STAGE_RESULTS.inc(stage="classify", source="local")
+            return local_classify(request.query)
     except Exception as e:
-        print(f"Classification error: {e}")
+        raise_if_overloaded(e)
+        logger.warning(f"Classification error: {e}", extra=fields(stage="classify"))
+        STAGE_RESULTS.inc(stage="classify", source="error")
         # Fallback to default
         return WorkspaceType(
             workspace_type="project_planner",
@@ -284,13 +958,8 @@ What type of research workspace does this query need?"""
         )
 
 
-@app.post("/api/workspace/schema", response_model=WorkspaceSchema)
-async def generate_schema(request: WorkspaceCreateRequest, workspace_type: str):
-    """
-    Generate workspace schema based on query and workspace type using Gemini API.
-    """
-    # CUSTOMIZE THIS PROMPT: Edit the system_prompt to change how schema generation works
-    system_prompt = """You are a workspace schema generator for Atlas, a research workspace application.
+# CUSTOMIZE THIS PROMPT: Edit SCHEMA_SYSTEM_PROMPT to change how schema generation works
+SCHEMA_SYSTEM_PROMPT = """You are a workspace schema generator for Atlas, a research workspace application.
 Generate a workspace layout that helps users research their query effectively.
 
 Return ONLY valid JSON, no other text.
@@ -322,8 +991,8 @@ Available module types:
 
 Choose modules that match the workspace type and query needs."""
 
-    # CUSTOMIZE THIS PROMPT: Edit the user_prompt to add more context or instructions
-    user_prompt = f"""User Query: "{request.query}"
+# CUSTOMIZE THIS PROMPT: Edit SCHEMA_USER_PROMPT to add more context or instructions
+SCHEMA_USER_PROMPT = """User Query: "{query}"
 Workspace Type: {workspace_type}
 
 Generate a workspace schema with:
@@ -338,63 +1007,109 @@ Example for travel_research:
 - reddit: ["japan travel tips", "japan itinerary"]
 - youtube: ["japan travel vlog", "tokyo travel guide"]"""
 
+# Compact variant, for A/B tests against the full prompts above
+SCHEMA_COMPACT_SYSTEM_PROMPT = """Generate a research workspace layout for Atlas. Return ONLY JSON:
+{"title": "...", "modules": [{"type": "..."}], "recommended_sources": [...], "source_queries": {"<source>": [...]}}
+
+Sources: web, reddit, youtube, maps, academic; give 1-3 specific search queries per recommended source.
+Modules: always sources_panel, saved_panel, suggestions_panel; add map_panel, itinerary_panel (travel),
+budget_panel (travel, purchase), comparison_panel, spec_panel (purchase), schedule_panel, curriculum_panel (learning)."""
+
+SCHEMA_COMPACT_USER_PROMPT = """Query: "{query}"
+Workspace Type: {workspace_type}"""
+
+prompt_registry.register(
+    "schema",
+    SCHEMA_SYSTEM_PROMPT,
+    SCHEMA_USER_PROMPT,
+    max_output_tokens=1024,
+    response_schema=RESPONSE_SCHEMAS["schema"],
+)
+prompt_registry.register(
+    "schema",
+    SCHEMA_COMPACT_SYSTEM_PROMPT,
+    SCHEMA_COMPACT_USER_PROMPT,
+    variant=COMPACT,
+    max_output_tokens=1024,
+    response_schema=RESPONSE_SCHEMAS["schema"],
+)
+
+# CUSTOMIZE THIS PROMPT: Modules and recommended sources come from the workspace type's
+# template in schema_templates.py; the model only names the workspace and writes search queries
+SCHEMA_FIELDS_SYSTEM_PROMPT = """Name a research workspace for Atlas and write its search queries. Return ONLY JSON:
+{"title": "...", "source_queries": {"<source>": ["...", ...]}}
+
+title: short and specific to the query, e.g. "Japan Budget Travel Workspace".
+source_queries: 2-3 specific search queries for each listed source, and no other sources."""
+
+SCHEMA_FIELDS_USER_PROMPT = """Query: "{query}"
+Workspace Type: {workspace_type}
+Sources: {sources}"""
+
+prompt_registry.register(
+    "schema_fields",
+    SCHEMA_FIELDS_SYSTEM_PROMPT,
+    SCHEMA_FIELDS_USER_PROMPT,
+    max_output_tokens=384,
+    response_schema=RESPONSE_SCHEMAS["schema_fields"],
+)
+
+# Workspace types with a template (schema_templates.py) get its fixed layout and only
+# ask the model for the title and search queries; false generates whole schemas as before
+TEMPLATED_SCHEMAS = os.getenv("ATLAS_SCHEMA_TEMPLATES", "true").lower() in ("1", "true", "yes")
+
+
+def apply_template(template: SchemaTemplate, fields: SchemaFields) -> WorkspaceSchema:
+    """Merge generated fields into a template and validate the result"""
+    return WorkspaceSchema.model_validate(
+        template.render(fields.title, fields.source_queries.model_dump(exclude_none=True))
+    )
+
+
+@app.post("/api/workspace/schema", response_model=WorkspaceSchema, dependencies=[Depends(admit_llm_request)])
+@timed_stage("schema")
+async def generate_schema(request: WorkspaceCreateRequest, workspace_type: str):
+    """
+    Generate workspace schema based on query and workspace type using Gemini API.
+    """
     try:
-        if GEMINI_API_KEY:
-            response_text = call_gemini(user_prompt, system_prompt)
-            # Extract JSON from response
-            response_text = response_text.strip()
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1].split("```")[0].strip()
-            
-            result = json.loads(response_text)
-            # Convert modules dict to Module objects
-            modules = [Module(type=m["type"]) for m in result.get("modules", [])]
-            return WorkspaceSchema(
-                title=result.get("title", f"{workspace_type.replace('_', ' ').title()} Workspace"),
-                modules=modules,
-                recommended_sources=result.get("recommended_sources", ["web"]),
-                source_queries=SourceQueries(**result.get("source_queries", {}))
-            )
-        else:
-            # Fallback implementation
-            modules = [
-                Module(type="sources_panel"),
-                Module(type="saved_panel"),
-                Module(type="suggestions_panel"),
-            ]
+        if LLM_ENABLED:
+            key = stage_cache_key("schema", request.query, workspace_type)
+            cached = result_cache.get(key)
+            if cached:
+                STAGE_RESULTS.inc(stage="schema", source="cache")
+                return WorkspaceSchema.model_validate_json(cached)
             
-            if workspace_type == "travel_research":
-                modules.extend([
-                    Module(type="map_panel"),
-                    Module(type="itinerary_panel"),
-                    Module(type="budget_panel"),
-                ])
-                recommended_sources = ["maps", "web", "reddit", "youtube"]
-            elif workspace_type == "purchase_research":
-                modules.extend([
-                    Module(type="comparison_panel"),
-                    Module(type="spec_panel"),
-                ])
-                recommended_sources = ["web", "reddit", "youtube"]
-            elif workspace_type == "learning_plan":
-                modules.extend([
-                    Module(type="schedule_panel"),
-                    Module(type="curriculum_panel"),
-                ])
-                recommended_sources = ["web", "youtube", "academic"]
+            template = template_for(workspace_type) if TEMPLATED_SCHEMAS else None
+            if template:
+                prompt = prompt_registry.get("schema_fields", request.query)
+                user_prompt = prompt.render(
+                    query=request.query,
+                    workspace_type=workspace_type,
+                    sources=", ".join(template.recommended_sources),
+                )
             else:
-                recommended_sources = ["web", "reddit"]
-            
-            return WorkspaceSchema(
-                title=f"{workspace_type.replace('_', ' ').title()} Workspace",
-                modules=modules,
-                recommended_sources=recommended_sources,
-                source_queries=SourceQueries()
-            )
+                prompt = prompt_registry.get("schema", request.query)
+                user_prompt = prompt.render(query=request.query, workspace_type=workspace_type)
+            response_text = await stage_flight.do(key, lambda: generate_with(prompt, user_prompt))
+            with PARSE_DURATION.time(stage="schema"):
+                if template:
+                    schema = apply_template(template, parse_json_model(SchemaFields, response_text))
+                else:
+                    schema = parse_json_model(WorkspaceSchema, response_text)
+            if not schema.title:
+                schema.title = f"{workspace_type.replace('_', ' ').title()} Workspace"
+            result_cache.set(key, schema.model_dump_json())
+            STAGE_RESULTS.inc(stage="schema", source="llm")
+            return schema
+        else:
+            # Fallback implementation: the type's template with a generic title and no search queries
+            STAGE_RESULTS.inc(stage="schema", source="local")
+            return WorkspaceSchema.model_validate(default_template(workspace_type).render())
     except Exception as e:
-        print(f"Schema generation error: {e}")
+        raise_if_overloaded(e)
+        logger.warning(f"Schema generation error: {e}", extra=fields(stage="schema"))
+        STAGE_RESULTS.inc(stage="schema", source="error")
         # Fallback to default
         modules = [
             Module(type="sources_panel"),
@@ -409,13 +1124,8 @@ Example for travel_research:
         )
 
 
-@app.post("/api/workspace/suggestions", response_model=SuggestionsResponse)
-async def generate_suggestions(request: WorkspaceCreateRequest, workspace_type: str):
-    """
-    Generate evidence-linked suggestions using Gemini API.
-    """
-    # CUSTOMIZE THIS PROMPT: Edit the system_prompt to change how suggestions are generated
-    system_prompt = """You are a research assistant for Atlas, a search engine that generates research workspaces.
+# CUSTOMIZE THIS PROMPT: Edit SUGGESTIONS_SYSTEM_PROMPT to change how suggestions are generated
+SUGGESTIONS_SYSTEM_PROMPT = """You are a research assistant for Atlas, a search engine that generates research workspaces.
 Your job is to suggest relevant, high-quality resources that help users research their query - similar to what Google Search would return.
 
 Generate 4-6 suggestions that are:
@@ -450,8 +1160,8 @@ Guidelines:
 - Do NOT suggest workplace/office tools unless the query is explicitly about work/projects
 - Focus on resources that would appear in top Google Search results"""
 
-    # CUSTOMIZE THIS PROMPT: Edit the user_prompt to add more context, examples, or instructions
-    user_prompt = f"""User Query: "{request.query}"
+# CUSTOMIZE THIS PROMPT: Edit SUGGESTIONS_USER_PROMPT to add more context, examples, or instructions
+SUGGESTIONS_USER_PROMPT = """User Query: "{query}"
 Workspace Type: {workspace_type}
 
 Generate 4-6 research suggestions that would help someone researching this query. 
@@ -467,30 +1177,81 @@ For example, if the query is "plan a trip to japan", suggest:
 
 Make suggestions specific, relevant, and from well-known sources. Include evidence links that represent the types of resources users would actually find."""
 
+# Compact variant, for A/B tests against the full prompts above
+SUGGESTIONS_COMPACT_SYSTEM_PROMPT = """Suggest 4-6 resources for an Atlas research workspace: reputable, well-known sources like
+top Google results, with realistic URLs and diverse evidence (web, reddit, youtube). No workplace tools unless
+the query is about work. Return ONLY JSON:
+{"suggestions": [{"title": "...", "category": "...", "reason": "one sentence", "evidence": [{"source": "web", "label": "...", "url": "https://..."}], "actions": ["save", "open"]}]}"""
+
+SUGGESTIONS_COMPACT_USER_PROMPT = """Query: "{query}"
+Workspace Type: {workspace_type}"""
+
+prompt_registry.register(
+    "suggestions",
+    SUGGESTIONS_SYSTEM_PROMPT,
+    SUGGESTIONS_USER_PROMPT,
+    max_output_tokens=2048,
+    response_schema=RESPONSE_SCHEMAS["suggestions"],
+)
+prompt_registry.register(
+    "suggestions",
+    SUGGESTIONS_COMPACT_SYSTEM_PROMPT,
+    SUGGESTIONS_COMPACT_USER_PROMPT,
+    variant=COMPACT,
+    max_output_tokens=2048,
+    response_schema=RESPONSE_SCHEMAS["suggestions"],
+)
+
+
+# Evidence links are canonicalized and deduped across suggestions, then (unless
+# ATLAS_VALIDATE_LINKS=false) checked with cached HEAD requests and dropped if dead
+link_checker = (
+    LinkChecker(
+        timeout=float(os.getenv("ATLAS_LINK_CHECK_TIMEOUT", "2")),
+        max_concurrency=int(os.getenv("ATLAS_LINK_CHECK_CONCURRENCY", "16")),
+        db_path=os.getenv("ATLAS_LINK_CHECK_DB") or None,
+        deadline=float(os.getenv("ATLAS_LINK_CHECK_DEADLINE") or 1) or None,
+    )
+    if os.getenv("ATLAS_VALIDATE_LINKS", "true").lower() in ("1", "true", "yes")
+    else None
+)
+
+
+@timed_stage("evidence")
+async def clean_evidence(suggestions: List[Suggestion], index: Optional[EvidenceIndex] = None) -> List[Suggestion]:
+    """Post-process model suggestions: canonical, deduped evidence URLs with dead links removed"""
+    suggestions = dedupe_evidence(suggestions, index)
+    if link_checker:
+        suggestions = await link_checker.filter(suggestions)
+    return suggestions
+
+
+@app.post("/api/workspace/suggestions", response_model=SuggestionsResponse, dependencies=[Depends(admit_llm_request)])
+@timed_stage("suggestions")
+async def generate_suggestions(request: WorkspaceCreateRequest, workspace_type: str):
+    """
+    Generate evidence-linked suggestions using Gemini API.
+    """
     try:
-        if GEMINI_API_KEY:
-            response_text = call_gemini(user_prompt, system_prompt)
-            # Extract JSON from response
-            response_text = response_text.strip()
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1].split("```")[0].strip()
+        if LLM_ENABLED:
+            key = stage_cache_key("suggestions", request.query, workspace_type)
+            cached = result_cache.get(key)
+            if cached:
+                STAGE_RESULTS.inc(stage="suggestions", source="cache")
+                return SuggestionsResponse.model_validate_json(cached)
             
-            result = json.loads(response_text)
-            suggestions = []
-            for s in result.get("suggestions", []):
-                evidence_list = [Evidence(**e) for e in s.get("evidence", [])]
-                suggestions.append(Suggestion(
-                    title=s.get("title", "Untitled"),
-                    category=s.get("category", "general"),
-                    reason=s.get("reason", ""),
-                    evidence=evidence_list,
-                    actions=s.get("actions", ["save", "open"])
-                ))
-            return SuggestionsResponse(suggestions=suggestions)
+            prompt = prompt_registry.get("suggestions", request.query)
+            user_prompt = prompt.render(query=request.query, workspace_type=workspace_type)
+            response_text = await stage_flight.do(key, lambda: generate_with(prompt, user_prompt))
+            with PARSE_DURATION.time(stage="suggestions"):
+                suggestions_response = parse_json_model(SuggestionsResponse, response_text)
+            suggestions_response.suggestions = await clean_evidence(suggestions_response.suggestions)
+            result_cache.set(key, suggestions_response.model_dump_json())
+            STAGE_RESULTS.inc(stage="suggestions", source="llm")
+            return suggestions_response
         else:
             # Fallback implementation
+            STAGE_RESULTS.inc(stage="suggestions", source="local")
             return SuggestionsResponse(
                 suggestions=[
                     Suggestion(
@@ -509,7 +1270,9 @@ Make suggestions specific, relevant, and from well-known sources. Include eviden
                 ]
             )
     except Exception as e:
-        print(f"Suggestions generation error: {e}")
+        raise_if_overloaded(e)
+        logger.warning(f"Suggestions generation error: {e}", extra=fields(stage="suggestions"))
+        STAGE_RESULTS.inc(stage="suggestions", source="error")
         # Fallback to default
         return SuggestionsResponse(
             suggestions=[
@@ -524,62 +1287,819 @@ Make suggestions specific, relevant, and from well-known sources. Include eviden
         )
 
 
-@app.post("/api/workspace/create")
-async def create_workspace(request: WorkspaceCreateRequest):
+# CUSTOMIZE THIS PROMPT: Combined prompt for fused mode - keep it in sync with the three stage prompts above
+FUSED_SYSTEM_PROMPT = """You are the workspace generator for Atlas, a research workspace application.
+For the user's search query, produce a classification, a workspace schema and research suggestions in one response.
+
+Workspace Types:
+- travel_research: trips, vacations, destinations, itineraries, hotels, flights, restaurants, attractions
+- purchase_research: buying products, comparing items, reviews, specifications, prices
+- learning_plan: learning skills, courses, tutorials, study plans, curriculum
+- project_planner: planning projects, organizing tasks, general planning
+
+Available module types:
+- sources_panel, saved_panel, suggestions_panel: Always include
+- map_panel, itinerary_panel: For travel queries
+- budget_panel: For travel or purchase queries
+- comparison_panel, spec_panel: For purchase queries
+- schedule_panel, curriculum_panel: For learning plans
+
+Suggestions: 4-6 relevant, high-quality resources from reputable, well-known sources, similar to top
+Google Search results for the query, with diverse evidence (web, reddit, youtube) and realistic URLs.
+
+Return ONLY valid JSON, no other text.
+Return JSON format:
+{
+  "classification": {"workspace_type": "...", "confidence": 0.0-1.0, "rationale": "..."},
+  "schema": {
+    "title": "Descriptive Workspace Title",
+    "modules": [{"type": "sources_panel"}, ...],
+    "recommended_sources": ["web", "reddit", "youtube", "maps", "academic"],
+    "source_queries": {"maps": [...], "reddit": [...], "youtube": [...], "web": [...], "academic": [...]}
+  },
+  "suggestions": [
+    {
+      "title": "...",
+      "category": "...",
+      "reason": "...",
+      "evidence": [{"source": "web", "label": "...", "url": "https://..."}],
+      "actions": ["save", "open"]
+    }
+  ]
+}"""
+
+FUSED_USER_PROMPT = """User Query: "{query}"
+
+Classify this query, then generate the workspace schema and research suggestions for it."""
+
+prompt_registry.register(
+    "fused",
+    FUSED_SYSTEM_PROMPT,
+    FUSED_USER_PROMPT,
+    max_output_tokens=3072,
+    response_schema=RESPONSE_SCHEMAS["fused"],
+)
+
+# Generate all three stages with one Gemini call by default (?fused= overrides per request)
+FUSED_GENERATION = os.getenv("ATLAS_FUSED_GENERATION", "false").lower() in ("1", "true", "yes")
+
+
+@timed_stage("fused")
+async def generate_fused(
+    request: WorkspaceCreateRequest,
+) -> Tuple[Optional[WorkspaceType], Optional[WorkspaceSchema], Optional[SuggestionsResponse]]:
+    """
+    Generate classification, schema and suggestions with a single Gemini call.
+    Each part is validated on its own; a part that is missing or invalid comes back as None.
+    Schema and suggestions are written for the response's own workspace type, so
+    without a valid classification neither is used.
+    """
+    prompt = prompt_registry.get("fused", request.query)
+    user_prompt = prompt.render(query=request.query)
+
+    try:
+        response_text = await stage_flight.do(
+            stage_cache_key("fused", request.query), lambda: generate_with(prompt, user_prompt)
+        )
+        with PARSE_DURATION.time(stage="fused"):
+            result = parse_json_model(Dict[str, Any], response_text)
+    except Exception as e:
+        raise_if_overloaded(e)
+        logger.warning(f"Fused generation error: {e}", extra=fields(stage="fused"))
+        return None, None, None
+
+    def validate(model, data, part):
+        try:
+            return model.model_validate(data)
+        except ValidationError as e:
+            logger.warning(f"Fused response has invalid {part}: {e}", extra=fields(stage="fused"))
+            return None
+
+    classification = validate(WorkspaceType, result.get("classification"), "classification")
+    if classification is None:
+        # A separate classification may pick another type than the one these parts were written for
+        return None, None, None
+    schema = validate(WorkspaceSchema, result.get("schema"), "schema")
+    suggestions = validate(SuggestionsResponse, {"suggestions": result.get("suggestions")}, "suggestions")
+    if suggestions:
+        suggestions.suggestions = await clean_evidence(suggestions.suggestions)
+    if schema and not schema.title:
+        schema = None  # Let the schema stage regenerate it rather than cache an untitled one
+    template = template_for(classification.workspace_type) if TEMPLATED_SCHEMAS else None
+    if schema and template:
+        # Same layout as the schema stage would give; the fused call only supplies the fields
+        schema = apply_template(template, SchemaFields.model_validate(schema.model_dump()))
+
+    # Share valid parts with the per-stage caches
+    workspace_type = classification.workspace_type
+    result_cache.set(stage_cache_key("classify", request.query), classification.model_dump_json())
+    if schema:
+        result_cache.set(stage_cache_key("schema", request.query, workspace_type), schema.model_dump_json())
+    if suggestions:
+        result_cache.set(stage_cache_key("suggestions", request.query, workspace_type), suggestions.model_dump_json())
+    return classification, schema, suggestions
+
+
+async def _ready(value):
+    return value
+
+
+def build_workspace(
+    request: WorkspaceCreateRequest,
+    classification: WorkspaceType,
+    schema: WorkspaceSchema,
+    suggestions: SuggestionsResponse,
+) -> WorkspaceResponse:
+    """Assemble the workspace payload returned to the frontend"""
+    return WorkspaceResponse(
+        id=workspace_id(request.query),
+        query=request.query,
+        workspace_type=classification.workspace_type,
+        workspace_schema=schema,
+        suggestions=suggestions.suggestions,
+        enabled_sources=schema.recommended_sources,
+    )
+
+
+def workspace_json_response(body: str) -> Response:
+    """Send already-serialized workspace JSON as is, skipping FastAPI's re-validation and encoding"""
+    return Response(content=body, media_type="application/json")
+
+
+def save_workspace(workspace: WorkspaceResponse, body: Optional[str] = None) -> str:
+    """Put a workspace in the workspace store (written to disk in the background); returns its JSON"""
+    body = body or workspace.model_dump_json(by_alias=True)
+    workspace_store.put(workspace.id, workspace.query, workspace.workspace_type, body)
+    return body
+
+
+def stages_generated(request: WorkspaceCreateRequest, classification: WorkspaceType) -> bool:
+    """
+    Whether every stage of a workspace came from the model (or a confident local
+    classification) rather than an error fallback, i.e. all of them were cached.
+    Only such workspaces are cached; a degraded one would otherwise keep being
+    served under the query's stable ID after Gemini recovers.
+    """
+    classified = (
+        result_cache.contains(stage_cache_key("classify", request.query))
+        or (
+            classification.confidence >= LOCAL_CLASSIFIER_THRESHOLD
+            and classification == local_classify(request.query)
+        )
+    )
+    return classified and all(
+        result_cache.contains(stage_cache_key(stage, request.query, classification.workspace_type))
+        for stage in ["schema", "suggestions"]
+    )
+
+
+@app.get("/api/workspace/{workspace_id}", response_model=WorkspaceResponse)
+def get_workspace(workspace_id: str):
+    """A previously created workspace, by ID"""
+    body = workspace_store.get(workspace_id)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Workspace not found")
+    saved = saved_item_store.list(workspace_id)
+    if saved:
+        workspace = json.loads(body)
+        workspace["saved_items"] = [json.loads(item) for item in saved]
+        body = json.dumps(workspace)
+    return workspace_json_response(body)
+
+
+@app.get("/api/workspaces")
+def list_workspaces(workspace_type: Optional[str] = None, limit: int = 50):
+    """Recently created workspaces (id, query, type), newest first"""
+    return {"workspaces": workspace_store.list(workspace_type, max(1, min(limit, 500)))}
+
+
+@app.post("/api/workspace/{workspace_id}/items", response_model=StoredSavedItem)
+def save_item(workspace_id: str, item: SavedItem):
+    """Save an item to a workspace; saving one with the same type and title again updates it"""
+    if workspace_store.get(workspace_id) is None:
+        raise HTTPException(status_code=404, detail="Workspace not found")
+    stored = StoredSavedItem(
+        **item.model_dump(), id=saved_item_id(workspace_id, item.type, item.title), workspace_id=workspace_id
+    )
+    saved_item_store.put(stored.id, workspace_id, stored.model_dump_json())
+    return stored
+
+
+@app.get("/api/workspace/{workspace_id}/items")
+def list_saved_items(workspace_id: str):
+    """A workspace's saved items, most recently saved first"""
+    return {"items": [StoredSavedItem.model_validate_json(body) for body in saved_item_store.list(workspace_id)]}
+
+
+@app.delete("/api/workspace/{workspace_id}/items/{item_id}")
+def delete_saved_item(workspace_id: str, item_id: str):
+    body = saved_item_store.get(item_id)
+    if body is None or StoredSavedItem.model_validate_json(body).workspace_id != workspace_id:
+        raise HTTPException(status_code=404, detail="Saved item not found")
+    saved_item_store.delete(item_id)
+    return {"deleted": item_id}
+
+
+@app.get("/api/items/search")
+def search_saved_items(
+    q: str = "",
+    tag: Annotated[List[str], Query()] = [],
+    workspace_id: Optional[str] = None,
+    prefix: bool = False,
+    limit: int = 20,
+):
+    """
+    Saved items across workspaces ranked by BM25 over title, notes and tags.
+    Every `tag` given must match; `prefix=true` also matches the last word as
+    a prefix, for search-as-you-type. Without `q`, filtered items come back
+    newest first.
+    """
+    start = time.perf_counter()
+    results = saved_item_store.search(
+        q, tags=tag, workspace_id=workspace_id, limit=max(1, min(limit, 200)), prefix=prefix
+    )
+    return {
+        "results": [
+            SavedItemResult(item=StoredSavedItem.model_validate_json(body), score=round(score, 4))
+            for body, score in results
+        ],
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 3),
+    }
+
+
+@app.get("/api/items/autocomplete")
+def autocomplete_saved_items(prefix: str, limit: int = 10):
+    """Indexed words starting with `prefix`, most common first"""
+    return {"completions": saved_item_store.complete(prefix, max(1, min(limit, 50)))}
+
+
+@app.post("/api/workspace/create", response_model=WorkspaceResponse, dependencies=[Depends(admit_llm_request)])
+@timed_stage("workspace")
+async def create_workspace(request: WorkspaceCreateRequest, fused: Optional[bool] = None):
     """
     Main endpoint: creates a workspace by classifying query and generating schema.
+    With fused=true all three stages come from one Gemini call, and only the
+    parts of that response that fail validation are regenerated separately.
+    A near duplicate of an earlier query reuses its classification and schema.
     """
     try:
-        print(f"Creating workspace for query: {request.query}")
+        logger.debug(f"Creating workspace for query: {request.query}")
         
-        # Classify query
-        print("Classifying query...")
-        classification = await classify_query(request)
-        print(f"Classification result: {classification.workspace_type}")
-        
-        # Generate schema
-        print("Generating schema...")
-        schema = await generate_schema(request, classification.workspace_type)
-        print(f"Schema generated: {schema.title}")
+        workspace_key = stage_cache_key("workspace", request.query)
+        if LLM_ENABLED:
+            cached = result_cache.get(workspace_key)
+            if cached:
+                logger.info("Workspace served from cache")
+                STAGE_RESULTS.inc(stage="workspace", source="cache")
+                if workspace_store.get(workspace_id(request.query)) is None:
+                    save_workspace(WorkspaceResponse.model_validate_json(cached), cached)
+                return workspace_json_response(cached)
         
-        # Generate suggestions
-        print("Generating suggestions...")
-        suggestions = await generate_suggestions(request, classification.workspace_type)
-        print(f"Generated {len(suggestions.suggestions)} suggestions")
+        known_classification = known_schema = known_suggestions = None
+        near_duplicate = find_near_duplicate(request) if LLM_ENABLED else None
+        if near_duplicate:
+            known_classification, known_schema = near_duplicate
+        elif FUSED_GENERATION if fused is None else fused:
+            logger.debug("Running fused generation")
+            known_classification, known_schema, known_suggestions = await generate_fused(request)
         
-        workspace_id = f"ws_{abs(hash(request.query)) % 10000}"
-        print(f"Workspace created with ID: {workspace_id}")
+        # Schema and suggestions only depend on the workspace type, so they run
+        # concurrently once classification is done
+        graph = StageGraph()
+        graph.add(
+            "classification",
+            lambda: _ready(known_classification) if known_classification else classify_query(request),
+        )
+        graph.add(
+            "schema",
+            lambda classification: (
+                _ready(known_schema) if known_schema
+                else generate_schema(request, classification.workspace_type)
+            ),
+            depends_on=["classification"],
+        )
+        graph.add(
+            "suggestions",
+            lambda classification: (
+                _ready(known_suggestions) if known_suggestions
+                else generate_suggestions(request, classification.workspace_type)
+            ),
+            depends_on=["classification"],
+        )
+        if SPECULATIVE_STAGES and not known_classification:
+            # Start schema and suggestions from the local guess while the LLM classifies
+            graph.speculate(
+                "classification",
+                local_classify(request.query),
+                agrees=lambda guess, actual: guess.workspace_type == actual.workspace_type,
+            )
         
-        # Convert suggestions to dict format for JSON serialization (using model_dump for Pydantic v2)
-        try:
-            suggestions_list = [s.model_dump() for s in suggestions.suggestions]
-        except AttributeError:
-            # Fallback for older Pydantic versions
-            suggestions_list = [s.dict() for s in suggestions.suggestions]
+        logger.debug("Running workspace stages")
+        results = await graph.run()
+        classification = results["classification"]
+        schema = results["schema"]
+        suggestions = results["suggestions"]
+        if graph.rerun:
+            logger.info(f"Speculative guess was wrong, re-ran: {', '.join(sorted(graph.rerun))}")
         
-        # Convert schema to dict (using model_dump for Pydantic v2)
-        try:
-            schema_dict = schema.model_dump()
-        except AttributeError:
-            # Fallback for older Pydantic versions
-            schema_dict = schema.dict()
+        workspace = build_workspace(request, classification, schema, suggestions)
+        logger.info(
+            f"Workspace created with ID: {workspace.id}",
+            extra=fields(
+                workspace_type=classification.workspace_type,
+                title=schema.title,
+                suggestions=len(suggestions.suggestions),
+            ),
+        )
         
-        return {
-            "id": workspace_id,
-            "query": request.query,
-            "workspace_type": classification.workspace_type,
-            "schema": schema_dict,
-            "suggestions": suggestions_list,  # Return array of dicts directly
-            "enabled_sources": schema.recommended_sources,
-            "saved_items": [],
-        }
+        if not LLM_ENABLED:
+            return workspace_json_response(save_workspace(workspace))
+        if not stages_generated(request, classification):
+            # Stored so the frontend can open it by ID, but not cached, so the next request retries the model
+            workspace.degraded = True
+            return workspace_json_response(save_workspace(workspace))
+        body = save_workspace(workspace)
+        result_cache.set(workspace_key, body)
+        if query_index is not None and not near_duplicate:
+            # Only model-generated workspaces are matched against, never reused ones
+            query_index.add(workspace.id, request.query, classification.workspace_type)
+        return workspace_json_response(body)
     except Exception as e:
-        print(f"Error in create_workspace: {e}")
-        import traceback
-        traceback.print_exc()
+        raise_if_overloaded(e)
+        logger.exception(f"Error in create_workspace: {e}")
         raise HTTPException(status_code=500, detail=f"Error creating workspace: {str(e)}")
 
 
+
+async def stream_suggestions(
+    request: WorkspaceCreateRequest, workspace_type: str
+) -> AsyncIterator[Suggestion]:
+    """
+    Yield suggestions one at a time as they are parsed from Gemini's streamed output,
+    each with the same evidence cleanup (dedupe and link check) as generate_suggestions.
+
+    The stream is registered with stage_flight, so concurrent requests for the same
+    suggestions share it (or this one joins theirs). Its result is only cached if the
+    array closed and the stream ended without error. Otherwise the suggestions come
+    from generate_suggestions, skipping any that were already yielded.
+    """
+    emitted: List[Suggestion] = []
+    if LLM_ENABLED:
+        key = stage_cache_key("suggestions", request.query, workspace_type)
+        cached = result_cache.get(key)
+        if cached:
+            for suggestion in SuggestionsResponse.model_validate_json(cached).suggestions:
+                yield suggestion
+            return
+
+        prompt = prompt_registry.get("suggestions", request.query)
+        user_prompt = prompt.render(query=request.query, workspace_type=workspace_type)
+        chunks: asyncio.Queue = asyncio.Queue()
+
+        async def run_stream() -> str:
+            """The whole response text, for callers sharing the flight; chunks go to this caller as they arrive"""
+            parts = []
+            try:
+                async for chunk in llm_client.stream(
+                    user_prompt, prompt.system, max_output_tokens=prompt.max_output_tokens
+                ):
+                    parts.append(chunk)
+                    chunks.put_nowait(chunk)
+            finally:
+                chunks.put_nowait(None)
+            return "".join(parts)
+
+        if key not in stage_flight:
+            flight, _ = stage_flight.start(key, run_stream)
+            # Nobody awaits it if our client disconnects mid-stream
+            flight.add_done_callback(lambda f: f.cancelled() or f.exception())
+            parser = StreamingArrayParser("suggestions")
+            evidence_index = EvidenceIndex()
+            while (chunk := await chunks.get()) is not None:
+                for item in parser.feed(chunk):
+                    try:
+                        suggestion = Suggestion.model_validate(item)
+                    except ValidationError as e:
+                        logger.warning(f"Skipping invalid streamed suggestion: {e}")
+                        continue
+                    suggestion = evidence_index.dedupe(suggestion)
+                    if link_checker:
+                        suggestion = (await link_checker.filter([suggestion]))[0]
+                    emitted.append(suggestion)
+                    yield suggestion
+            try:
+                await flight
+            except Exception as e:
+                raise_if_overloaded(e)
+                logger.warning(f"Suggestions stream error: {e}", extra=fields(stage="suggestions"))
+            else:
+                if parser.done and emitted:
+                    result_cache.set(key, SuggestionsResponse(suggestions=emitted).model_dump_json())
+                    STAGE_RESULTS.inc(stage="suggestions", source="llm")
+                    return
+            logger.warning(
+                f"Suggestions stream incomplete after {len(emitted)} suggestions, regenerating",
+                extra=fields(stage="suggestions"),
+            )
+
+    # Joins the stream above if another request started it; otherwise a fresh call
+    shown = {suggestion.title for suggestion in emitted}
+    for suggestion in (await generate_suggestions(request, workspace_type)).suggestions:
+        if suggestion.title not in shown:
+            yield suggestion
+
+
+def sse_event(event: str, data) -> str:
+    """Format one Server-Sent Event; models are serialized directly"""
+    payload = data.model_dump_json(by_alias=True) if isinstance(data, BaseModel) else json.dumps(data)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+@app.post("/api/workspace/create/stream", dependencies=[Depends(admit_llm_request)])
+async def create_workspace_stream(request: WorkspaceCreateRequest):
+    """
+    Streaming variant of create_workspace. Sends Server-Sent Events as results become ready:
+    `classification`, then `schema` and one `suggestion` event per suggestion (interleaved),
+    then `done` with the full workspace payload. Errors are sent as an `error` event.
+    """
+    return StreamingResponse(
+        _workspace_events(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _workspace_events(request: WorkspaceCreateRequest) -> AsyncIterator[str]:
+    queue: asyncio.Queue = asyncio.Queue()
+    tasks: List[asyncio.Task] = []
+    try:
+        classification = await classify_query(request)
+        yield sse_event("classification", classification)
+        workspace_type = classification.workspace_type
+        
+        async def run_schema():
+            await queue.put(("schema", await generate_schema(request, workspace_type)))
+        
+        async def run_suggestions():
+            async for suggestion in stream_suggestions(request, workspace_type):
+                await queue.put(("suggestion", suggestion))
+        
+        async def run(stage):
+            try:
+                await stage()
+            except Exception as e:
+                await queue.put(("error", e))
+            finally:
+                await queue.put(("finished", None))
+        
+        tasks = [asyncio.create_task(run(run_schema)), asyncio.create_task(run(run_suggestions))]
+        schema = None
+        suggestions: List[Suggestion] = []
+        running = len(tasks)
+        while running:
+            kind, value = await queue.get()
+            if kind == "finished":
+                running -= 1
+            elif kind == "error":
+                raise value
+            elif kind == "schema":
+                schema = value
+                yield sse_event("schema", schema)
+            else:
+                suggestions.append(value)
+                yield sse_event("suggestion", value)
+        
+        workspace = build_workspace(
+            request, classification, schema, SuggestionsResponse(suggestions=suggestions)
+        )
+        workspace.degraded = LLM_ENABLED and not stages_generated(request, classification)
+        save_workspace(workspace)
+        yield sse_event("done", workspace)
+    except (RateLimitExceeded, LLMTimeoutError) as e:
+        # The 200 is already sent; tell the client how long to back off instead
+        limited = isinstance(e, RateLimitExceeded)
+        retry = e.retry_after if limited else upstream_limiter.retry_after()
+        yield sse_event("error", {"detail": str(e), "status": 429 if limited else 503, "retry_after": round(retry, 1)})
+    except Exception as e:
+        logger.exception(f"Error in create_workspace_stream: {e}")
+        yield sse_event("error", {"detail": f"Error creating workspace: {str(e)}"})
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+# CUSTOMIZE THIS PROMPT: Edit SUGGESTIONS_REFRESH_USER_PROMPT to change how refreshed suggestions are asked for
+SUGGESTIONS_REFRESH_USER_PROMPT = """User Query: "{query}"
+Workspace Type: {workspace_type}
+Enabled Sources: {sources}
+
+The user has already seen these suggestions:
+{shown}
+
+Generate 3-5 NEW research suggestions for this query that are not in the list above.
+Only use evidence from the enabled sources."""
+
+prompt_registry.register(
+    "suggestions_refresh",
+    SUGGESTIONS_SYSTEM_PROMPT,
+    SUGGESTIONS_REFRESH_USER_PROMPT,
+    max_output_tokens=2048,
+    response_schema=RESPONSE_SCHEMAS["suggestions"],
+)
+prompt_registry.register(
+    "suggestions_refresh",
+    SUGGESTIONS_COMPACT_SYSTEM_PROMPT,
+    SUGGESTIONS_REFRESH_USER_PROMPT,
+    variant=COMPACT,
+    max_output_tokens=2048,
+    response_schema=RESPONSE_SCHEMAS["suggestions"],
+)
+
+
+def uses_sources(suggestion: Suggestion, sources: List[str]) -> bool:
+    """Whether a suggestion still fits the enabled sources (suggestions without evidence always do)"""
+    return not suggestion.evidence or any(e.source in sources for e in suggestion.evidence)
+
+
+async def generate_more_suggestions(
+    request: WorkspaceCreateRequest, workspace_type: str, sources: List[str], shown: List[Suggestion]
+) -> List[Suggestion]:
+    """
+    New suggestions for the enabled sources, with the ones already shown as context
+    so they aren't repeated. Returns [] if the LLM is unavailable or fails.
+    """
+    if not LLM_ENABLED:
+        return []
+    key = ResultCache.make_key(
+        "suggestions_refresh",
+        normalize_query(request.query),
+        workspace_type,
+        ",".join(sorted(sources)),
+        content_hash(*sorted(s.title for s in shown)),
+        llm_backend.model_id,
+        prompt_registry.version("suggestions_refresh", request.query),
+    )
+    try:
+        cached = result_cache.get(key)
+        if cached:
+            STAGE_RESULTS.inc(stage="suggestions_refresh", source="cache")
+            suggestions = SuggestionsResponse.model_validate_json(cached)
+        else:
+            prompt = prompt_registry.get("suggestions_refresh", request.query)
+            user_prompt = prompt.render(
+                query=request.query,
+                workspace_type=workspace_type,
+                sources=", ".join(sources) or "any",
+                shown="\n".join(f"- {s.title}" for s in shown) or "(none)",
+            )
+            response_text = await stage_flight.do(key, lambda: generate_with(prompt, user_prompt))
+            with PARSE_DURATION.time(stage="suggestions_refresh"):
+                suggestions = parse_json_model(SuggestionsResponse, response_text)
+            result_cache.set(key, suggestions.model_dump_json())
+            STAGE_RESULTS.inc(stage="suggestions_refresh", source="llm")
+    except Exception as e:
+        raise_if_overloaded(e)
+        logger.warning(f"Suggestions refresh error: {e}", extra=fields(stage="suggestions_refresh"))
+        STAGE_RESULTS.inc(stage="suggestions_refresh", source="error")
+        return []
+    seen = {s.title for s in shown}
+    fresh = [s for s in suggestions.suggestions if s.title not in seen and uses_sources(s, sources)]
+    # Don't repeat evidence the workspace already shows
+    return await clean_evidence(fresh, EvidenceIndex(shown))
+
+
+@app.post(
+    "/api/workspace/{workspace_id}/refresh",
+    response_model=WorkspaceDelta,
+    dependencies=[Depends(admit_llm_request)],
+)
+@timed_stage("refresh")
+async def refresh_workspace(workspace_id: str, refresh: WorkspaceRefreshRequest):
+    """
+    Update a stored workspace, regenerating only what the change affects, and return the delta.
+
+    - workspace_type changed: schema and suggestions are regenerated (not the classification)
+    - enabled_sources changed: suggestions without evidence from the enabled sources are
+      removed, and new ones for those sources are generated with the current list as context
+    - more_suggestions: new suggestions are added, with the current list as context
+    """
+    body = workspace_store.get(workspace_id)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Workspace not found")
+    workspace = WorkspaceResponse.model_validate_json(body)
+    request = WorkspaceCreateRequest(query=workspace.query)
+    
+    workspace_type = refresh.workspace_type or workspace.workspace_type
+    sources = workspace.enabled_sources if refresh.enabled_sources is None else refresh.enabled_sources
+    type_changed = workspace_type != workspace.workspace_type
+    sources_changed = set(sources) != set(workspace.enabled_sources)
+    
+    schema = workspace.workspace_schema
+    suggestions = workspace.suggestions
+    regenerated: List[str] = []
+    if type_changed:
+        schema, fresh = await asyncio.gather(
+            generate_schema(request, workspace_type),
+            generate_suggestions(request, workspace_type),
+        )
+        regenerated = ["schema", "suggestions"]
+        if refresh.enabled_sources is None:
+            sources = schema.recommended_sources
+        suggestions = fresh.suggestions
+    elif sources_changed or refresh.more_suggestions:
+        kept = [s for s in suggestions if uses_sources(s, sources)]
+        regenerated = ["suggestions"]
+        suggestions = kept + await generate_more_suggestions(request, workspace_type, sources, kept)
+    
+    old_titles = {s.title for s in workspace.suggestions}
+    new_titles = {s.title for s in suggestions}
+    old_modules = {m.type for m in workspace.workspace_schema.modules}
+    new_modules = {m.type for m in schema.modules}
+    delta = WorkspaceDelta(
+        id=workspace.id,
+        workspace_type=workspace_type,
+        enabled_sources=sources,
+        regenerated=regenerated,
+        added_suggestions=[s for s in suggestions if s.title not in old_titles],
+        removed_suggestions=[s.title for s in workspace.suggestions if s.title not in new_titles],
+        added_modules=[m for m in schema.modules if m.type not in old_modules],
+        removed_modules=[m.type for m in workspace.workspace_schema.modules if m.type not in new_modules],
+    )
+    
+    if regenerated or sources_changed:
+        degraded = workspace.degraded
+        if type_changed:
+            degraded = LLM_ENABLED and not all(
+                result_cache.contains(stage_cache_key(stage, request.query, workspace_type))
+                for stage in ["schema", "suggestions"]
+            )
+        body = save_workspace(workspace.model_copy(update={
+            "workspace_type": workspace_type,
+            "workspace_schema": schema,
+            "suggestions": suggestions,
+            "enabled_sources": sources,
+            "degraded": degraded,
+        }))
+        if LLM_ENABLED and not degraded:
+            # Otherwise creating the workspace again would serve, and store, the pre-refresh copy
+            result_cache.set(stage_cache_key("workspace", request.query), body)
+    logger.info(
+        f"Workspace {workspace.id} refreshed",
+        extra=fields(
+            regenerated=regenerated,
+            added=len(delta.added_suggestions),
+            removed=len(delta.removed_suggestions),
+        ),
+    )
+    return delta
+
+
+# Runs the schema's source queries server-side (ATLAS_SOURCES_BACKEND=mock for offline stand-ins)
+source_pipeline = create_source_pipeline()
+
+
+@app.post("/api/workspace/{workspace_id}/sources")
+async def fetch_workspace_sources(workspace_id: str, request: Optional[SourceFetchRequest] = None):
+    """
+    Run a stored workspace's source queries (for its enabled sources, or `sources` if given)
+    concurrently, streaming one NDJSON line per (source, query) result as each arrives.
+    """
+    body = workspace_store.get(workspace_id)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Workspace not found")
+    workspace = WorkspaceResponse.model_validate_json(body)
+    sources = request.sources if request and request.sources else workspace.enabled_sources
+    source_queries = {
+        source: queries
+        for source, queries in workspace.workspace_schema.source_queries.model_dump().items()
+        if source in sources and queries
+    }
+    
+    async def lines():
+        async for result in source_pipeline.stream(source_queries):
+            yield result.model_dump_json() + "\n"
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+# CUSTOMIZE THIS PROMPT: Batch classification prompt - keep the type list in sync with CLASSIFY_SYSTEM_PROMPT
+CLASSIFY_BATCH_SYSTEM_PROMPT = """You are a query classifier for a research workspace application called Atlas.
+Classify each numbered search query into the most appropriate workspace type.
+
+Workspace Types:
+- travel_research: trips, vacations, destinations, itineraries, hotels, flights, restaurants, attractions
+- purchase_research: buying products, comparing items, reviews, specifications, prices
+- learning_plan: learning skills, courses, tutorials, study plans, curriculum
+- project_planner: planning projects, organizing tasks, general planning
+
+Return ONLY valid JSON, no other text.
+Return a JSON array with one entry per query, in order:
+[{"index": 1, "workspace_type": "...", "confidence": 0.0-1.0, "rationale": "..."}, ...]"""
+
+CLASSIFY_BATCH_USER_PROMPT = """Classify each of these search queries:
+{numbered}"""
+
+# Queries per batched classification call
+CLASSIFY_BATCH_SIZE = int(os.getenv("ATLAS_BATCH_CLASSIFY_SIZE", "25"))
+
+prompt_registry.register(
+    "classify_batch",
+    CLASSIFY_BATCH_SYSTEM_PROMPT,
+    CLASSIFY_BATCH_USER_PROMPT,
+    max_output_tokens=max(1024, 96 * CLASSIFY_BATCH_SIZE),
+    response_schema=RESPONSE_SCHEMAS["classify_batch"],
+)
+
+
+async def _classify_chunk(queries: List[str]) -> Dict[str, WorkspaceType]:
+    """Classify up to CLASSIFY_BATCH_SIZE queries with one Gemini call"""
+    prompt = prompt_registry.get("classify_batch")
+    numbered = "\n".join(f'{i}. "{query}"' for i, query in enumerate(queries, start=1))
+    user_prompt = prompt.render(numbered=numbered)
+    classifications: Dict[str, WorkspaceType] = {}
+    try:
+        response_text = await generate_with(prompt, user_prompt)
+        for entry in parse_json_model(List[Dict[str, Any]], response_text):
+            try:
+                index = int(entry.pop("index")) - 1
+                if 0 <= index < len(queries):
+                    classifications[queries[index]] = WorkspaceType.model_validate(entry)
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning(f"Skipping invalid batch classification entry: {e}")
+    except Exception as e:
+        logger.warning(f"Batch classification error: {e}", extra=fields(stage="batch_classify"))
+    return classifications
+
+
+async def classify_queries_batch(queries: List[str]) -> Dict[str, WorkspaceType]:
+    """
+    Classify many queries, CLASSIFY_BATCH_SIZE per Gemini call.
+    Confident local and cached classifications are reused, and queries missing from a batch response
+    are classified individually.
+    """
+    if not LLM_ENABLED:
+        return {query: local_classify(query) for query in queries}
+    
+    classifications: Dict[str, WorkspaceType] = {}
+    pending = []
+    for query in queries:
+        local = local_classify(query)
+        if local.confidence >= LOCAL_CLASSIFIER_THRESHOLD:
+            classifications[query] = local
+            continue
+        cached = result_cache.get(stage_cache_key("classify", query))
+        if cached:
+            classifications[query] = WorkspaceType.model_validate_json(cached)
+        else:
+            pending.append(query)
+    
+    chunks = [pending[i:i + CLASSIFY_BATCH_SIZE] for i in range(0, len(pending), CLASSIFY_BATCH_SIZE)]
+    for chunk_result in await asyncio.gather(*[_classify_chunk(chunk) for chunk in chunks]):
+        for query, classification in chunk_result.items():
+            classifications[query] = classification
+            result_cache.set(stage_cache_key("classify", query), classification.model_dump_json())
+    
+    missing = [query for query in pending if query not in classifications]
+    if missing:
+        logger.info(f"Classifying {len(missing)} queries individually")
+        results = await asyncio.gather(*[classify_query(WorkspaceCreateRequest(query=q)) for q in missing])
+        classifications.update(zip(missing, results))
+    return classifications
+
+
+async def build_workspace_for(query: str, classification: WorkspaceType) -> dict:
+    """Generate schema and suggestions for an already-classified query"""
+    request = WorkspaceCreateRequest(query=query)
+    schema, suggestions = await asyncio.gather(
+        generate_schema(request, classification.workspace_type),
+        generate_suggestions(request, classification.workspace_type),
+    )
+    workspace = build_workspace(request, classification, schema, suggestions)
+    workspace.degraded = LLM_ENABLED and not stages_generated(request, classification)
+    save_workspace(workspace)
+    return workspace.model_dump(by_alias=True)
+
+
+@app.post("/api/workspace/batch", dependencies=[Depends(admit_llm_request)])
+async def create_workspaces_batch(request: BatchCreateRequest):
+    """
+    Create workspaces for many queries. Duplicate queries are dropped, classification
+    is done in batched prompts, and workspaces stream back as NDJSON (one per line,
+    in completion order) as soon as each one is ready.
+    """
+    async def lines():
+        results = run_batch(
+            request.queries,
+            classify_queries_batch,
+            build_workspace_for,
+            concurrency=max(1, request.concurrency),
+            per_minute=request.per_minute,
+        )
+        async for workspace in results:
+            yield json.dumps(workspace) + "\n"
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
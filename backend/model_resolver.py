@@ -0,0 +1,106 @@
+"""
+Model resolution for Atlas - caches Gemini model discovery and remembers which models work
+"""
+
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+
+class ModelResolver:
+    """
+    Decides which Gemini models call_gemini should try, and in what order.
+
+    The discovered model list is cached for `ttl` seconds. Once stale it is
+    refreshed on a background thread while callers keep using the old list,
+    so only the very first lookup waits on the network. The model that last
+    succeeded is tried first, and models that fail are skipped for a cooldown
+    that doubles with each consecutive failure (up to `max_cooldown`).
+    """
+
+    def __init__(
+        self,
+        list_models: Callable[[], List[str]],
+        fallback_models: List[str],
+        ttl: float = 600.0,
+        failure_cooldown: float = 30.0,
+        max_cooldown: float = 600.0,
+    ):
+        self._list_models = list_models
+        self._fallback_models = fallback_models
+        self.ttl = ttl
+        self.failure_cooldown = failure_cooldown
+        self.max_cooldown = max_cooldown
+
+        self._lock = threading.Lock()
+        self._available: Optional[List[str]] = None
+        self._fetched_at = 0.0
+        self._refreshing = False
+        self._last_good: Optional[str] = None
+        self._failures: Dict[str, int] = {}
+        self._blocked_until: Dict[str, float] = {}
+
+    def refresh(self) -> List[str]:
+        """Fetch the model list now, replacing the cached copy"""
+        try:
+            models = self._list_models()
+        finally:
+            with self._lock:
+                self._refreshing = False
+        with self._lock:
+            # An empty result usually means a transient listing error; keep the old list
+            if models or self._available is None:
+                self._available = models
+            self._fetched_at = time.monotonic()
+            return list(self._available)
+
+    def available_models(self) -> List[str]:
+        """Return the cached model list, refreshing it in the background when stale"""
+        with self._lock:
+            available = self._available
+            stale = time.monotonic() - self._fetched_at > self.ttl
+            start_refresh = available is not None and stale and not self._refreshing
+            if start_refresh:
+                self._refreshing = True
+        if available is None:
+            return self.refresh()
+        if start_refresh:
+            threading.Thread(target=self.refresh, name="model-refresh", daemon=True).start()
+        return list(available)
+
+    def candidates(self) -> List[str]:
+        """Ordered list of model names to try: last-good first, cooling-down models last"""
+        ordered: List[str] = []
+        if self._last_good:
+            ordered.append(self._last_good)
+        for name in self.available_models() + self._fallback_models:
+            if name not in ordered:
+                ordered.append(name)
+
+        now = time.monotonic()
+        with self._lock:
+            healthy = [m for m in ordered if self._blocked_until.get(m, 0.0) <= now]
+            cooling = [m for m in ordered if self._blocked_until.get(m, 0.0) > now]
+        # Cooling-down models stay at the end so a request never runs out of options
+        return healthy + cooling
+
+    def record_success(self, model_name: str) -> None:
+        """Pin a model as last-good and clear its failure history"""
+        with self._lock:
+            self._last_good = model_name
+            self._failures.pop(model_name, None)
+            self._blocked_until.pop(model_name, None)
+
+    def record_failure(self, model_name: str) -> None:
+        """Put a model on cooldown; repeated failures extend the cooldown"""
+        with self._lock:
+            count = self._failures.get(model_name, 0) + 1
+            self._failures[model_name] = count
+            cooldown = min(self.failure_cooldown * (2 ** (count - 1)), self.max_cooldown)
+            self._blocked_until[model_name] = time.monotonic() + cooldown
+            if self._last_good == model_name:
+                self._last_good = None
+
+    @property
+    def last_good(self) -> Optional[str]:
+        return self._last_good
@@ -0,0 +1,249 @@
+"""
+Adaptive model routing for Atlas - picks the best Gemini model per call and hedges slow ones
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+
+from observability import LLM_BREAKER_TRIPS, LLM_HEDGES
+
+
+class NoModelAvailableError(Exception):
+    """Raised when the router is given no models to try"""
+
+
+class ModelStats:
+    """Rolling latency/error statistics and circuit-breaker state for one model"""
+
+    def __init__(self, window: int):
+        self.ewma_latency: Optional[float] = None
+        self.ewma_error = 0.0
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.state = "closed"  # closed -> open -> half_open -> closed/open
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+
+    def p95(self) -> Optional[float]:
+        if len(self.latencies) < 10:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+
+class ModelRouter:
+    """
+    Routes each LLM call to the best-scoring model.
+
+    A model's score is its EWMA latency divided by its EWMA success rate, so it
+    approximates the expected time to a successful answer. If the chosen model
+    has not answered within its p95 latency (`default_hedge_delay` until there
+    are enough samples), a hedged duplicate is sent to the next-best model and
+    whichever succeeds first wins; the other is cancelled. A model whose calls
+    fail `breaker_threshold` times in a row is taken out of rotation for
+    `breaker_cooldown` seconds, then gets a single trial call (half-open).
+    A cancelled call (a hedge loser) took at least as long as it ran, so its
+    elapsed time counts as a latency sample when that is slower than usual;
+    a model that starts hanging is demoted instead of being hedged forever.
+
+    Errors matching `passthrough` (main.py passes 429s and its own limiter's
+    RateLimitExceeded) are raised to the caller as they are: they say nothing
+    about the model's health, and trying the next model would only spread the
+    overload. A hedge refused that way is dropped and the primary carries on.
+    """
+
+    def __init__(
+        self,
+        alpha: float = 0.2,
+        window: int = 200,
+        breaker_threshold: int = 5,
+        breaker_cooldown: float = 30.0,
+        hedging: bool = True,
+        default_hedge_delay: float = 5.0,
+        min_hedge_delay: float = 0.5,
+        prior_latency: float = 2.0,
+        passthrough: Optional[Callable[[BaseException], bool]] = None,
+    ):
+        self.alpha = alpha
+        self.window = window
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.hedging = hedging
+        self.default_hedge_delay = default_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.prior_latency = prior_latency
+        self.passthrough = passthrough or (lambda error: False)
+        self._stats: Dict[str, ModelStats] = {}
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.breaker_trips = 0
+
+    def _get(self, model: str) -> ModelStats:
+        stats = self._stats.get(model)
+        if stats is None:
+            stats = self._stats[model] = ModelStats(self.window)
+        return stats
+
+    def score(self, model: str) -> float:
+        stats = self._get(model)
+        latency = stats.ewma_latency if stats.ewma_latency is not None else self.prior_latency
+        return latency / max(0.05, 1.0 - stats.ewma_error)
+
+    def _available(self, model: str, now: float) -> bool:
+        stats = self._get(model)
+        if stats.state == "closed":
+            return True
+        if stats.state == "open" and now - stats.opened_at >= self.breaker_cooldown:
+            stats.state = "half_open"
+        return stats.state == "half_open" and not stats.trial_in_flight
+
+    def rank(self, models: List[str]) -> List[str]:
+        """Models in the order to try them; models with an open breaker go last"""
+        now = time.monotonic()
+        unique = list(dict.fromkeys(models))
+        available = [m for m in unique if self._available(m, now)]
+        tripped = [m for m in unique if m not in available]
+        # sorted() is stable, so ties keep the caller's (resolver's) order
+        return sorted(available, key=self.score) + sorted(tripped, key=lambda m: self._get(m).opened_at)
+
+    def hedge_delay(self, model: str) -> float:
+        p95 = self._get(model).p95()
+        return max(self.min_hedge_delay, p95 if p95 is not None else self.default_hedge_delay)
+
+    def record(self, model: str, latency: float, ok: bool) -> None:
+        stats = self._get(model)
+        stats.trial_in_flight = False
+        stats.ewma_error = self.alpha * (0.0 if ok else 1.0) + (1 - self.alpha) * stats.ewma_error
+        if ok:
+            stats.latencies.append(latency)
+            stats.ewma_latency = (
+                latency if stats.ewma_latency is None
+                else self.alpha * latency + (1 - self.alpha) * stats.ewma_latency
+            )
+            stats.consecutive_failures = 0
+            stats.state = "closed"
+            return
+        stats.consecutive_failures += 1
+        if stats.state == "half_open" or stats.consecutive_failures >= self.breaker_threshold:
+            if stats.state != "open":
+                self.breaker_trips += 1
+                LLM_BREAKER_TRIPS.inc(model=model)
+            stats.state = "open"
+            stats.opened_at = time.monotonic()
+
+    def record_cancelled(self, model: str, elapsed: float) -> None:
+        """
+        A call cancelled after `elapsed` seconds. Its latency is censored: at
+        least `elapsed`, so it only moves the statistics when it is above the
+        current average. Neither a success nor a failure for the breaker.
+        """
+        stats = self._get(model)
+        stats.trial_in_flight = False
+        if stats.ewma_latency is not None and elapsed <= stats.ewma_latency:
+            return
+        stats.latencies.append(elapsed)
+        stats.ewma_latency = (
+            elapsed if stats.ewma_latency is None
+            else self.alpha * elapsed + (1 - self.alpha) * stats.ewma_latency
+        )
+
+    async def _attempt(
+        self,
+        model: str,
+        call: Callable[[str], Awaitable[str]],
+        admit: Optional[Callable[[], Awaitable[None]]] = None,
+    ) -> str:
+        if admit is not None:
+            # Waiting for admission (e.g. a rate limiter) is neither the model's latency nor its failure
+            await admit()
+        stats = self._get(model)
+        if stats.state == "half_open":
+            stats.trial_in_flight = True
+        start = time.monotonic()
+        try:
+            result = await call(model)
+        except asyncio.CancelledError:
+            self.record_cancelled(model, time.monotonic() - start)
+            raise
+        except Exception as e:
+            if self.passthrough(e):
+                stats.trial_in_flight = False
+            else:
+                self.record(model, time.monotonic() - start, ok=False)
+            raise
+        self.record(model, time.monotonic() - start, ok=True)
+        return result
+
+    async def call(
+        self,
+        models: List[str],
+        call: Callable[[str], Awaitable[str]],
+        admit: Optional[Callable[[], Awaitable[None]]] = None,
+    ) -> str:
+        """
+        Run `call(model)` on the best model, hedging once if it is slow and falling
+        through the ranking on errors. Raises the last error if every model fails.
+        `admit()` is awaited before each attempt, outside its timing.
+        """
+        queue = self.rank(models)
+        if not queue:
+            raise NoModelAvailableError("No models to route to")
+
+        pending: Dict[asyncio.Future, str] = {}
+        hedged = False
+        last_error: Optional[BaseException] = None
+
+        def launch(model: str) -> None:
+            pending[asyncio.ensure_future(self._attempt(model, call, admit))] = model
+
+        launch(queue.pop(0))
+        primary = next(iter(pending))
+        try:
+            while pending:
+                timeout = None
+                if self.hedging and not hedged and len(pending) == 1:
+                    timeout = self.hedge_delay(next(iter(pending.values())))
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Primary is past its p95: race a duplicate on the next-best model
+                    hedged = True
+                    self.hedges += 1
+                    launch(queue.pop(0) if queue else next(iter(pending.values())))
+                    continue
+                for task in done:
+                    pending.pop(task)
+                    if task.exception() is None:
+                        if hedged:
+                            won = task is not primary
+                            self.hedge_wins += won
+                            LLM_HEDGES.inc(outcome="won" if won else "lost")
+                        return task.result()
+                    last_error = task.exception()
+                    if self.passthrough(last_error):
+                        queue.clear()
+                if not pending and queue:
+                    launch(queue.pop(0))
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def snapshot(self) -> dict:
+        """Per-model routing state, for the stats endpoint"""
+        return {
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "breaker_trips": self.breaker_trips,
+            "models": {
+                model: {
+                    "score": round(self.score(model), 4),
+                    "ewma_latency": stats.ewma_latency,
+                    "ewma_error": round(stats.ewma_error, 4),
+                    "p95": stats.p95(),
+                    "state": stats.state,
+                }
+                for model, stats in self._stats.items()
+            },
+        }
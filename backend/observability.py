@@ -0,0 +1,261 @@
+"""
+Observability for Atlas - Prometheus-style metrics and structured logging
+"""
+
+import functools
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (16, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value:g}")
+        return lines
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelValues, List[float]] = {}  # bucket counts..., count, sum
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0.0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    labels = _format_labels(self.label_names, key, f'le="{bound:g}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative:g}")
+                labels = _format_labels(self.label_names, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {series[-2]:g}")
+                plain = _format_labels(self.label_names, key)
+                lines.append(f"{self.name}_count{plain} {series[-2]:g}")
+                lines.append(f"{self.name}_sum{plain} {series[-1]:g}")
+        return lines
+
+
+class Registry:
+    """Holds metrics and renders them in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help_text, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        metric = Histogram(name, help_text, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_DURATION = REGISTRY.histogram(
+    "atlas_stage_duration_seconds", "Time spent in each workspace stage", ["stage"]
+)
+STAGE_RESULTS = REGISTRY.counter(
+    "atlas_stage_results_total", "Stage results by where they came from", ["stage", "source"]
+)
+PARSE_DURATION = REGISTRY.histogram(
+    "atlas_parse_duration_seconds", "Time spent parsing and validating LLM output (one pass)", ["stage"]
+)
+JSON_REPAIRS = REGISTRY.counter(
+    "atlas_json_repairs_total", "LLM responses that needed a local JSON repair pass", ["outcome"]
+)
+LLM_CALL_DURATION = REGISTRY.histogram(
+    "atlas_llm_call_duration_seconds", "Upstream LLM call latency", ["backend", "outcome"]
+)
+LLM_ATTEMPTS = REGISTRY.counter(
+    "atlas_llm_attempts_total", "Upstream model attempts, including retries on other models", ["model", "outcome"]
+)
+LLM_RETRIES = REGISTRY.histogram(
+    "atlas_llm_retries",
+    "Extra upstream attempts per LLM call (429 retries, failovers, hedges)",
+    ["backend"],
+    buckets=(0, 1, 2, 3, 5, 8),
+)
+LLM_HEDGES = REGISTRY.counter(
+    "atlas_llm_hedges_total", "Hedged duplicate LLM calls, by whether the hedge answered first", ["outcome"]
+)
+LLM_BREAKER_TRIPS = REGISTRY.counter(
+    "atlas_llm_breaker_trips_total", "Times a model's circuit breaker opened", ["model"]
+)
+NEAR_DUP_LOOKUPS = REGISTRY.counter(
+    "atlas_near_duplicate_lookups_total", "Near-duplicate query lookups on workspace cache misses", ["outcome"]
+)
+PROMPT_CALL_DURATION = REGISTRY.histogram(
+    "atlas_prompt_call_duration_seconds", "LLM call latency by stage and prompt variant", ["stage", "variant"]
+)
+LLM_PROMPT_TOKENS = REGISTRY.histogram(
+    "atlas_llm_prompt_tokens", "Prompt size per LLM call (estimated tokens)", ["backend"], buckets=TOKEN_BUCKETS
+)
+LLM_RESPONSE_TOKENS = REGISTRY.histogram(
+    "atlas_llm_response_tokens", "Response size per LLM call (estimated tokens)", ["backend"], buckets=TOKEN_BUCKETS
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English text)"""
+    return (len(text) + 3) // 4
+
+
+def timed_stage(stage: str):
+    """Decorator recording an async stage's duration in STAGE_DURATION"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with STAGE_DURATION.time(stage=stage):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; fields passed as extra={"fields": {...}} are merged in"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level: str = "INFO", fmt: str = "json") -> None:
+    handler = logging.StreamHandler(sys.stderr)
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    logger = logging.getLogger("atlas")
+    logger.handlers[:] = [handler]
+    logger.setLevel(level.upper())
+    logger.propagate = False
+
+
+def should_log_prompt(logger: logging.Logger, sample_rate: float) -> bool:
+    """Log full prompt bodies only in debug mode or for a sampled fraction of calls"""
+    return logger.isEnabledFor(logging.DEBUG) or (sample_rate > 0 and random.random() < sample_rate)
+
+
+def fields(**values) -> Dict[str, Dict]:
+    """Shorthand for structured log fields: logger.info("...", extra=fields(stage="schema"))"""
+    return {"fields": values}
+
+
+def observe_llm_call(
+    backend: str, duration: float, prompt: str, response: Optional[str], outcome: str = "ok"
+) -> None:
+    LLM_CALL_DURATION.observe(duration, backend=backend, outcome=outcome)
+    LLM_PROMPT_TOKENS.observe(estimate_tokens(prompt), backend=backend)
+    if response is not None:
+        LLM_RESPONSE_TOKENS.observe(estimate_tokens(response), backend=backend)
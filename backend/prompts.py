@@ -0,0 +1,106 @@
+"""
+Prompt registry for Atlas - every stage's prompt templates, their versions, sizes and output budgets
+"""
+
+import os
+from typing import Dict, List, Optional
+
+from observability import estimate_tokens
+from result_cache import content_hash, normalize_query
+
+FULL = "full"
+COMPACT = "compact"
+
+
+class PromptTemplate:
+    """
+    One stage's prompts: a fixed system instruction and a `str.format` user
+    template. `version` is a content hash of both (so editing either
+    invalidates cached results), and the token counts are measured once,
+    when the template is registered.
+    """
+
+    def __init__(
+        self,
+        stage: str,
+        system: str,
+        user: str,
+        variant: str = FULL,
+        max_output_tokens: Optional[int] = None,
+        response_schema: Optional[dict] = None,
+    ):
+        self.stage = stage
+        self.system = system
+        self.user = user
+        self.variant = variant
+        self.max_output_tokens = max_output_tokens
+        self.response_schema = response_schema
+        self.version = content_hash(system, user)
+        self.system_tokens = estimate_tokens(system)
+        self.user_tokens = estimate_tokens(user)
+
+    def render(self, **values) -> str:
+        return self.user.format(**values)
+
+    def describe(self) -> Dict:
+        return {
+            "stage": self.stage,
+            "variant": self.variant,
+            "version": self.version,
+            "system_tokens": self.system_tokens,
+            "user_template_tokens": self.user_tokens,
+            "max_output_tokens": self.max_output_tokens,
+        }
+
+
+class PromptRegistry:
+    """
+    Prompt templates by stage and variant, registered once at import time.
+
+    Stages may register a compact variant next to the full one. A fraction
+    `compact_fraction` of queries get the compact prompts, chosen by a hash
+    of the normalized query so a query always sees the same variant (and
+    the same cache entries); `force_variant` overrides that for every query.
+    Output budgets come from ATLAS_MAX_OUTPUT_TOKENS_<STAGE> when set,
+    otherwise from the default given at registration.
+    """
+
+    def __init__(self, compact_fraction: float = 0.0, force_variant: Optional[str] = None):
+        self.compact_fraction = compact_fraction
+        self.force_variant = force_variant
+        self._templates: Dict[str, Dict[str, PromptTemplate]] = {}
+
+    def register(
+        self,
+        stage: str,
+        system: str,
+        user: str,
+        variant: str = FULL,
+        max_output_tokens: Optional[int] = None,
+        response_schema: Optional[dict] = None,
+    ) -> PromptTemplate:
+        budget = os.getenv(f"ATLAS_MAX_OUTPUT_TOKENS_{stage.upper()}")
+        if budget is not None:
+            max_output_tokens = int(budget) or None
+        template = PromptTemplate(stage, system, user, variant, max_output_tokens, response_schema)
+        self._templates.setdefault(stage, {})[variant] = template
+        return template
+
+    def variant_for(self, query: str) -> str:
+        if self.force_variant:
+            return self.force_variant
+        if self.compact_fraction <= 0:
+            return FULL
+        bucket = int(content_hash("prompt-variant", normalize_query(query)), 16) / 16 ** 16
+        return COMPACT if bucket < self.compact_fraction else FULL
+
+    def get(self, stage: str, query: str = "") -> PromptTemplate:
+        """The template `query` gets for `stage`; the full one if the stage has no such variant"""
+        variants = self._templates[stage]
+        return variants.get(self.variant_for(query)) or variants[FULL]
+
+    def version(self, stage: str, query: str = "") -> str:
+        return self.get(stage, query).version
+
+    def describe(self) -> List[Dict]:
+        return [t.describe() for variants in self._templates.values() for t in variants.values()]
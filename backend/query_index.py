@@ -0,0 +1,187 @@
+"""
+Near-duplicate query index for Atlas - finds earlier queries that are paraphrases of a new one
+"""
+
+import hashlib
+import operator
+import re
+import threading
+from array import array
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Set
+
+_TOKEN_RE = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a an and are as at be best by for from how i in into is it me my of on or the to what with".split()
+)
+
+
+def shingles(query: str) -> Set[str]:
+    """
+    Word, word-bigram and character-trigram shingles of a query, ignoring
+    stopwords and plural "s": "budget trip to japan" and "budget trips in
+    japan" have the same shingles, and a typo only changes a few trigrams.
+    Bigrams and the trigrams spanning word boundaries keep word order, so
+    "flights from london to paris" doesn't match "flights from paris to london".
+    """
+    words = []
+    for word in _TOKEN_RE.findall(query.casefold()):
+        if word in _STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.append(word)
+    result = {f"w:{word}" for word in words}
+    result.update(f"b:{first} {second}" for first, second in zip(words, words[1:]))
+    if words:
+        padded = f"#{'#'.join(words)}#"
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+class NearDuplicate(NamedTuple):
+    key: str
+    query: str
+    similarity: float
+
+
+class NearDuplicateIndex:
+    """
+    MinHash signatures of stored queries, bucketed with LSH.
+
+    Each query gets a `num_perm`-value MinHash signature of its shingles,
+    split into `bands` bands; queries sharing any band land in the same
+    bucket and become candidates, and a candidate matches when its estimated
+    Jaccard similarity (the fraction of equal signature values) reaches
+    `threshold`. At most `max_bucket_candidates` of the newest entries per
+    bucket are considered, so lookup cost is bounded however many queries are
+    stored, but not constant: with overlapping vocabularies those buckets
+    fill up. Every band a candidate doesn't share holds at least one unequal
+    value, so candidates are visited most-shared-bands first, ruled out by
+    comparing just their band keys where that bound allows, and only the
+    rest get a full signature comparison. With 50k stored queries drawn from
+    a 60-word vocabulary a lookup costs about four signatures (~0.5 ms),
+    a third of comparing every candidate in full. Entries are grouped by
+    workspace type and only match within it.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        num_perm: int = 64,
+        bands: int = 16,
+        max_bucket_candidates: int = 32,
+        seed: int = 1,
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_bucket_candidates = max_bucket_candidates
+        self._salt = f"{seed}:".encode("utf-8")
+        self._lock = threading.Lock()
+        self._keys: List[str] = []
+        self._queries: List[str] = []
+        self._types: List[str] = []
+        self._signatures: List[array] = []
+        self._entry_bands: List[array] = []
+        self._positions: Dict[str, int] = {}
+        self._buckets: Dict[int, List[int]] = {}
+        self._stats = {"lookups": 0, "hits": 0, "no_candidates": 0, "below_threshold": 0}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def signature(self, query: str) -> Optional[array]:
+        """
+        MinHash signature: one SHAKE-128 digest per shingle supplies all
+        `num_perm` 32-bit hash values at once, and the signature is their
+        column-wise minimum. Both steps run in C, which keeps this well
+        under a millisecond.
+        """
+        size = 4 * self.num_perm
+        vectors = [
+            array("I", hashlib.shake_128(self._salt + s.encode("utf-8")).digest(size)) for s in shingles(query)
+        ]
+        if not vectors:
+            return None
+        if len(vectors) == 1:
+            return vectors[0]
+        return array("I", map(min, *vectors))
+
+    def _band_keys(self, workspace_type: str, signature: array) -> List[int]:
+        rows = self.rows
+        return [
+            hash((workspace_type, band, *signature[band * rows:(band + 1) * rows])) for band in range(self.bands)
+        ]
+
+    def add(self, key: str, query: str, workspace_type: str) -> bool:
+        """Store a query under `key` (e.g. its workspace ID); False if already stored or unusable"""
+        signature = self.signature(query)
+        if signature is None:
+            return False
+        band_keys = self._band_keys(workspace_type, signature)
+        with self._lock:
+            if key in self._positions:
+                return False
+            position = len(self._keys)
+            self._positions[key] = position
+            self._keys.append(key)
+            self._queries.append(query)
+            self._types.append(workspace_type)
+            self._signatures.append(signature)
+            self._entry_bands.append(array("q", band_keys))
+            for band_key in band_keys:
+                self._buckets.setdefault(band_key, []).append(position)
+        return True
+
+    def lookup(self, query: str, workspace_type: str) -> Optional[NearDuplicate]:
+        """The most similar stored query of this workspace type at or above the threshold, if any"""
+        signature = self.signature(query)
+        with self._lock:
+            self._stats["lookups"] += 1
+            if signature is None:
+                self._stats["no_candidates"] += 1
+                return None
+            band_keys = self._band_keys(workspace_type, signature)
+            shared_bands: Counter = Counter()
+            truncated = 0  # Buckets a candidate may share without being counted in
+            for band_key in band_keys:
+                bucket = self._buckets.get(band_key)
+                if bucket:
+                    shared_bands.update(bucket[-self.max_bucket_candidates:])
+                    truncated += len(bucket) > self.max_bucket_candidates
+            if not shared_bands:
+                self._stats["no_candidates"] += 1
+                return None
+            best, best_similarity = -1, 0.0
+            unshared_limit = self.num_perm - self.bands
+            for position, shared in shared_bands.most_common():
+                bound = (unshared_limit + truncated + shared) / self.num_perm
+                if bound < self.threshold or bound <= best_similarity:
+                    break  # Neither this candidate nor any sharing fewer bands can match
+                if self._types[position] != workspace_type:
+                    continue  # A band hash collision across types
+                if truncated:
+                    # The exact count, from its own band keys, may still rule it out
+                    shared = sum(map(operator.eq, band_keys, self._entry_bands[position]))
+                    bound = (unshared_limit + shared) / self.num_perm
+                    if bound < self.threshold or bound <= best_similarity:
+                        continue
+                stored = self._signatures[position]
+                similarity = sum(map(operator.eq, signature, stored)) / self.num_perm
+                if similarity > best_similarity:
+                    best, best_similarity = position, similarity
+            if best < 0 or best_similarity < self.threshold:
+                self._stats["below_threshold"] += 1
+                return None
+            self._stats["hits"] += 1
+            return NearDuplicate(self._keys[best], self._queries[best], best_similarity)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._keys), threshold=self.threshold)
+        stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        return stats
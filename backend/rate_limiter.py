@@ -0,0 +1,196 @@
+"""
+Upstream rate limiting for Atlas - token buckets, priority admission and 429 backoff
+"""
+
+import asyncio
+import heapq
+import itertools
+import random
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional
+
+# Lower numbers are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+# Priority for LLM calls made from the current task; batch work overrides it
+llm_priority: ContextVar[int] = ContextVar("llm_priority", default=PRIORITY_INTERACTIVE)
+
+
+@contextmanager
+def use_priority(priority: int) -> Iterator[None]:
+    token = llm_priority.set(priority)
+    try:
+        yield
+    finally:
+        llm_priority.reset(token)
+
+
+class RateLimitExceeded(Exception):
+    """Raised when the upstream queue is full; maps to HTTP 429"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Refills at `per_minute` units per minute up to `capacity` (a minute's worth by default)"""
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` units are available (0 if they are now)"""
+        self._refill(now)
+        # Requests bigger than the bucket wait for a full bucket rather than forever
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.level -= min(amount, self.capacity)
+
+
+class UpstreamLimiter:
+    """
+    Admission control for upstream LLM calls, shared by every stage.
+
+    Each call waits until both the request bucket (`requests_per_minute`) and
+    the token bucket (`tokens_per_minute`, charged with the call's estimated
+    size) have room. Waiters are served strictly by priority, then arrival, so
+    interactive calls overtake queued batch work. If `max_queue` callers are
+    already waiting, `acquire` raises RateLimitExceeded at once rather than
+    letting requests pile up. `pause()` stops all calls for a while, e.g.
+    after the upstream answered 429 with a retry-after.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_queue: int = 256,
+    ):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_queue = max_queue
+        self._waiters: List[tuple] = []  # heap of (priority, seq, entry)
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._changed: Optional[asyncio.Condition] = None
+        self.admitted = 0
+        self.rejected = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.requests or self.tokens)
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> float:
+        """Rough wait a rejected caller should be told to back off for"""
+        interval = 1.0 / self.requests.rate if self.requests else 1.0
+        return max(1.0, self._paused_until - time.monotonic(), self.queued * interval)
+
+    def check_admission(self) -> None:
+        """Fail fast when the queue is full, before a request does any work"""
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise RateLimitExceeded("Too many queued LLM requests", self.retry_after())
+
+    def _wait_time(self, tokens: float) -> float:
+        now = time.monotonic()
+        waits = [self._paused_until - now]
+        if self.requests:
+            waits.append(self.requests.wait_time(1, now))
+        if self.tokens:
+            waits.append(self.tokens.wait_time(tokens, now))
+        return max(waits)
+
+    async def acquire(self, tokens: float = 0.0, priority: Optional[int] = None) -> None:
+        """Wait for a slot for one upstream call of roughly `tokens` tokens"""
+        if not self.enabled:
+            return
+        self.check_admission()
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        priority = llm_priority.get() if priority is None else priority
+        entry = object()
+        async with self._changed:
+            heapq.heappush(self._waiters, (priority, next(self._seq), entry))
+            self._changed.notify_all()
+            try:
+                while True:
+                    if self._waiters[0][2] is entry:
+                        wait = self._wait_time(tokens)
+                        if wait <= 0:
+                            heapq.heappop(self._waiters)
+                            if self.requests:
+                                self.requests.take(1)
+                            if self.tokens:
+                                self.tokens.take(tokens)
+                            self.admitted += 1
+                            self._changed.notify_all()
+                            return
+                        try:
+                            await asyncio.wait_for(self._changed.wait(), wait)
+                        except asyncio.TimeoutError:
+                            pass
+                    else:
+                        await self._changed.wait()
+            except BaseException:
+                # Cancelled or timed out while queued: give up our place
+                if any(e is entry for _, _, e in self._waiters):
+                    self._waiters = [w for w in self._waiters if w[2] is not entry]
+                    heapq.heapify(self._waiters)
+                    self._changed.notify_all()
+                raise
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every caller for `seconds` (extends, never shortens, a pause)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "paused_for": max(0.0, round(self._paused_until - time.monotonic(), 3)),
+        }
+
+
+_RETRY_AFTER_RE = re.compile(r"retry[ _-]?(?:after|delay|in)\D{0,20}?(\d+(?:\.\d+)?)", re.I)
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """Whether an upstream error is a 429 / quota error (google.api_core or otherwise)"""
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if code == 429:
+        return True
+    text = str(error).lower()
+    return "429" in text or "resource has been exhausted" in text or "quota" in text
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Server-suggested wait in seconds, if the error carries one"""
+    value = getattr(error, "retry_after", None)
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _RETRY_AFTER_RE.search(str(error))
+    return float(match.group(1)) if match else None
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    """Full-jitter exponential backoff for retry number `attempt` (0-based)"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
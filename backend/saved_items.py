@@ -0,0 +1,279 @@
+"""
+Saved items for Atlas - storage and full-text search over items saved from workspaces
+"""
+
+import bisect
+import heapq
+import json
+import math
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from result_cache import content_hash
+
+_TOKEN_RE = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from in into is it of on or that the this to with".split()
+)
+# Title terms count this many times over notes terms (a cheap BM25F)
+TITLE_WEIGHT = 2
+# How many completions of a partial last word a prefix search tries
+PREFIX_EXPANSIONS = 16
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens, minus a few stopwords"""
+    return [t for t in _TOKEN_RE.findall(text.casefold()) if t not in _STOPWORDS]
+
+
+def normalize_tag(tag: str) -> str:
+    return " ".join(tag.casefold().split())
+
+
+def saved_item_id(workspace_id: str, item_type: str, title: str) -> str:
+    """Stable ID: saving the same item to a workspace again updates it in place"""
+    return f"item_{content_hash('saved_item', workspace_id, item_type, normalize_tag(title))}"
+
+
+class SearchIndex:
+    """
+    Inverted index with BM25 ranking.
+
+    Postings map each term to {doc id: term frequency}; tags and workspaces
+    have their own exact-match indexes for filtering, and a sorted vocabulary
+    serves prefix lookups. `add` and `remove` update all of these in place,
+    so the index never has to be rebuilt. Not thread-safe; callers lock.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._terms: List[str] = []  # sorted vocabulary, for prefix search
+        self._doc_terms: Dict[str, Counter] = {}
+        self._doc_length: Dict[str, int] = {}
+        self._doc_tags: Dict[str, Tuple[str, ...]] = {}
+        self._doc_workspace: Dict[str, str] = {}
+        self._doc_updated: Dict[str, float] = {}
+        self._tags: Dict[str, Set[str]] = {}
+        self._workspaces: Dict[str, Set[str]] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._doc_terms
+
+    def add(
+        self,
+        doc_id: str,
+        workspace_id: str,
+        title: str,
+        notes: str = "",
+        tags: Iterable[str] = (),
+        updated_at: float = 0.0,
+    ) -> None:
+        """Index a document, replacing any earlier version with the same ID"""
+        self.remove(doc_id)
+        tags = tuple(dict.fromkeys(normalize_tag(t) for t in tags if t.strip()))
+        terms = Counter(tokenize(title) * TITLE_WEIGHT + tokenize(notes))
+        for tag in tags:
+            terms.update(tokenize(tag))
+        for term, tf in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                bisect.insort(self._terms, term)
+            postings[doc_id] = tf
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(doc_id)
+        self._workspaces.setdefault(workspace_id, set()).add(doc_id)
+        self._doc_terms[doc_id] = terms
+        self._doc_length[doc_id] = sum(terms.values())
+        self._doc_tags[doc_id] = tags
+        self._doc_workspace[doc_id] = workspace_id
+        self._doc_updated[doc_id] = updated_at
+        self._total_length += self._doc_length[doc_id]
+
+    def remove(self, doc_id: str) -> bool:
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return False
+        for term in terms:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+                del self._terms[bisect.bisect_left(self._terms, term)]
+        for tag in self._doc_tags.pop(doc_id):
+            _discard(self._tags, tag, doc_id)
+        _discard(self._workspaces, self._doc_workspace.pop(doc_id), doc_id)
+        del self._doc_updated[doc_id]
+        self._total_length -= self._doc_length.pop(doc_id)
+        return True
+
+    def complete(self, prefix: str, limit: int = 10) -> List[str]:
+        """Autocomplete for a partial word: matching terms, most common first"""
+        prefix = prefix.casefold().strip()
+        if not prefix:
+            return []
+        start = bisect.bisect_left(self._terms, prefix)
+        end = bisect.bisect_left(self._terms, prefix + "\U0010ffff")
+        return heapq.nlargest(limit, self._terms[start:end], key=lambda t: len(self._postings[t]))
+
+    def search(
+        self,
+        query: str = "",
+        tags: Iterable[str] = (),
+        workspace_id: Optional[str] = None,
+        limit: int = 20,
+        prefix: bool = False,
+    ) -> List[Tuple[str, float]]:
+        """
+        (doc id, score) pairs, best first. Documents must carry every tag in
+        `tags` (and belong to `workspace_id`, if given); with no query text
+        they come back newest first with score 0. With `prefix`, the query's
+        last word also matches longer terms (search-as-you-type).
+        """
+        allowed = self._filter(tags, workspace_id)
+        if allowed is not None and not allowed:
+            return []
+        terms = tokenize(query)
+        if not terms:
+            docs = allowed if allowed is not None else self._doc_terms.keys()
+            newest = heapq.nlargest(limit, docs, key=self._doc_updated.__getitem__)
+            return [(doc_id, 0.0) for doc_id in newest]
+
+        if prefix:
+            # The last word's most common completions; rare ones would cost more than they add
+            terms = terms[:-1] + self.complete(terms[-1], PREFIX_EXPANSIONS)
+        n = len(self._doc_terms)
+        avg_length = self._total_length / n if n else 0.0
+        lengths = self._doc_length
+        scores: Dict[str, float] = {}
+        for term in dict.fromkeys(terms):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                length_norm = 1 - self.b + self.b * lengths[doc_id] / avg_length
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+    def _filter(self, tags: Iterable[str], workspace_id: Optional[str]) -> Optional[Set[str]]:
+        """IDs allowed by the tag/workspace filters, or None for no filter"""
+        sets = [self._tags.get(normalize_tag(t), set()) for t in tags]
+        if workspace_id is not None:
+            sets.append(self._workspaces.get(workspace_id, set()))
+        if not sets:
+            return None
+        sets.sort(key=len)
+        return sets[0].intersection(*sets[1:])
+
+    def stats(self) -> Dict[str, int]:
+        return {"documents": len(self._doc_terms), "terms": len(self._terms), "tags": len(self._tags)}
+
+
+def _discard(index: Dict[str, Set[str]], key: str, doc_id: str) -> None:
+    docs = index.get(key)
+    if docs is not None:
+        docs.discard(doc_id)
+        if not docs:
+            del index[key]
+
+
+class SavedItemStore:
+    """
+    Saved items as JSON, keyed by ID, plus a SearchIndex over their title,
+    notes and tags.
+
+    Everything is held in memory and indexed incrementally on `put`/`delete`;
+    with `db_path` items are also written to SQLite (WAL; it can be the
+    workspace store's file) and the index is rebuilt from it on startup.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self._lock = threading.Lock()
+        self._items: Dict[str, str] = {}
+        self.index = SearchIndex()
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS saved_items (
+                    id TEXT PRIMARY KEY,
+                    workspace_id TEXT NOT NULL,
+                    body TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS saved_items_workspace ON saved_items (workspace_id, updated_at);
+                """
+            )
+            for item_id, workspace_id, body, updated_at in self._db.execute(
+                "SELECT id, workspace_id, body, updated_at FROM saved_items"
+            ):
+                self._index(item_id, workspace_id, body, updated_at)
+
+    def _index(self, item_id: str, workspace_id: str, body: str, updated_at: float) -> None:
+        item = json.loads(body)
+        self._items[item_id] = body
+        self.index.add(
+            item_id, workspace_id, item.get("title", ""), item.get("notes") or "", item.get("tags") or [], updated_at
+        )
+
+    def put(self, item_id: str, workspace_id: str, body: str) -> None:
+        """Store (or replace) an item's JSON body and index it"""
+        now = time.time()
+        with self._lock:
+            self._index(item_id, workspace_id, body, now)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT INTO saved_items (id, workspace_id, body, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET body = excluded.body, updated_at = excluded.updated_at",
+                    (item_id, workspace_id, body, now),
+                )
+
+    def get(self, item_id: str) -> Optional[str]:
+        return self._items.get(item_id)
+
+    def delete(self, item_id: str) -> bool:
+        with self._lock:
+            if self._items.pop(item_id, None) is None:
+                return False
+            self.index.remove(item_id)
+            if self._db is not None:
+                self._db.execute("DELETE FROM saved_items WHERE id = ?", (item_id,))
+            return True
+
+    def list(self, workspace_id: str) -> List[str]:
+        """A workspace's item bodies, newest first"""
+        with self._lock:
+            return [self._items[item_id] for item_id, _ in self.index.search(workspace_id=workspace_id, limit=10**9)]
+
+    def search(self, query: str = "", **kwargs) -> List[Tuple[str, float]]:
+        """(item body, score) pairs for SearchIndex.search"""
+        with self._lock:
+            return [(self._items[item_id], score) for item_id, score in self.index.search(query, **kwargs)]
+
+    def complete(self, prefix: str, limit: int = 10) -> List[str]:
+        with self._lock:
+            return self.index.complete(prefix, limit)
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def stats(self) -> Dict[str, int]:
+        return self.index.stats()
@@ -0,0 +1,73 @@
+"""
+Schema templates for Atlas - the fixed workspace layout of each workspace type
+"""
+
+from typing import Dict, Iterable, List, Mapping, Optional
+
+from result_cache import content_hash
+
+# Every workspace has these, ahead of its type's own modules
+BASE_MODULES = ("sources_panel", "saved_panel", "suggestions_panel")
+
+
+class SchemaTemplate:
+    """
+    A workspace type's schema skeleton: its modules and recommended sources.
+
+    Only the title and the per-source search queries depend on the query;
+    `render` fills those into the skeleton, keeping queries for recommended
+    sources only. `version` is a content hash of the skeleton, so editing a
+    template invalidates schemas cached for that type.
+    """
+
+    def __init__(self, workspace_type: str, modules: Iterable[str], recommended_sources: Iterable[str]):
+        self.workspace_type = workspace_type
+        self.modules = BASE_MODULES + tuple(modules)
+        self.recommended_sources = tuple(recommended_sources)
+        self.version = content_hash(workspace_type, *self.modules, "|", *self.recommended_sources)
+        self.default_title = f"{workspace_type.replace('_', ' ').title()} Workspace"
+
+    def render(self, title: str = "", source_queries: Optional[Mapping[str, Optional[List[str]]]] = None) -> Dict:
+        """The full schema as a dict, ready for WorkspaceSchema validation"""
+        source_queries = source_queries or {}
+        return {
+            "title": title.strip() or self.default_title,
+            "modules": [{"type": module} for module in self.modules],
+            "recommended_sources": list(self.recommended_sources),
+            "source_queries": {
+                source: source_queries[source] for source in self.recommended_sources if source_queries.get(source)
+            },
+        }
+
+    def describe(self) -> Dict:
+        return {
+            "workspace_type": self.workspace_type,
+            "version": self.version,
+            "modules": list(self.modules),
+            "recommended_sources": list(self.recommended_sources),
+        }
+
+
+SCHEMA_TEMPLATES: Dict[str, SchemaTemplate] = {
+    template.workspace_type: template
+    for template in (
+        SchemaTemplate(
+            "travel_research", ["map_panel", "itinerary_panel", "budget_panel"], ["maps", "web", "reddit", "youtube"]
+        ),
+        SchemaTemplate("purchase_research", ["comparison_panel", "spec_panel"], ["web", "reddit", "youtube"]),
+        SchemaTemplate("learning_plan", ["schedule_panel", "curriculum_panel"], ["web", "youtube", "academic"]),
+        SchemaTemplate("project_planner", [], ["web", "reddit"]),
+    )
+}
+
+# Changes whenever any template does
+TEMPLATES_VERSION = content_hash(*(template.version for template in SCHEMA_TEMPLATES.values()))
+
+
+def template_for(workspace_type: str) -> Optional[SchemaTemplate]:
+    return SCHEMA_TEMPLATES.get(workspace_type)
+
+
+def default_template(workspace_type: str) -> SchemaTemplate:
+    """The type's template, or a bare one (base modules, web and reddit) for a type without one"""
+    return SCHEMA_TEMPLATES.get(workspace_type) or SchemaTemplate(workspace_type, [], ["web", "reddit"])
@@ -0,0 +1,94 @@
+"""
+Request coalescing for Atlas - concurrent callers with the same key share one call
+"""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class AsyncSingleFlight:
+    """
+    Coalesces concurrent coroutine calls by key.
+
+    The first caller for a key starts the call; callers that arrive while it is
+    still running await the same task and get the same result or exception.
+    The shared task is shielded, so one caller being cancelled (e.g. a client
+    disconnecting) does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        future, _ = self.start(key, fn)
+        return await future
+
+    def start(self, key: str, fn: Callable[[], Awaitable[T]]) -> Tuple["asyncio.Future[T]", bool]:
+        """
+        Like `do`, but returns at once: the shared call to await, and whether
+        this caller started it (and so `fn` will run) or joined one in flight
+        """
+        task = self._tasks.get(key)
+        leader = task is None
+        if leader:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            self.shared += 1
+        return asyncio.shield(task), leader
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._tasks
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # Mark the exception as retrieved if every caller went away
+        if not task.cancelled():
+            task.exception()
+
+
+class SingleFlight:
+    """Thread-based counterpart of AsyncSingleFlight for blocking calls"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, "_Call"] = {}
+
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error = None
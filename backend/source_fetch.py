@@ -0,0 +1,305 @@
+"""
+Source fetching for Atlas - runs a workspace's source queries server-side, concurrently
+
+Each source (web, reddit, youtube, maps, academic) has an adapter that turns
+one search query into a few result items. SourcePipeline fans every query out
+at once over one pooled HTTP client, bounded per source, and yields results
+as they arrive. Set ATLAS_SOURCES_BACKEND=mock to use offline stand-ins.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+from pydantic import BaseModel
+
+from result_cache import ResultCache, normalize_query
+
+USER_AGENT = "Atlas/0.1 (research workspace)"
+
+
+class SourceItem(BaseModel):
+    title: str
+    url: str
+    snippet: str = ""
+
+
+class SourceResult(BaseModel):
+    source: str
+    query: str
+    items: List[SourceItem] = []
+    error: Optional[str] = None
+    cached: bool = False
+    elapsed_ms: float = 0.0
+
+
+class SourceAdapter:
+    """
+    Fetches results for one source. Subclasses set `name` and implement
+    `search`; `timeout` bounds each query and at most `max_concurrency`
+    queries for this source run at once (some APIs allow only one).
+    """
+
+    name = "base"
+
+    def __init__(self, timeout: float = 5.0, max_concurrency: int = 4, limit: int = 5):
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.limit = limit
+
+    @property
+    def available(self) -> bool:
+        """False when the adapter can't run (e.g. a missing API key)"""
+        return True
+
+    async def search(self, client: httpx.AsyncClient, query: str) -> List[SourceItem]:
+        raise NotImplementedError
+
+
+class WebAdapter(SourceAdapter):
+    """DuckDuckGo Instant Answer API (no key): abstract plus related topics"""
+
+    name = "web"
+
+    async def search(self, client: httpx.AsyncClient, query: str) -> List[SourceItem]:
+        response = await client.get(
+            "https://api.duckduckgo.com/",
+            params={"q": query, "format": "json", "no_html": 1, "skip_disambig": 1},
+        )
+        response.raise_for_status()
+        data = response.json()
+        items = []
+        if data.get("AbstractURL"):
+            items.append(SourceItem(
+                title=data.get("Heading") or query, url=data["AbstractURL"], snippet=data.get("AbstractText", "")
+            ))
+        for topic in data.get("RelatedTopics", []):
+            for entry in topic.get("Topics", [topic]):
+                if entry.get("FirstURL"):
+                    text = entry.get("Text", "")
+                    items.append(SourceItem(title=text.split(" - ")[0][:120], url=entry["FirstURL"], snippet=text))
+        return items[:self.limit]
+
+
+class RedditAdapter(SourceAdapter):
+    """Reddit's public search listing"""
+
+    name = "reddit"
+
+    async def search(self, client: httpx.AsyncClient, query: str) -> List[SourceItem]:
+        response = await client.get(
+            "https://www.reddit.com/search.json", params={"q": query, "limit": self.limit, "sort": "relevance"}
+        )
+        response.raise_for_status()
+        return [
+            SourceItem(
+                title=post["data"]["title"],
+                url="https://www.reddit.com" + post["data"]["permalink"],
+                snippet=f"r/{post['data'].get('subreddit', '')} - {post['data'].get('num_comments', 0)} comments",
+            )
+            for post in response.json().get("data", {}).get("children", [])
+        ]
+
+
+class YouTubeAdapter(SourceAdapter):
+    """YouTube Data API v3 search; needs YOUTUBE_API_KEY"""
+
+    name = "youtube"
+
+    def __init__(self, api_key: Optional[str] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.api_key = api_key
+
+    @property
+    def available(self) -> bool:
+        return bool(self.api_key)
+
+    async def search(self, client: httpx.AsyncClient, query: str) -> List[SourceItem]:
+        response = await client.get(
+            "https://www.googleapis.com/youtube/v3/search",
+            params={"part": "snippet", "type": "video", "q": query, "maxResults": self.limit, "key": self.api_key},
+        )
+        response.raise_for_status()
+        return [
+            SourceItem(
+                title=video["snippet"]["title"],
+                url=f"https://www.youtube.com/watch?v={video['id']['videoId']}",
+                snippet=video["snippet"].get("channelTitle", ""),
+            )
+            for video in response.json().get("items", [])
+            if video.get("id", {}).get("videoId")
+        ]
+
+
+class MapsAdapter(SourceAdapter):
+    """OpenStreetMap Nominatim geocoding; its usage policy allows one request at a time"""
+
+    name = "maps"
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("max_concurrency", 1)
+        super().__init__(**kwargs)
+
+    async def search(self, client: httpx.AsyncClient, query: str) -> List[SourceItem]:
+        response = await client.get(
+            "https://nominatim.openstreetmap.org/search",
+            params={"q": query, "format": "json", "limit": self.limit},
+        )
+        response.raise_for_status()
+        return [
+            SourceItem(
+                title=place.get("display_name", query).split(",")[0],
+                url=f"https://www.openstreetmap.org/{place['osm_type']}/{place['osm_id']}",
+                snippet=place.get("display_name", ""),
+            )
+            for place in response.json()
+            if place.get("osm_type") and place.get("osm_id")
+        ]
+
+
+class AcademicAdapter(SourceAdapter):
+    """OpenAlex works search (no key)"""
+
+    name = "academic"
+
+    async def search(self, client: httpx.AsyncClient, query: str) -> List[SourceItem]:
+        response = await client.get(
+            "https://api.openalex.org/works", params={"search": query, "per-page": self.limit}
+        )
+        response.raise_for_status()
+        return [
+            SourceItem(
+                title=work.get("display_name") or "Untitled",
+                url=work.get("doi") or work["id"],
+                snippet=f"{work.get('publication_year', '')} - cited by {work.get('cited_by_count', 0)}",
+            )
+            for work in response.json().get("results", [])
+        ]
+
+
+class MockSourceAdapter(SourceAdapter):
+    """Offline stand-in: deterministic items after a fixed delay, no network"""
+
+    def __init__(self, name: str, latency_ms: float = 100.0, **kwargs):
+        super().__init__(**kwargs)
+        self.name = name
+        self.latency_ms = latency_ms
+
+    async def search(self, client: httpx.AsyncClient, query: str) -> List[SourceItem]:
+        await asyncio.sleep(self.latency_ms / 1000.0)
+        slug = hashlib.md5(f"{self.name}:{query}".encode("utf-8")).hexdigest()[:8]
+        return [
+            SourceItem(
+                title=f"{query.title()} ({self.name} result {i})",
+                url=f"https://example.com/{self.name}/{slug}/{i}",
+                snippet=f"Mock {self.name} result for {query}.",
+            )
+            for i in range(1, self.limit + 1)
+        ]
+
+
+class SourcePipeline:
+    """
+    Runs source queries through their adapters concurrently.
+
+    All adapters share one pooled httpx.AsyncClient (created on first use,
+    closed by `aclose`). Each (source, normalized query) result is cached for
+    `cache_ttl` seconds; failed or timed-out queries come back as results with
+    `error` set and are not cached.
+    """
+
+    def __init__(
+        self,
+        adapters: List[SourceAdapter],
+        cache_ttl: float = 900.0,
+        cache_entries: int = 2048,
+        max_connections: int = 32,
+    ):
+        self.adapters: Dict[str, SourceAdapter] = {a.name: a for a in adapters if a.available}
+        self.cache = ResultCache(max_entries=cache_entries, ttl=cache_ttl)
+        self.max_connections = max_connections
+        self._semaphores = {name: asyncio.Semaphore(a.max_concurrency) for name, a in self.adapters.items()}
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                headers={"User-Agent": USER_AGENT},
+                limits=httpx.Limits(
+                    max_connections=self.max_connections, max_keepalive_connections=self.max_connections
+                ),
+                follow_redirects=True,
+            )
+        return self._client
+
+    async def fetch(self, source: str, query: str) -> SourceResult:
+        """Results for one query on one source, from cache when possible"""
+        adapter = self.adapters.get(source)
+        if adapter is None:
+            return SourceResult(source=source, query=query, error="Source not available")
+        key = ResultCache.make_key(source, normalize_query(query))
+        cached = self.cache.get(key)
+        if cached:
+            return SourceResult(source=source, query=query, items=json.loads(cached), cached=True)
+
+        start = time.perf_counter()
+        try:
+            async with self._semaphores[source]:
+                items = await asyncio.wait_for(adapter.search(self._get_client(), query), adapter.timeout)
+        except asyncio.TimeoutError:
+            error = f"Timed out after {adapter.timeout}s"
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        else:
+            self.cache.set(key, json.dumps([item.model_dump() for item in items]))
+            return SourceResult(
+                source=source, query=query, items=items, elapsed_ms=(time.perf_counter() - start) * 1000
+            )
+        return SourceResult(source=source, query=query, error=error, elapsed_ms=(time.perf_counter() - start) * 1000)
+
+    async def stream(self, source_queries: Dict[str, List[str]]) -> AsyncIterator[SourceResult]:
+        """Fetch every (source, query) pair at once, yielding results in completion order"""
+        pairs = list(dict.fromkeys(
+            (source, query) for source, queries in source_queries.items() for query in queries or []
+        ))
+        tasks = [asyncio.create_task(self.fetch(source, query)) for source, query in pairs]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def create_source_pipeline() -> SourcePipeline:
+    """Pipeline configured from ATLAS_SOURCES_* environment variables"""
+    timeout = float(os.getenv("ATLAS_SOURCES_TIMEOUT", "5"))
+    concurrency = int(os.getenv("ATLAS_SOURCES_CONCURRENCY", "4"))
+    if os.getenv("ATLAS_SOURCES_BACKEND", "http").lower() == "mock":
+        latency = float(os.getenv("ATLAS_MOCK_SOURCE_LATENCY_MS", "100"))
+        adapters: List[SourceAdapter] = [
+            MockSourceAdapter(name, latency, timeout=timeout, max_concurrency=concurrency)
+            for name in ["web", "reddit", "youtube", "maps", "academic"]
+        ]
+    else:
+        adapters = [
+            WebAdapter(timeout=timeout, max_concurrency=concurrency),
+            RedditAdapter(timeout=timeout, max_concurrency=concurrency),
+            YouTubeAdapter(os.getenv("YOUTUBE_API_KEY"), timeout=timeout, max_concurrency=concurrency),
+            MapsAdapter(timeout=timeout),
+            AcademicAdapter(timeout=timeout, max_concurrency=concurrency),
+        ]
+    return SourcePipeline(
+        adapters,
+        cache_ttl=float(os.getenv("ATLAS_SOURCES_CACHE_TTL", "900")),
+        max_connections=int(os.getenv("ATLAS_SOURCES_MAX_CONNECTIONS", "32")),
+    )
@@ -0,0 +1,136 @@
+"""
+Stage scheduling for Atlas - runs workspace generation stages as a small dependency graph
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Set
+
+
+StageFunc = Callable[..., Awaitable[Any]]
+
+
+class StageGraph:
+    """
+    Runs async stages concurrently, each one as soon as its dependencies finish.
+
+    A stage function is called with its dependencies' results as keyword
+    arguments, so `graph.add("schema", make_schema, depends_on=["classification"])`
+    calls `make_schema(classification=...)`.
+
+    A stage can also be speculated: its dependents start right away using a
+    guessed result. When the real result arrives and `agrees(guess, actual)` is
+    false, every stage downstream of it is cancelled and re-run with the real
+    result. `rerun` records which stages had to be re-run.
+
+    The first stage to fail cancels the rest, and its exception is raised
+    from `run`.
+    """
+
+    def __init__(self):
+        self._funcs: Dict[str, StageFunc] = {}
+        self._deps: Dict[str, List[str]] = {}
+        self._guesses: Dict[str, Any] = {}
+        self._agrees: Dict[str, Callable[[Any, Any], bool]] = {}
+        self.rerun: Set[str] = set()
+
+    def add(self, name: str, func: StageFunc, depends_on: Sequence[str] = ()) -> "StageGraph":
+        if name in self._funcs:
+            raise ValueError(f"Stage '{name}' already added")
+        self._funcs[name] = func
+        self._deps[name] = list(depends_on)
+        return self
+
+    def speculate(
+        self,
+        name: str,
+        guess: Any,
+        agrees: Optional[Callable[[Any, Any], bool]] = None,
+    ) -> "StageGraph":
+        """Let dependents of `name` start with `guess` instead of waiting for it"""
+        self._guesses[name] = guess
+        self._agrees[name] = agrees or (lambda a, b: a == b)
+        return self
+
+    def _order(self) -> List[str]:
+        """Topological order of the stages; raises ValueError on unknown deps or cycles"""
+        order: List[str] = []
+        visiting: Set[str] = set()
+
+        def visit(name: str):
+            if name in order:
+                return
+            if name in visiting:
+                raise ValueError(f"Stage dependency cycle at '{name}'")
+            if name not in self._funcs:
+                raise ValueError(f"Unknown stage '{name}'")
+            visiting.add(name)
+            for dep in self._deps[name]:
+                visit(dep)
+            visiting.discard(name)
+            order.append(name)
+
+        for name in self._funcs:
+            visit(name)
+        return order
+
+    def _downstream(self, name: str) -> Set[str]:
+        found: Set[str] = set()
+        frontier = [name]
+        while frontier:
+            current = frontier.pop()
+            for stage, deps in self._deps.items():
+                if current in deps and stage not in found:
+                    found.add(stage)
+                    frontier.append(stage)
+        return found
+
+    async def run(self) -> Dict[str, Any]:
+        """Run every stage and return their results by name"""
+        order = self._order()
+        tasks: Dict[str, asyncio.Task] = {}
+        assumed = dict(self._guesses)
+
+        def start(name: str):
+            async def runner():
+                kwargs = {}
+                for dep in self._deps[name]:
+                    # Look tasks up at await time so re-started stages are picked up
+                    kwargs[dep] = assumed[dep] if dep in assumed else await tasks[dep]
+                return await self._funcs[name](**kwargs)
+
+            tasks[name] = asyncio.create_task(runner(), name=f"stage:{name}")
+
+        async def settle(names: Sequence[str]):
+            """Wait for these stages, raising as soon as any stage fails"""
+            while True:
+                for task in tasks.values():
+                    if task.done() and not task.cancelled() and task.exception() is not None:
+                        raise task.exception()
+                if all(tasks[name].done() for name in names):
+                    return
+                await asyncio.wait([t for t in tasks.values() if not t.done()], return_when=asyncio.FIRST_COMPLETED)
+
+        try:
+            for name in order:
+                start(name)
+
+            for name, guess in self._guesses.items():
+                await settle([name])
+                actual = tasks[name].result()
+                del assumed[name]
+                if self._agrees[name](guess, actual):
+                    continue
+                stale = self._downstream(name)
+                for stage in stale:
+                    tasks[stage].cancel()
+                for stage in order:
+                    if stage in stale:
+                        start(stage)
+                self.rerun |= stale
+
+            await settle(order)
+            return {name: tasks[name].result() for name in order}
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
@@ -0,0 +1,80 @@
+"""
+Incremental JSON parsing for Atlas - pulls array items out of a streamed model response
+"""
+
+import json
+import re
+from typing import Any, List, Optional
+
+
+class StreamingArrayParser:
+    """
+    Extracts the items of one JSON array as soon as each item is complete.
+
+    Feed it text chunks as they arrive from the model; `feed` returns the items
+    of the array stored under `key` (e.g. "suggestions") that became complete
+    with that chunk. Anything around the array - markdown fences, other keys,
+    trailing text - is ignored, so it works on the same output the stage
+    endpoints parse after the fact.
+    """
+
+    def __init__(self, key: str):
+        self._start_re = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+        self._buffer = ""
+        self._pos: Optional[int] = None  # scan position once the array has been found
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._item_start: Optional[int] = None
+        self.done = False
+
+    def feed(self, chunk: str) -> List[Any]:
+        if self.done:
+            return []
+        self._buffer += chunk
+        if self._pos is None:
+            match = self._start_re.search(self._buffer)
+            if not match:
+                return []
+            self._pos = match.end()
+
+        items: List[Any] = []
+        buffer = self._buffer
+        i = self._pos
+        while i < len(buffer):
+            char = buffer[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if self._depth == 0:
+                    self._item_start = i
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 0:
+                    # End of the array itself
+                    self.done = True
+                    break
+                self._depth -= 1
+                if self._depth == 0 and self._item_start is not None:
+                    try:
+                        items.append(json.loads(buffer[self._item_start:i + 1]))
+                    except ValueError:
+                        pass
+                    self._item_start = None
+            i += 1
+        self._pos = i
+
+        # Drop text that can no longer be part of an item
+        keep_from = self._item_start if self._item_start is not None else self._pos
+        self._buffer = buffer[keep_from:]
+        self._pos -= keep_from
+        if self._item_start is not None:
+            self._item_start = 0
+        return items
@@ -0,0 +1,152 @@
+"""
+Structured LLM output for Atlas - JSON mode, schema constraints and single-pass validation
+"""
+
+import inspect
+import re
+from functools import lru_cache
+from typing import Any, Optional, Type
+
+from pydantic import TypeAdapter, ValidationError
+
+from observability import JSON_REPAIRS
+
+_FENCE_RE = re.compile(r"```(?:json|JSON)?\s*(.*?)```", re.S)
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+@lru_cache(maxsize=None)
+def adapter(tp: Any) -> TypeAdapter:
+    """TypeAdapter for `tp`, built once; building one is far slower than using it"""
+    return TypeAdapter(tp)
+
+
+def parse_json_model(tp: Any, text: str):
+    """
+    Parse and validate LLM output in one pass. If the text is not valid JSON
+    (fences, chatter around the object, trailing commas, a truncated tail),
+    it is repaired locally and validated once more; schema errors are not
+    retried. Raises ValidationError.
+    """
+    validator = adapter(tp)
+    try:
+        return validator.validate_json(text)
+    except ValidationError as e:
+        if not any(error["type"] == "json_invalid" for error in e.errors()):
+            raise
+    try:
+        result = validator.validate_json(repair_json(text))
+    except ValidationError:
+        JSON_REPAIRS.inc(outcome="failed")
+        raise
+    JSON_REPAIRS.inc(outcome="ok")
+    return result
+
+
+def repair_json(text: str) -> str:
+    """Cheap best-effort fix-up of almost-JSON model output"""
+    text = text.strip()
+    fenced = _FENCE_RE.search(text)
+    if fenced:
+        text = fenced.group(1).strip()
+    elif text.startswith("```"):
+        # Opening fence with no closing one (output cut off)
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        return text
+    text = text[min(starts):]
+    return _close_open_brackets(_TRAILING_COMMA_RE.sub(r"\1", text))
+
+
+def _close_open_brackets(text: str) -> str:
+    """
+    Cut the text after the first complete JSON value, or, if it is truncated,
+    terminate an open string and close any brackets left open
+    """
+    stack = []
+    in_string = escaped = False
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in _CLOSERS:
+            stack.append(_CLOSERS[char])
+        elif char in "}]" and stack:
+            stack.pop()
+            if not stack:
+                return text[:i + 1]
+    if in_string:
+        text += '"'
+    if not stack:
+        return text
+    return text.rstrip().rstrip(",") + "".join(reversed(stack))
+
+
+def gemini_schema(tp: Any) -> dict:
+    """
+    `tp`'s JSON schema in the OpenAPI subset Gemini accepts for response_schema:
+    $refs inlined, Optional[...] as nullable, every property required (so the
+    model fills defaults in explicitly) and titles/defaults dropped.
+    """
+    schema = adapter(tp).json_schema()
+    defs = schema.get("$defs", {})
+
+    def convert(node: dict) -> dict:
+        if "allOf" in node and len(node["allOf"]) == 1:
+            node = node["allOf"][0]  # How pydantic wraps a $ref that has a default
+        if "$ref" in node:
+            node = defs[node["$ref"].rsplit("/", 1)[-1]]
+        if "anyOf" in node:
+            variants = [v for v in node["anyOf"] if v.get("type") != "null"]
+            converted = convert(variants[0])
+            if len(variants) < len(node["anyOf"]):
+                converted["nullable"] = True
+            return converted
+        out = {key: node[key] for key in ("format", "description", "enum") if key in node}
+        if "type" in node:
+            out["type"] = node["type"].upper()
+        if "properties" in node:
+            out["properties"] = {name: convert(prop) for name, prop in node["properties"].items()}
+            out["required"] = list(node["properties"])
+        if "items" in node:
+            out["items"] = convert(node["items"])
+        return out
+
+    return convert(schema)
+
+
+@lru_cache(maxsize=None)
+def _config_params(config_cls: Type) -> frozenset:
+    try:
+        return frozenset(inspect.signature(config_cls).parameters)
+    except (TypeError, ValueError):
+        return frozenset()
+
+
+def generation_config(
+    config_cls: Type, response_schema: Optional[dict] = None, max_output_tokens: Optional[int] = None
+):
+    """
+    A generation config capping output at `max_output_tokens` and, given a
+    `response_schema`, asking for JSON output (constrained to the schema when
+    the SDK supports that too), or None if there is nothing this SDK version
+    can set. google-generativeai 0.3.x has no JSON mode; prompts still ask for JSON.
+    """
+    params = _config_params(config_cls)
+    kwargs = {}
+    if max_output_tokens and "max_output_tokens" in params:
+        kwargs["max_output_tokens"] = max_output_tokens
+    if response_schema is not None and "response_mime_type" in params:
+        kwargs["response_mime_type"] = "application/json"
+        if "response_schema" in params:
+            kwargs["response_schema"] = response_schema
+    return config_cls(**kwargs) if kwargs else None
@@ -0,0 +1,40 @@
+"""
+Test setup: import backend modules by name, and configure main for the mock
+LLM backend (no API key, no disk writes, no network link checks) before any
+test imports it
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.update(
+    ATLAS_LLM_BACKEND="mock",
+    ATLAS_MOCK_LATENCY_MS="1",
+    ATLAS_MOCK_LATENCY_SIGMA="0",
+    ATLAS_MOCK_SEED="1",
+    ATLAS_MOCK_ERROR_RATE="0",
+    ATLAS_MOCK_RATE_LIMIT_RATE="0",
+    ATLAS_WORKSPACE_DB="",
+    ATLAS_CACHE_DB="",
+    ATLAS_VALIDATE_LINKS="false",
+    ATLAS_NEAR_DUP_SEED="0",
+    ATLAS_SOURCES_BACKEND="mock",
+    ATLAS_MOCK_SOURCE_LATENCY_MS="5",
+    ATLAS_LOG_LEVEL="CRITICAL",
+)
+
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def client():
+    """A TestClient for the app, started once; `client.portal.call` runs coroutines on the app's loop"""
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as test_client:
+        yield test_client
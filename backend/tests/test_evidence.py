@@ -0,0 +1,127 @@
+import asyncio
+import socket
+
+import httpx
+from pydantic import BaseModel
+
+from evidence import EvidenceIndex, LinkChecker, canonicalize_url, dedupe_evidence
+
+
+class Evidence(BaseModel):
+    url: str
+
+
+class Suggestion(BaseModel):
+    evidence: list
+
+
+def suggestion(*urls):
+    return Suggestion(evidence=[Evidence(url=url) for url in urls])
+
+
+def urls(suggestions):
+    return [[item.url for item in s.evidence] for s in suggestions]
+
+
+def test_canonicalize_url():
+    assert canonicalize_url("HTTPS://Example.COM:443/a//b/?utm_source=x&b=2&a=1#frag") == "https://example.com/a/b?a=1&b=2"
+    assert canonicalize_url("http://example.com") == "http://example.com/"
+    assert canonicalize_url("http://example.com:8080/x/") == "http://example.com:8080/x"
+    assert canonicalize_url("mailto:someone@example.com") == "mailto:someone@example.com"
+
+
+def test_dedupe_across_suggestions_treats_scheme_and_www_variants_as_one():
+    deduped = dedupe_evidence([
+        suggestion("https://www.example.com/guide?utm_campaign=x", "https://other.example/"),
+        suggestion("http://example.com/guide/", "https://new.example/page"),
+    ])
+    assert urls(deduped) == [["https://www.example.com/guide", "https://other.example/"], ["https://new.example/page"]]
+    index = EvidenceIndex(deduped)
+    assert "http://example.com/guide" in index
+
+
+def link_checker(handler, **kwargs):
+    checker = LinkChecker(**kwargs)
+    checker._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return checker
+
+
+def test_dead_links_are_dropped_and_every_result_is_cached():
+    requests = []
+
+    def handler(request):
+        requests.append(str(request.url))
+        if request.url.host == "slow.example":
+            raise httpx.ReadTimeout("timed out", request=request)
+        return httpx.Response(404 if request.url.path == "/gone" else 403)
+
+    async def main():
+        checker = link_checker(handler)
+        batch = [suggestion("https://a.example/gone", "https://a.example/blocked", "https://slow.example/x")]
+        first = await checker.filter(batch)
+        second = await checker.filter(batch)
+        await checker.aclose()
+        return first, second, checker.stats()
+
+    first, second, stats = asyncio.run(main())
+    # 403 and timeouts can't tell, so those links are kept
+    assert urls(first) == urls(second) == [["https://a.example/blocked", "https://slow.example/x"]]
+    assert len(requests) == 3  # inconclusive results are cached too, briefly
+    assert stats["checked"] == 3 and stats["unsure_cache"]["size"] == 1
+
+
+def test_unknown_hosts_are_dead_but_resolver_failures_are_not():
+    def handler(request):
+        code = socket.EAI_NONAME if request.url.host.startswith("gone") else socket.EAI_AGAIN
+        try:
+            raise socket.gaierror(code, "lookup failed")
+        except socket.gaierror as e:
+            raise httpx.ConnectError("connect failed", request=request) from e
+
+    async def main():
+        checker = link_checker(handler)
+        results = (
+            await checker.check("https://gone.example/a"),
+            await checker.check("https://flaky.example/a"),
+            checker._cached("https://gone.example/other-page"),  # the whole host is known dead
+        )
+        await checker.aclose()
+        return results
+
+    assert asyncio.run(main()) == (False, True, False)
+
+
+def test_malformed_urls_are_dead_instead_of_failing_the_batch():
+    def handler(request):
+        return httpx.Response(200)
+
+    async def main():
+        checker = link_checker(handler)
+        batch = dedupe_evidence([suggestion("http://[::1", "https://ex\x00ample.com", "https://fine.example/")])
+        kept = await checker.filter(batch)
+        await checker.aclose()
+        return kept
+
+    assert urls(asyncio.run(main())) == [["https://fine.example/"]]
+
+
+def test_links_unchecked_by_the_deadline_are_kept_and_finish_in_the_background():
+    async def handler(request):
+        await asyncio.sleep(0.2)
+        return httpx.Response(404)
+
+    async def main():
+        checker = link_checker(handler, deadline=0.05)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        kept = await checker.filter([suggestion("https://slow.example/gone")])
+        elapsed = loop.time() - start
+        await asyncio.sleep(0.3)
+        later = await checker.filter([suggestion("https://slow.example/gone")])
+        await checker.aclose()
+        return kept, elapsed, later, checker.deadline_misses
+
+    kept, elapsed, later, misses = asyncio.run(main())
+    assert urls(kept) == [["https://slow.example/gone"]] and elapsed < 0.15
+    assert urls(later) == [[]]
+    assert misses == 1
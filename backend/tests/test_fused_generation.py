@@ -0,0 +1,29 @@
+import json
+
+
+def test_fused_parts_are_dropped_when_their_classification_is_invalid(client, monkeypatch):
+    import main
+
+    original = main.generate_with
+    fused = {}
+
+    async def generate_with(prompt, user_prompt):
+        text = await original(prompt, user_prompt)
+        if prompt.stage != "fused":
+            return text
+        response = json.loads(text)
+        response["classification"] = {"workspace_type": response["classification"]["workspace_type"]}
+        response["schema"]["title"] = "Written for the fused call's type"
+        for suggestion in response["suggestions"]:
+            suggestion["title"] = f"Fused: {suggestion['title']}"
+        fused.update(response)
+        return json.dumps(response)
+
+    monkeypatch.setattr(main, "generate_with", generate_with)
+    query = "zibble quank three"
+    workspace = client.post("/api/workspace/create", params={"fused": True}, json={"query": query}).json()
+    assert fused, "the fused call was made"
+    assert workspace["schema"]["title"] != "Written for the fused call's type"
+    assert not any(s["title"].startswith("Fused: ") for s in workspace["suggestions"])
+    # Regenerated stage by stage, so every stage is cached and the workspace is stored
+    assert client.get(f"/api/workspace/{workspace['id']}").json()["degraded"] is False
@@ -0,0 +1,163 @@
+import asyncio
+import time
+
+import pytest
+
+from model_router import ModelRouter, NoModelAvailableError
+
+
+def fake_models(**behaviour):
+    """A call(model) that sleeps and then returns the model name or raises, per model"""
+    calls = []
+
+    async def call(model):
+        calls.append(model)
+        delay, error = behaviour[model]
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return model
+
+    return call, calls
+
+
+async def settle(call):
+    result = await call
+    # Let the router's cancelled losers run their cancellation handlers
+    await asyncio.sleep(0.01)
+    return result
+
+
+def test_rank_orders_by_expected_time_to_success():
+    router = ModelRouter()
+    assert router.rank(["a", "b", "a", "c"]) == ["a", "b", "c"]  # no data: caller's order
+    router.record("a", 2.0, ok=True)
+    router.record("b", 0.5, ok=True)
+    router.record("c", 0.4, ok=True)
+    router.record("c", 0.4, ok=False)  # faster, but failing often enough to lose to b
+    router.record("c", 0.4, ok=False)
+    assert router.rank(["a", "b", "c"]) == ["b", "c", "a"]
+
+
+def test_slow_primary_is_hedged_and_the_faster_answer_wins():
+    router = ModelRouter(default_hedge_delay=0.02, min_hedge_delay=0.01)
+    call, calls = fake_models(slow=(1.0, None), fast=(0.01, None))
+
+    result = asyncio.run(settle(router.call(["slow", "fast"], call)))
+    assert result == "fast"
+    assert calls == ["slow", "fast"]
+    assert (router.hedges, router.hedge_wins) == (1, 1)
+    # The cancelled loser still counts: it took at least as long as it ran
+    assert router._get("slow").ewma_latency >= 0.02
+    assert router._get("slow").ewma_error == 0.0
+
+
+def test_fast_primary_is_not_hedged():
+    router = ModelRouter(default_hedge_delay=0.5)
+    call, calls = fake_models(a=(0.01, None), b=(0.01, None))
+    assert asyncio.run(router.call(["a", "b"], call)) == "a"
+    assert calls == ["a"]
+    assert router.hedges == 0
+
+
+def test_errors_fall_through_the_ranking():
+    router = ModelRouter(hedging=False)
+    call, calls = fake_models(a=(0, RuntimeError("a down")), b=(0, RuntimeError("b down")), c=(0, None))
+    assert asyncio.run(router.call(["a", "b", "c"], call)) == "c"
+    assert calls == ["a", "b", "c"]
+    assert router._get("a").consecutive_failures == 1
+
+    call, _ = fake_models(a=(0, RuntimeError("a down")), b=(0, ValueError("b down")))
+    with pytest.raises(ValueError, match="b down"):
+        asyncio.run(router.call(["a", "b"], call))
+    with pytest.raises(NoModelAvailableError):
+        asyncio.run(router.call([], call))
+
+
+def test_passthrough_errors_are_raised_at_once_and_not_held_against_the_model():
+    router = ModelRouter(hedging=False, passthrough=lambda error: "429" in str(error))
+    call, calls = fake_models(a=(0, RuntimeError("429 quota")), b=(0, None))
+    with pytest.raises(RuntimeError, match="429"):
+        asyncio.run(router.call(["a", "b"], call))
+    assert calls == ["a"]
+    assert router._get("a").ewma_error == 0.0
+
+
+def test_time_waiting_for_admission_is_not_the_models_latency():
+    router = ModelRouter(hedging=False)
+    call, _ = fake_models(a=(0, None))
+
+    async def admit():
+        await asyncio.sleep(0.1)
+
+    assert asyncio.run(router.call(["a"], call, admit)) == "a"
+    assert router._get("a").ewma_latency < 0.05
+
+
+def test_a_refused_hedge_is_dropped_without_blaming_its_model():
+    router = ModelRouter(
+        default_hedge_delay=0.02, min_hedge_delay=0.01, passthrough=lambda error: "queued" in str(error)
+    )
+    call, calls = fake_models(a=(0.1, None), b=(0, None))
+    admitted = []
+
+    async def admit():
+        if admitted:
+            raise RuntimeError("Too many queued requests")
+        admitted.append(True)
+
+    assert asyncio.run(settle(router.call(["a", "b"], call, admit))) == "a"
+    assert calls == ["a"] and router.hedges == 1
+    stats = router._get("b")
+    assert (stats.ewma_error, stats.state, stats.ewma_latency) == (0.0, "closed", None)
+
+
+def test_breaker_opens_then_allows_one_trial_after_the_cooldown():
+    router = ModelRouter(hedging=False, breaker_threshold=2, breaker_cooldown=0.05)
+    for _ in range(2):
+        router.record("a", 0.1, ok=False)
+    router.record("b", 5.0, ok=True)
+    assert router._get("a").state == "open"
+    assert router.breaker_trips == 1
+    assert router.rank(["a", "b"]) == ["b", "a"]
+
+    time.sleep(0.06)
+    assert router.rank(["a", "b"])[0] == "a"  # half-open, and its prior beats b's latency
+    router._get("a").trial_in_flight = True
+    assert router.rank(["a", "b"]) == ["b", "a"]  # only one trial at a time
+
+    router.record("a", 0.1, ok=False)  # trial failed: straight back to open
+    assert router._get("a").state == "open"
+    assert router.breaker_trips == 2
+
+    time.sleep(0.06)
+    call, _ = fake_models(a=(0, None), b=(0, None))
+    assert asyncio.run(router.call(["a", "b"], call)) == "a"
+    assert router._get("a").state == "closed"
+
+
+def test_cancelled_calls_are_censored_latency_samples():
+    router = ModelRouter(alpha=0.5)
+    router.record("a", 1.0, ok=True)
+    router.record_cancelled("a", 0.5)  # faster than usual: says nothing
+    assert router._get("a").ewma_latency == 1.0
+    router.record_cancelled("a", 3.0)
+    assert router._get("a").ewma_latency == 2.0
+    assert router._get("a").consecutive_failures == 0
+    assert router._get("a").state == "closed"
+
+
+def test_hanging_model_is_demoted_instead_of_hedged_forever():
+    router = ModelRouter(default_hedge_delay=0.01, min_hedge_delay=0.01, prior_latency=0.01)
+    router.record("hangs", 0.005, ok=True)  # was the fastest
+    router.record("steady", 0.02, ok=True)
+    call, calls = fake_models(hangs=(10.0, None), steady=(0.02, None))
+
+    async def many():
+        for _ in range(10):
+            assert await router.call(["hangs", "steady"], call) == "steady"
+            await asyncio.sleep(0.01)
+
+    asyncio.run(many())
+    assert router.rank(["hangs", "steady"])[0] == "steady"
+    assert calls[-1] == "steady"
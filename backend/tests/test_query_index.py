@@ -0,0 +1,103 @@
+import random
+
+import pytest
+
+from query_index import NearDuplicateIndex, shingles
+
+
+def test_shingles_ignore_stopwords_and_plurals_but_keep_word_order():
+    assert shingles("budget trip to japan") == shingles("Budget trips in Japan")
+    assert shingles("the a of") == set()
+    assert "w:glass" in shingles("glass")  # "ss" is not a plural
+    assert shingles("flights from london to paris") != shingles("flights from paris to london")
+
+
+def test_signature_estimates_jaccard_similarity():
+    index = NearDuplicateIndex(num_perm=256, bands=64)
+    a, b = index.signature("cheap flights to tokyo in march"), index.signature("cheap flight to tokyo in april")
+    jaccard = len(shingles("cheap flights to tokyo in march") & shingles("cheap flight to tokyo in april")) / len(
+        shingles("cheap flights to tokyo in march") | shingles("cheap flight to tokyo in april")
+    )
+    estimate = sum(x == y for x, y in zip(a, b)) / 256
+    assert abs(estimate - jaccard) < 0.1
+    assert index.signature("the of a") is None
+
+
+def test_paraphrases_match_within_the_same_workspace_type_only():
+    index = NearDuplicateIndex()
+    assert index.add("ws_japan", "budget trip to japan", "travel_research")
+    assert not index.add("ws_japan", "budget trip to japan", "travel_research")
+    index.add("ws_laptop", "best laptop for programming", "purchase_research")
+
+    match = index.lookup("budget trips in japan", "travel_research")
+    assert match is not None and match.key == "ws_japan" and match.similarity == 1.0
+    assert index.lookup("budget trips in japan", "purchase_research") is None
+    assert index.lookup("learn rust in a month", "travel_research") is None
+
+    typo = index.lookup("best laptop for programing", "purchase_research")
+    assert typo is None or typo.key == "ws_laptop"
+    stats = index.stats()
+    assert stats["lookups"] == 4 and stats["hits"] >= 1 and stats["entries"] == 2
+
+
+def test_threshold_controls_how_close_a_match_must_be():
+    strict, loose = NearDuplicateIndex(threshold=0.95), NearDuplicateIndex(threshold=0.3)
+    for index in (strict, loose):
+        index.add("ws", "weekend hiking trip in the alps", "travel_research")
+    assert strict.lookup("weekend hiking trip in the dolomites", "travel_research") is None
+    assert loose.lookup("weekend hiking trip in the dolomites", "travel_research").key == "ws"
+
+
+def test_reordered_words_are_a_different_query():
+    index = NearDuplicateIndex()
+    index.add("ws_london", "flights from london to paris", "travel_research")
+    assert index.lookup("flights from paris to london", "travel_research") is None
+    assert index.lookup("flight london to paris", "travel_research").key == "ws_london"
+
+
+def test_near_duplicate_workspaces_are_persisted(client):
+    first = client.post("/api/workspace/create", json={"query": "weekend trip to quixotl on a budget"}).json()
+    reused = client.post("/api/workspace/create", json={"query": "weekend trips to quixotl on budget"})
+    assert reused.status_code == 200
+    assert reused.json()["schema"] == first["schema"] and reused.json()["id"] != first["id"]
+    stored = client.get(f"/api/workspace/{reused.json()['id']}")
+    assert stored.status_code == 200 and stored.json()["degraded"] is False
+
+
+def test_num_perm_must_split_into_bands():
+    with pytest.raises(ValueError):
+        NearDuplicateIndex(num_perm=64, bands=10)
+
+
+def best_candidate(index, query, workspace_type):
+    """The best match among the LSH candidates, every one compared in full (no pruning)"""
+    signature = index.signature(query)
+    candidates = set()
+    for band_key in index._band_keys(workspace_type, signature):
+        candidates.update(index._buckets.get(band_key, [])[-index.max_bucket_candidates:])
+    best = None
+    for position in candidates:
+        if index._types[position] != workspace_type:
+            continue
+        similarity = sum(x == y for x, y in zip(signature, index._signatures[position])) / index.num_perm
+        if similarity >= index.threshold and (best is None or similarity > best):
+            best = similarity
+    return best
+
+
+@pytest.mark.parametrize("max_bucket_candidates", [4, 32])
+def test_pruning_never_changes_the_result(max_bucket_candidates):
+    rng = random.Random(7)
+    vocab = [f"{a}{b}" for a in "bcdfgklm" for b in ("ara", "eno", "isu", "oto", "ul")]
+    # Overlapping vocabulary fills the buckets, so the cap truncates them and pruning has to allow for that
+    index = NearDuplicateIndex(threshold=0.8, max_bucket_candidates=max_bucket_candidates)
+    for i in range(2000):
+        index.add(f"k{i}", " ".join(rng.sample(vocab, rng.randint(2, 4))), ["travel_research", "learning_plan"][i % 2])
+
+    matched = 0
+    for _ in range(300):
+        query = " ".join(rng.sample(vocab, rng.randint(2, 4)))
+        match = index.lookup(query, "travel_research")
+        assert (match and match.similarity) == best_candidate(index, query, "travel_research")
+        matched += match is not None
+    assert matched > 20
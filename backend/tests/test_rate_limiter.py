@@ -0,0 +1,209 @@
+import asyncio
+import time
+
+import pytest
+
+from llm_client import AsyncLLMClient, LLMTimeoutError
+from model_router import ModelRouter
+from rate_limiter import (
+    PRIORITY_BATCH,
+    PRIORITY_INTERACTIVE,
+    RateLimitExceeded,
+    TokenBucket,
+    UpstreamLimiter,
+    backoff_delay,
+    is_rate_limited,
+    retry_after,
+    use_priority,
+)
+
+
+def empty_limiter(requests_per_minute=1200, **kwargs):
+    """A limiter whose request bucket starts empty, refilling one slot per 50ms"""
+    limiter = UpstreamLimiter(requests_per_minute=requests_per_minute, **kwargs)
+    limiter.requests.level = 0
+    return limiter
+
+
+def test_token_bucket_refills_up_to_capacity():
+    bucket = TokenBucket(per_minute=60, capacity=2)
+    now = time.monotonic()
+    assert bucket.wait_time(2, now) == 0
+    bucket.take(2)
+    assert bucket.wait_time(1, now) == pytest.approx(1.0)
+    assert bucket.wait_time(1, now + 0.5) == pytest.approx(0.5)
+    assert bucket.wait_time(5, now + 100) == 0  # capped at capacity, not waiting forever
+    assert bucket.level == 2
+
+
+def test_waiters_are_served_by_priority_then_arrival():
+    limiter = empty_limiter()
+    order = []
+
+    async def caller(name, priority):
+        await limiter.acquire(priority=priority)
+        order.append(name)
+
+    async def main():
+        batch = [asyncio.create_task(caller(f"batch{i}", PRIORITY_BATCH)) for i in range(3)]
+        await asyncio.sleep(0.01)
+        interactive = [asyncio.create_task(caller(f"user{i}", PRIORITY_INTERACTIVE)) for i in range(2)]
+        await asyncio.gather(*batch, *interactive)
+
+    asyncio.run(main())
+    assert order == ["user0", "user1", "batch0", "batch1", "batch2"]
+
+
+def test_priority_comes_from_the_calling_context():
+    limiter = empty_limiter()
+    order = []
+
+    async def caller(name, priority):
+        with use_priority(priority):
+            await limiter.acquire()
+        order.append(name)
+
+    async def main():
+        first = asyncio.create_task(caller("batch", PRIORITY_BATCH))
+        await asyncio.sleep(0.01)
+        await asyncio.gather(first, caller("user", PRIORITY_INTERACTIVE))
+
+    asyncio.run(main())
+    assert order == ["user", "batch"]
+
+
+def test_full_queue_rejects_at_once_with_retry_after():
+    limiter = empty_limiter(requests_per_minute=60, max_queue=2)
+
+    async def main():
+        waiters = [asyncio.create_task(limiter.acquire()) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        with pytest.raises(RateLimitExceeded) as rejected:
+            await limiter.acquire()
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        return rejected.value
+
+    error = asyncio.run(main())
+    assert error.retry_after >= 1.0
+    assert limiter.rejected == 1
+    assert limiter.queued == 0  # cancelled waiters gave up their places
+
+
+def test_pause_holds_back_every_caller():
+    limiter = UpstreamLimiter(requests_per_minute=6000)
+    limiter.pause(0.1)
+
+    async def main():
+        start = time.monotonic()
+        await limiter.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(main()) >= 0.09
+
+
+def test_rate_limit_errors_are_recognised():
+    assert is_rate_limited(RuntimeError("429 Resource has been exhausted"))
+    assert is_rate_limited(RuntimeError("Quota exceeded for this project"))
+    assert not is_rate_limited(RuntimeError("503 The model is overloaded"))
+    assert retry_after(RuntimeError("429 quota exceeded, retry after 7s")) == 7.0
+    assert retry_after(RuntimeError("429 quota exceeded")) is None
+    assert all(0 <= backoff_delay(attempt, base=0.5, cap=2.0) <= 2.0 for attempt in range(10))
+
+
+def test_client_retries_429s_then_gives_up():
+    failures = []
+
+    def call(prompt, system_instruction):
+        if len(failures) < 2:
+            failures.append(prompt)
+            raise RuntimeError("429 Resource has been exhausted")
+        return "ok"
+
+    client = AsyncLLMClient(call, max_retries=2, backoff_base=0.001)
+    assert asyncio.run(client.generate("prompt")) == "ok"
+
+    def always_limited(prompt, system_instruction):
+        raise RuntimeError("429 Resource has been exhausted, retry after 0.01")
+
+    limiter = UpstreamLimiter(requests_per_minute=6000)
+    client = AsyncLLMClient(always_limited, max_retries=1, limiter=limiter)
+    with pytest.raises(RuntimeError, match="429"):
+        asyncio.run(client.generate("prompt"))
+    assert limiter.admitted == 2  # every retry waits for the limiter too
+
+
+def test_hedged_and_failover_attempts_each_take_a_limiter_slot():
+    def model_call(model, prompt, system_instruction):
+        if model == "slow":
+            time.sleep(0.2)
+        return model
+
+    limiter = UpstreamLimiter(requests_per_minute=6000)
+    client = AsyncLLMClient(
+        lambda prompt, system_instruction: "unused",
+        router=ModelRouter(default_hedge_delay=0.02, min_hedge_delay=0.01),
+        models=lambda: ["slow", "fast"],
+        model_call=model_call,
+        limiter=limiter,
+    )
+    assert asyncio.run(client.generate("prompt")) == "fast"
+    assert limiter.admitted == 2
+
+
+def test_hedges_refused_by_a_full_limiter_leave_the_router_alone():
+    import main
+
+    class OneSlotLimiter(UpstreamLimiter):
+        async def acquire(self, tokens=0.0, priority=None):
+            if self.admitted:
+                raise RateLimitExceeded("Too many queued LLM requests", 1.0)
+            self.admitted += 1
+
+    def model_call(model, prompt, system_instruction):
+        time.sleep(0.1)
+        return model
+
+    router = ModelRouter(
+        default_hedge_delay=0.02,
+        min_hedge_delay=0.01,
+        passthrough=main.model_router.passthrough,
+    )
+    client = AsyncLLMClient(
+        lambda prompt, system_instruction: "unused",
+        router=router,
+        models=lambda: ["a", "b"],
+        model_call=model_call,
+        limiter=OneSlotLimiter(requests_per_minute=60),
+    )
+    assert asyncio.run(client.generate("prompt")) == "a"
+    assert router.hedges == 1 and router.breaker_trips == 0
+    assert router.snapshot()["models"]["b"]["ewma_error"] == 0.0
+
+
+def test_overloaded_stages_fail_fast_instead_of_degrading(client, monkeypatch):
+    import main
+
+    async def limited(*args, **kwargs):
+        raise RuntimeError("429 Resource has been exhausted, retry after 3")
+
+    monkeypatch.setattr(main.llm_client, "generate", limited)
+    response = client.post("/api/workspace/create", json={"query": "fnord blorp one"})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "3"
+
+    async def timed_out(*args, **kwargs):
+        raise LLMTimeoutError("LLM call timed out after 60s")
+
+    monkeypatch.setattr(main.llm_client, "generate", timed_out)
+    response = client.post("/api/workspace/create", json={"query": "fnord blorp one"})
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+
+    async def broken(*args, **kwargs):
+        raise RuntimeError("503 The model is overloaded")
+
+    monkeypatch.setattr(main.llm_client, "generate", broken)
+    response = client.post("/api/workspace/create", json={"query": "fnord blorp one"})
+    assert response.status_code == 200  # an ordinary model error still degrades to a placeholder
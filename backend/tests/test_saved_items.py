@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+from saved_items import SavedItemStore, SearchIndex, saved_item_id, tokenize
+
+
+@pytest.fixture
+def index():
+    index = SearchIndex()
+    index.add("kyoto", "ws1", "Kyoto temples", "Fushimi Inari at dawn", ["Japan", "culture"], updated_at=1)
+    index.add("tokyo", "ws1", "Tokyo food tour", "ramen, sushi and izakaya in Tokyo", ["japan", "food"], updated_at=2)
+    index.add("lisbon", "ws2", "Lisbon trams", "tram 28 through Alfama", ["portugal"], updated_at=3)
+    index.add("ramen", "ws2", "Ramen guide", "a long note " + "about noodles " * 30, ["food"], updated_at=4)
+    return index
+
+
+def ids(results):
+    return [doc_id for doc_id, _ in results]
+
+
+def test_tokenize_drops_stopwords_and_case():
+    assert tokenize("The Best Ramen in Tokyo!") == ["best", "ramen", "tokyo"]
+
+
+def test_bm25_ranks_title_matches_and_short_documents_higher():
+    index = SearchIndex()
+    index.add("title", "ws", "ramen", "bowl shop")
+    index.add("notes", "ws", "bowl", "ramen shop")
+    index.add("long", "ws", "ramen", "bowl shop " + "filler words " * 40)
+    index.add("other", "ws", "sushi", "bar")
+    assert ids(index.search("ramen")) == ["title", "notes", "long"]
+    assert index.search("nothing matches this") == []
+
+
+def test_rare_terms_outweigh_common_ones(index):
+    scores = dict(index.search("japan alfama"))
+    assert scores["lisbon"] > scores["kyoto"]
+
+
+def test_filters_by_every_tag_and_workspace(index):
+    assert sorted(ids(index.search(tags=["Japan"]))) == ["kyoto", "tokyo"]
+    assert ids(index.search(tags=["japan", "food"])) == ["tokyo"]
+    assert ids(index.search("food", workspace_id="ws2")) == ["ramen"]
+    assert index.search(tags=["missing"]) == []
+
+
+def test_empty_query_lists_newest_first(index):
+    assert ids(index.search()) == ["ramen", "lisbon", "tokyo", "kyoto"]
+    assert all(score == 0.0 for _, score in index.search())
+
+
+def test_prefix_search_and_completion(index):
+    assert index.complete("tok") == ["tokyo"]
+    assert index.complete("") == []
+    assert ids(index.search("temples kyo", prefix=True))[0] == "kyoto"
+    assert index.search("kyo") == []
+
+
+def test_updates_and_removals_are_incremental(index):
+    index.add("tokyo", "ws1", "Tokyo museums", "", ["japan"], updated_at=5)
+    assert "tokyo" not in ids(index.search("ramen"))
+    assert ids(index.search("museums")) == ["tokyo"]
+    assert index.remove("kyoto")
+    assert not index.remove("kyoto")
+    assert index.complete("temp") == []
+    assert index.search(tags=["culture"]) == []
+    assert len(index) == 3
+    assert index.stats()["documents"] == 3
+
+
+def test_store_persists_and_rebuilds_its_index(tmp_path):
+    path = str(tmp_path / "items.db")
+    store = SavedItemStore(path)
+    item_id = saved_item_id("ws1", "place", "Kyoto Temples")
+    assert item_id == saved_item_id("ws1", "place", "  kyoto   temples")
+    store.put(item_id, "ws1", json.dumps({"title": "Kyoto temples", "notes": "dawn visit", "tags": ["japan"]}))
+    other = saved_item_id("ws1", "place", "Osaka")
+    store.put(other, "ws1", json.dumps({"title": "Osaka castle", "tags": ["japan"]}))
+    assert store.delete(other)
+    store.close()
+
+    reopened = SavedItemStore(path)
+    assert [json.loads(body)["title"] for body, _ in reopened.search("dawn")] == ["Kyoto temples"]
+    assert len(reopened.list("ws1")) == 1
+    assert reopened.complete("kyo") == ["kyoto"]
+    reopened.close()
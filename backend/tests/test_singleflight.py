@@ -0,0 +1,147 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from singleflight import AsyncSingleFlight, SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(*(flight.do("key", fetch) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["result"] * 5
+    assert len(calls) == 1
+    assert (flight.calls, flight.shared) == (1, 4)
+    assert "key" not in flight
+
+
+def test_different_keys_and_later_calls_are_not_coalesced():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def fetch(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value
+
+    async def main():
+        first = await asyncio.gather(flight.do("a", lambda: fetch("a")), flight.do("b", lambda: fetch("b")))
+        second = await flight.do("a", lambda: fetch("a again"))
+        return first, second
+
+    assert asyncio.run(main()) == (["a", "b"], "a again")
+    assert calls == ["a", "b", "a again"]
+
+
+def test_exception_reaches_every_caller():
+    flight = AsyncSingleFlight()
+
+    async def broken():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream failed")
+
+    async def main():
+        return await asyncio.gather(*(flight.do("key", broken) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flight.calls == 1
+
+
+def test_cancelled_caller_does_not_cancel_the_shared_call():
+    flight = AsyncSingleFlight()
+    finished = []
+
+    async def fetch():
+        await asyncio.sleep(0.03)
+        finished.append(1)
+        return "result"
+
+    async def main():
+        impatient = asyncio.create_task(flight.do("key", fetch))
+        patient = asyncio.create_task(flight.do("key", fetch))
+        await asyncio.sleep(0.01)
+        impatient.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await impatient
+        return await patient
+
+    assert asyncio.run(main()) == "result"
+    assert finished == [1]
+
+
+def test_start_reports_the_leader():
+    flight = AsyncSingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.01)
+        return 42
+
+    async def main():
+        first, first_leads = flight.start("key", fetch)
+        second, second_leads = flight.start("key", fetch)
+        assert "key" in flight
+        return first_leads, second_leads, await first, await second
+
+    assert asyncio.run(main()) == (True, False, 42, 42)
+
+
+def test_thread_single_flight_shares_one_call():
+    flight = SingleFlight()
+    calls = []
+    results = []
+    gate = threading.Barrier(4)
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.05)
+        return "models"
+
+    def worker():
+        gate.wait()
+        results.append(flight.do("models", fetch))
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["models"] * 4
+    assert len(calls) == 1
+
+
+def test_thread_single_flight_propagates_errors_and_forgets_them():
+    flight = SingleFlight()
+
+    def broken():
+        raise RuntimeError("list_models failed")
+
+    with pytest.raises(RuntimeError):
+        flight.do("models", broken)
+    assert flight.do("models", lambda: "recovered") == "recovered"
+
+
+def test_identical_stage_calls_share_one_upstream_request(client):
+    import main
+
+    request = main.WorkspaceCreateRequest(query="zorbling quux fnord")
+    assert main.local_classify(request.query).confidence < main.LOCAL_CLASSIFIER_THRESHOLD
+    before = main.llm_backend.calls
+
+    async def classify_concurrently():
+        return await asyncio.gather(*(main.classify_query(request) for _ in range(4)))
+
+    results = client.portal.call(classify_concurrently)
+    assert len({result.workspace_type for result in results}) == 1
+    assert main.llm_backend.calls - before == 1
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import time
+
+import httpx
+
+from source_fetch import (
+    MockSourceAdapter,
+    RedditAdapter,
+    SourceAdapter,
+    SourceItem,
+    SourcePipeline,
+    WebAdapter,
+    YouTubeAdapter,
+)
+
+
+class FailingAdapter(SourceAdapter):
+    def __init__(self, name, **kwargs):
+        super().__init__(**kwargs)
+        self.name = name
+        self.calls = 0
+
+    async def search(self, client, query):
+        self.calls += 1
+        raise RuntimeError(f"{self.name} is down")
+
+
+class HangingAdapter(SourceAdapter):
+    name = "hangs"
+
+    async def search(self, client, query):
+        await asyncio.sleep(10)
+        return []
+
+
+async def collect(pipeline, source_queries):
+    try:
+        return [result async for result in pipeline.stream(source_queries)]
+    finally:
+        await pipeline.aclose()
+
+
+def test_results_stream_in_completion_order_and_pairs_are_deduplicated():
+    pipeline = SourcePipeline([MockSourceAdapter("slow", latency_ms=80), MockSourceAdapter("fast", latency_ms=5)])
+    results = asyncio.run(collect(pipeline, {"slow": ["tokyo"], "fast": ["tokyo", "kyoto", "tokyo"]}))
+    assert [(r.source, r.query) for r in results][-1] == ("slow", "tokyo")
+    assert sorted((r.source, r.query) for r in results) == [("fast", "kyoto"), ("fast", "tokyo"), ("slow", "tokyo")]
+    assert all(len(r.items) == 5 and r.error is None for r in results)
+
+
+def test_sources_fan_out_concurrently_within_their_own_limits():
+    pipeline = SourcePipeline([
+        MockSourceAdapter("serial", latency_ms=50, max_concurrency=1),
+        MockSourceAdapter("parallel", latency_ms=50, max_concurrency=4),
+    ])
+    start = time.monotonic()
+    results = asyncio.run(collect(pipeline, {"serial": ["a", "b"], "parallel": ["a", "b", "c", "d"]}))
+    elapsed = time.monotonic() - start
+    assert len(results) == 6
+    # Serial queries run one after the other, everything else alongside them
+    assert 0.1 <= elapsed < 0.2
+    assert results[-1].source == "serial"
+
+
+def test_a_failing_or_hanging_source_does_not_affect_the_others():
+    failing = FailingAdapter("broken")
+    pipeline = SourcePipeline([
+        MockSourceAdapter("web", latency_ms=5),
+        failing,
+        HangingAdapter(timeout=0.05),
+    ])
+    start = time.monotonic()
+    results = {r.source: r for r in asyncio.run(collect(pipeline, {"web": ["q"], "broken": ["q"], "hangs": ["q"]}))}
+    assert time.monotonic() - start < 1
+    assert results["web"].error is None and len(results["web"].items) == 5
+    assert results["broken"].error == "broken is down" and results["broken"].items == []
+    assert results["hangs"].error == "Timed out after 0.05s"
+
+
+def test_only_successful_results_are_cached():
+    failing = FailingAdapter("broken")
+    pipeline = SourcePipeline([MockSourceAdapter("web", latency_ms=1), failing])
+
+    async def twice():
+        first = await pipeline.fetch("web", "Lisbon  trip")
+        again = await pipeline.fetch("web", "lisbon trip")  # same normalized query
+        await pipeline.fetch("broken", "q")
+        await pipeline.fetch("broken", "q")
+        return first, again
+
+    first, again = asyncio.run(twice())
+    assert (first.cached, again.cached) == (False, True)
+    assert again.items == first.items
+    assert failing.calls == 2
+
+
+def test_unavailable_sources_are_reported_not_fetched():
+    pipeline = SourcePipeline([MockSourceAdapter("web", latency_ms=1), YouTubeAdapter(api_key=None)])
+    assert list(pipeline.adapters) == ["web"]
+    result = asyncio.run(pipeline.fetch("youtube", "q"))
+    assert result.error == "Source not available"
+
+
+def test_http_adapters_parse_their_apis_over_the_shared_client():
+    def handler(request):
+        if request.url.host == "api.duckduckgo.com":
+            return httpx.Response(200, json={
+                "Heading": "Lisbon",
+                "AbstractURL": "https://en.wikipedia.org/wiki/Lisbon",
+                "AbstractText": "Capital of Portugal",
+                "RelatedTopics": [
+                    {"FirstURL": "https://duckduckgo.com/Alfama", "Text": "Alfama - old district"},
+                    {"Name": "Group", "Topics": [{"FirstURL": "https://duckduckgo.com/Belem", "Text": "Belem"}]},
+                ],
+            })
+        if request.url.host == "www.reddit.com":
+            assert request.url.params["q"] == "lisbon"
+            return httpx.Response(200, json={"data": {"children": [
+                {"data": {"title": "Lisbon tips", "permalink": "/r/travel/1", "subreddit": "travel", "num_comments": 3}},
+            ]}})
+        return httpx.Response(500)
+
+    pipeline = SourcePipeline([WebAdapter(), RedditAdapter()])
+    pipeline._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    results = {r.source: r for r in asyncio.run(collect(pipeline, {"web": ["lisbon"], "reddit": ["lisbon"]}))}
+    assert results["web"].items == [
+        SourceItem(title="Lisbon", url="https://en.wikipedia.org/wiki/Lisbon", snippet="Capital of Portugal"),
+        SourceItem(title="Alfama", url="https://duckduckgo.com/Alfama", snippet="Alfama - old district"),
+        SourceItem(title="Belem", url="https://duckduckgo.com/Belem", snippet="Belem"),
+    ]
+    assert results["reddit"].items == [
+        SourceItem(title="Lisbon tips", url="https://www.reddit.com/r/travel/1", snippet="r/travel - 3 comments"),
+    ]
+
+
+def test_sources_endpoint_streams_one_ndjson_line_per_query(client):
+    workspace = client.post("/api/workspace/create", json={"query": "budget trip to lisbon in spring"}).json()
+    expected = {
+        (source, query)
+        for source, queries in workspace["schema"]["source_queries"].items()
+        if source in workspace["enabled_sources"]
+        for query in queries or []
+    }
+    assert expected
+
+    response = client.post(f"/api/workspace/{workspace['id']}/sources")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = response.text.splitlines()
+    assert response.text.endswith("\n")
+    results = [json.loads(line) for line in lines]
+    assert {(r["source"], r["query"]) for r in results} == expected
+    assert all(r["items"] and r["error"] is None for r in results)
+
+    response = client.post(f"/api/workspace/{workspace['id']}/sources", json={"sources": ["reddit"]})
+    assert {json.loads(line)["source"] for line in response.text.splitlines()} == {"reddit"}
+
+    assert client.post("/api/workspace/ws_missing/sources").status_code == 404
@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+from stages import StageGraph
+
+
+def recorder(calls, name, result, delay=0.0):
+    async def stage(**deps):
+        calls.append((name, deps))
+        await asyncio.sleep(delay)
+        return result(**deps) if callable(result) else result
+
+    return stage
+
+
+def test_dependents_receive_results_and_independent_stages_overlap():
+    calls = []
+    graph = StageGraph()
+    graph.add("classification", recorder(calls, "classification", "travel", delay=0.01))
+    graph.add("schema", recorder(calls, "schema", lambda classification: f"schema:{classification}", delay=0.05),
+              depends_on=["classification"])
+    graph.add("suggestions", recorder(calls, "suggestions", lambda classification: f"ideas:{classification}",
+                                      delay=0.05), depends_on=["classification"])
+
+    async def timed():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        results = await graph.run()
+        return results, loop.time() - start
+
+    results, elapsed = asyncio.run(timed())
+    assert results == {"classification": "travel", "schema": "schema:travel", "suggestions": "ideas:travel"}
+    assert calls[0] == ("classification", {})
+    assert elapsed < 0.1  # schema and suggestions ran concurrently
+    assert graph.rerun == set()
+
+
+def test_agreeing_speculation_does_not_rerun():
+    calls = []
+    graph = StageGraph()
+    graph.add("classification", recorder(calls, "classification", "travel", delay=0.02))
+    graph.add("schema", recorder(calls, "schema", lambda classification: f"schema:{classification}"),
+              depends_on=["classification"])
+    graph.speculate("classification", "travel")
+
+    results = asyncio.run(graph.run())
+    assert results["schema"] == "schema:travel"
+    # The dependent started from the guess, before the classification finished
+    assert [name for name, _ in calls] == ["classification", "schema"]
+    assert graph.rerun == set()
+
+
+def test_wrong_speculation_reruns_everything_downstream():
+    calls = []
+    graph = StageGraph()
+    graph.add("classification", recorder(calls, "classification", "purchase", delay=0.02))
+    graph.add("schema", recorder(calls, "schema", lambda classification: f"schema:{classification}", delay=0.05),
+              depends_on=["classification"])
+    graph.add("render", recorder(calls, "render", lambda schema: f"render:{schema}"), depends_on=["schema"])
+    graph.add("unrelated", recorder(calls, "unrelated", "done"))
+    graph.speculate("classification", "travel")
+
+    results = asyncio.run(graph.run())
+    assert results == {
+        "classification": "purchase",
+        "schema": "schema:purchase",
+        "render": "render:schema:purchase",
+        "unrelated": "done",
+    }
+    assert graph.rerun == {"schema", "render"}
+    schema_calls = [deps for name, deps in calls if name == "schema"]
+    assert schema_calls == [{"classification": "travel"}, {"classification": "purchase"}]
+    assert sum(1 for name, _ in calls if name == "unrelated") == 1
+
+
+def test_custom_agreement_keeps_speculative_results():
+    graph = StageGraph()
+    graph.add("classification", recorder([], "classification", {"type": "travel", "confidence": 0.9}))
+    graph.add("schema", recorder([], "schema", lambda classification: classification["confidence"]),
+              depends_on=["classification"])
+    graph.speculate(
+        "classification",
+        {"type": "travel", "confidence": 0.5},
+        agrees=lambda guess, actual: guess["type"] == actual["type"],
+    )
+
+    assert asyncio.run(graph.run())["schema"] == 0.5
+    assert graph.rerun == set()
+
+
+def test_failure_cancels_other_stages_and_propagates():
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append("slow")
+            raise
+
+    async def broken():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    graph = StageGraph().add("slow", slow).add("broken", broken)
+    with pytest.raises(RuntimeError, match="boom"):
+        asyncio.run(graph.run())
+    assert cancelled == ["slow"]
+
+
+def test_invalid_graphs_are_rejected():
+    async def stage(**_):
+        return None
+
+    with pytest.raises(ValueError, match="already added"):
+        StageGraph().add("a", stage).add("a", stage)
+    with pytest.raises(ValueError, match="Unknown stage"):
+        asyncio.run(StageGraph().add("a", stage, depends_on=["missing"]).run())
+    with pytest.raises(ValueError, match="cycle"):
+        asyncio.run(StageGraph().add("a", stage, depends_on=["b"]).add("b", stage, depends_on=["a"]).run())
@@ -0,0 +1,141 @@
+import json
+
+import pytest
+
+from streaming_json import StreamingArrayParser
+
+RESPONSE = (
+    "```json\n"
+    '{"title": "ignored [not an item]", "suggestions": [\n'
+    '  {"title": "A {braced} \\"quoted\\" title", "evidence": [{"source": "web", "label": "x", "url": "https://a.example/"}]},\n'
+    '  {"title": "Second", "actions": ["save"]},\n'
+    '  {"title": "Third"}\n'
+    '], "trailing": {"key": "value"}}\n'
+    "```"
+)
+
+
+def feed_all(parser, chunks):
+    items = []
+    for chunk in chunks:
+        items.extend(parser.feed(chunk))
+    return items
+
+
+def test_parser_yields_each_item_once_it_is_complete():
+    parser = StreamingArrayParser("suggestions")
+    marker = RESPONSE.index('{"title": "Second"')
+    first = parser.feed(RESPONSE[:marker])
+    assert [item["title"] for item in first] == ['A {braced} "quoted" title']
+    rest = parser.feed(RESPONSE[marker:])
+    assert [item["title"] for item in rest] == ["Second", "Third"]
+    assert parser.done
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 64])
+def test_parser_is_independent_of_chunk_boundaries(size):
+    chunks = [RESPONSE[i:i + size] for i in range(0, len(RESPONSE), size)]
+    items = feed_all(StreamingArrayParser("suggestions"), chunks)
+    assert items == json.loads(RESPONSE.strip("`json\n"))["suggestions"]
+
+
+def test_parser_ignores_text_after_the_array_and_reports_unfinished_streams():
+    parser = StreamingArrayParser("suggestions")
+    assert parser.feed('{"suggestions": [{"title": "One"}, {"title": "Tw') == [{"title": "One"}]
+    assert not parser.done
+    assert parser.feed('o"}]} {"suggestions": [{"title": "Again"}]}') == [{"title": "Two"}]
+    assert parser.done
+    assert parser.feed('{"title": "Late"}') == []
+
+
+def test_parser_skips_malformed_items():
+    items = feed_all(StreamingArrayParser("items"), ['{"items": [{"a": 1}, {"a": }, {"a": 3}]}'])
+    assert items == [{"a": 1}, {"a": 3}]
+
+
+def sse_events(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def suggestions_json(titles, dead=()):
+    return json.dumps({"suggestions": [
+        {
+            "title": title,
+            "evidence": [{"source": "web", "label": title, "url": f"https://{'dead' if title in dead else 'live'}.example/{i}"}],
+        }
+        for i, title in enumerate(titles)
+    ]})
+
+
+class DeadLinkChecker:
+    """Drops evidence on dead.example, like LinkChecker does for 404s"""
+
+    async def filter(self, suggestions):
+        return [
+            s.model_copy(update={"evidence": [e for e in s.evidence if "dead.example" not in e.url]})
+            for s in suggestions
+        ]
+
+
+def fake_stream(text, fail_after=None):
+    async def stream(*args, **kwargs):
+        end = len(text) if fail_after is None else fail_after
+        for i in range(0, end, 16):
+            yield text[i:min(i + 16, end)]
+        if fail_after is not None:
+            raise RuntimeError("stream dropped")
+
+    return stream
+
+
+def create_streamed(client, query):
+    response = client.post("/api/workspace/create/stream", json={"query": query})
+    assert response.status_code == 200
+    events = sse_events(response.text)
+    assert events[-1][0] == "done", events[-1]
+    return events
+
+
+def cached_suggestions(query, workspace_type):
+    import main
+
+    cached = main.result_cache.get(main.stage_cache_key("suggestions", query, workspace_type))
+    return json.loads(cached)["suggestions"] if cached else None
+
+
+def test_streamed_events_done_payload_and_cache_agree(client, monkeypatch):
+    import main
+
+    monkeypatch.setattr(main, "link_checker", DeadLinkChecker())
+    monkeypatch.setattr(main.llm_client, "stream", fake_stream(suggestions_json(["One", "Two", "Three"], dead={"Two"})))
+    query = "otters on bicycles streamed"
+
+    events = create_streamed(client, query)
+    streamed = [data for event, data in events if event == "suggestion"]
+    done = events[-1][1]
+    assert [s["title"] for s in streamed] == ["One", "Two", "Three"]
+    assert streamed[1]["evidence"] == []  # link-checked before being sent
+    assert done["suggestions"] == streamed
+    assert cached_suggestions(query, done["workspace_type"]) == streamed
+
+
+def test_failed_stream_is_not_cached_and_falls_back(client, monkeypatch):
+    import main
+
+    text = suggestions_json(["Partial A", "Partial B", "Never sent"])
+    monkeypatch.setattr(main.llm_client, "stream", fake_stream(text, fail_after=text.index('{"title": "Never sent"')))
+    query = "otters on bicycles dropped"
+
+    events = create_streamed(client, query)
+    titles = [data["title"] for event, data in events if event == "suggestion"]
+    done = events[-1][1]
+    assert titles[:2] == ["Partial A", "Partial B"]
+    assert len(titles) > 2  # the rest came from a regular suggestions call
+    assert len(titles) == len(set(titles))
+    assert [s["title"] for s in done["suggestions"]] == titles
+    cached = cached_suggestions(query, done["workspace_type"])
+    assert cached is None or "Partial A" not in [s["title"] for s in cached]
@@ -0,0 +1,103 @@
+import json
+from typing import List, Optional
+
+import pytest
+from pydantic import BaseModel, ValidationError
+
+from observability import JSON_REPAIRS
+from structured_output import gemini_schema, generation_config, parse_json_model, repair_json
+
+
+class Item(BaseModel):
+    title: str
+    tags: List[str] = []
+
+
+class Response(BaseModel):
+    items: List[Item]
+    note: Optional[str] = None
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ('{"a": 1}', {"a": 1}),
+        ('```json\n{"a": 1}\n```', {"a": 1}),
+        ('Here you go:\n{"a": [1, 2,],}\nHope that helps!', {"a": [1, 2]}),
+        ('```json\n{"a": {"b": [1, 2', {"a": {"b": [1, 2]}}),
+        ('{"a": "cut off mid-str', {"a": "cut off mid-str"}),
+        ('{"a": "has } and ] inside", "b": [', {"a": "has } and ] inside", "b": []}),
+        ('[{"a": 1}, {"a": 2},', [{"a": 1}, {"a": 2}]),
+        ('{"a": 1}\nNote: {"b"} was left out', {"a": 1}),
+    ],
+)
+def test_repair_json_fixes_common_model_output_damage(text, expected):
+    assert json.loads(repair_json(text)) == expected
+
+
+def test_repair_json_leaves_text_without_json_alone():
+    assert repair_json("  no json here  ") == "no json here"
+
+
+def test_parse_json_model_validates_clean_output_in_one_pass():
+    before = JSON_REPAIRS.value(outcome="ok")
+    result = parse_json_model(Response, '{"items": [{"title": "One"}]}')
+    assert result == Response(items=[Item(title="One")])
+    assert JSON_REPAIRS.value(outcome="ok") == before
+
+
+def test_parse_json_model_repairs_malformed_json_once():
+    before = JSON_REPAIRS.value(outcome="ok")
+    result = parse_json_model(Response, '```json\n{"items": [{"title": "One", "tags": ["a",]},]}\n```')
+    assert result.items == [Item(title="One", tags=["a"])]
+    assert JSON_REPAIRS.value(outcome="ok") == before + 1
+
+
+def test_parse_json_model_does_not_repair_schema_errors():
+    before = JSON_REPAIRS.value(outcome="failed"), JSON_REPAIRS.value(outcome="ok")
+    with pytest.raises(ValidationError):
+        parse_json_model(Response, '{"items": [{"tags": []}]}')
+    assert (JSON_REPAIRS.value(outcome="failed"), JSON_REPAIRS.value(outcome="ok")) == before
+
+
+def test_parse_json_model_counts_failed_repairs():
+    before = JSON_REPAIRS.value(outcome="failed")
+    with pytest.raises(ValidationError):
+        parse_json_model(Response, "the model refused")
+    assert JSON_REPAIRS.value(outcome="failed") == before + 1
+
+
+def test_gemini_schema_inlines_refs_and_requires_every_property():
+    schema = gemini_schema(Response)
+    assert schema["type"] == "OBJECT"
+    assert schema["required"] == ["items", "note"]
+    item = schema["properties"]["items"]["items"]
+    assert item == {
+        "type": "OBJECT",
+        "properties": {"title": {"type": "STRING"}, "tags": {"type": "ARRAY", "items": {"type": "STRING"}}},
+        "required": ["title", "tags"],
+    }
+    assert schema["properties"]["note"] == {"type": "STRING", "nullable": True}
+    assert "$defs" not in json.dumps(schema)
+
+
+def test_generation_config_only_sets_what_the_sdk_supports():
+    class OldConfig:
+        def __init__(self, temperature=None, max_output_tokens=None):
+            self.kwargs = {"max_output_tokens": max_output_tokens}
+
+    class NewConfig:
+        def __init__(self, max_output_tokens=None, response_mime_type=None, response_schema=None):
+            self.kwargs = {
+                "max_output_tokens": max_output_tokens,
+                "response_mime_type": response_mime_type,
+                "response_schema": response_schema,
+            }
+
+    assert generation_config(OldConfig, response_schema={"type": "OBJECT"}) is None
+    assert generation_config(OldConfig, max_output_tokens=256).kwargs == {"max_output_tokens": 256}
+    assert generation_config(NewConfig, response_schema={"type": "OBJECT"}, max_output_tokens=256).kwargs == {
+        "max_output_tokens": 256,
+        "response_mime_type": "application/json",
+        "response_schema": {"type": "OBJECT"},
+    }
@@ -0,0 +1,85 @@
+import json
+import time
+
+from workspace_store import WorkspaceStore, workspace_id
+
+
+def test_store_keeps_workspaces_by_stable_id(tmp_path):
+    store = WorkspaceStore(str(tmp_path / "workspaces.db"), max_entries=1)
+    first, second = "Trip to Japan", "learn rust"
+    store.put(workspace_id(first), first, "travel_research", json.dumps({"query": first}))
+    store.put(workspace_id(second), second, "learning_plan", json.dumps({"query": second}))
+    store.flush()
+    assert workspace_id(first) == workspace_id("  trip to   japan ")
+    # Evicted from memory, read back from disk
+    assert json.loads(store.get(workspace_id(first))) == {"query": first}
+    assert [entry["query"] for entry in store.list("learning_plan")] == [second]
+    store.close()
+
+    reopened = WorkspaceStore(str(tmp_path / "workspaces.db"))
+    assert reopened.get_by_query("trip to japan") is not None
+    reopened.close()
+
+
+def test_a_failed_write_is_logged_and_the_writer_keeps_going(tmp_path):
+    store = WorkspaceStore(str(tmp_path / "workspaces.db"))
+    store.put("ws_bad", "bad", "learning_plan", object())  # can't be bound as a column value
+    store.put("ws_good", "good", "learning_plan", "{}")
+    start = time.monotonic()
+    store.flush()
+    store.put("ws_later", "later", "learning_plan", "{}")
+    store.flush()
+    assert time.monotonic() - start < 1
+    assert store.stats()["write_errors"] == 1 and store.stats()["writes"] == 2
+    store.close()
+
+    reopened = WorkspaceStore(str(tmp_path / "workspaces.db"))
+    assert [reopened.get(key) for key in ("ws_bad", "ws_good", "ws_later")] == [None, "{}", "{}"]
+    reopened.close()
+
+
+def test_generated_workspaces_are_persisted(client):
+    created = client.post("/api/workspace/create", json={"query": "fnord blorp three"})
+    assert created.status_code == 200
+    stored = client.get(f"/api/workspace/{created.json()['id']}")
+    assert stored.status_code == 200
+    assert stored.json()["query"] == "fnord blorp three"
+
+
+def test_fallback_workspaces_are_stored_degraded_but_not_cached(client, monkeypatch):
+    import main
+
+    async def broken(*args, **kwargs):
+        raise RuntimeError("500 Internal error")
+
+    async def broken_stream(*args, **kwargs):
+        raise RuntimeError("500 Internal error")
+        yield
+
+    monkeypatch.setattr(main.llm_client, "generate", broken)
+    monkeypatch.setattr(main.llm_client, "stream", broken_stream)
+    for path, query in [("/api/workspace/create", "zibble quank one"), ("/api/workspace/create/stream", "zibble quank two")]:
+        response = client.post(path, json={"query": query})
+        assert response.status_code == 200
+        # The frontend navigates to the ID it was given, so it has to resolve
+        stored = client.get(f"/api/workspace/{workspace_id(query)}")
+        assert stored.status_code == 200 and stored.json()["degraded"] is True
+        assert main.result_cache.get(main.stage_cache_key("workspace", query)) is None
+        saved = client.post(f"/api/workspace/{workspace_id(query)}/items", json={"type": "note", "title": "keep"})
+        assert saved.status_code == 200
+
+    monkeypatch.undo()
+    # Once the model is back, the same query is regenerated over the degraded copy
+    client.post("/api/workspace/create", json={"query": "zibble quank one"})
+    assert client.get(f"/api/workspace/{workspace_id('zibble quank one')}").json()["degraded"] is False
+
+
+def test_created_again_after_a_refresh_returns_the_refreshed_workspace(client):
+    created = client.post("/api/workspace/create", json={"query": "fnord blorp four"}).json()
+    sources = created["enabled_sources"][:1]
+    refreshed = client.post(f"/api/workspace/{created['id']}/refresh", json={"enabled_sources": sources})
+    assert refreshed.status_code == 200
+
+    again = client.post("/api/workspace/create", json={"query": "fnord blorp four"}).json()
+    assert again["enabled_sources"] == sources
+    assert client.get(f"/api/workspace/{created['id']}").json()["enabled_sources"] == sources
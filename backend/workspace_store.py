@@ -0,0 +1,209 @@
+"""
+Workspace store for Atlas - keeps created workspaces so they can be reopened by ID
+"""
+
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from result_cache import content_hash, normalize_query
+
+logger = logging.getLogger("atlas.workspace_store")
+
+
+def workspace_id(query: str) -> str:
+    """Stable ID for a query's workspace: the same (normalized) query always gets the same ID"""
+    return f"ws_{content_hash('workspace', normalize_query(query))}"
+
+
+def query_hash(query: str) -> str:
+    return content_hash(normalize_query(query))
+
+
+class WorkspaceStore:
+    """
+    Workspaces as stored JSON, keyed by ID.
+
+    Reads come from an in-memory LRU of `max_entries` bodies, then SQLite.
+    Writes go to memory at once and are persisted by a background thread in
+    batched transactions, so `put` never waits on disk. With no `db_path`
+    the store is memory-only. The SQLite file uses WAL so request-path reads
+    aren't blocked by the writer, and is indexed on id, query hash and
+    workspace type.
+    """
+
+    _STOP = object()
+
+    def __init__(self, db_path: Optional[str] = None, max_entries: int = 4096, batch_size: int = 64):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # id -> (query, type, body, updated_at)
+        self._pending: "queue.Queue" = queue.Queue()
+        self._db: Optional[sqlite3.Connection] = None
+        self._writer: Optional[threading.Thread] = None
+        self.writes = 0
+        self.write_errors = 0
+        if db_path:
+            self._db = self._connect()
+            self._db.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS workspaces (
+                    id TEXT PRIMARY KEY,
+                    query_hash TEXT NOT NULL,
+                    workspace_type TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    body TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS workspaces_query_hash ON workspaces (query_hash);
+                CREATE INDEX IF NOT EXISTS workspaces_type ON workspaces (workspace_type, updated_at);
+                """
+            )
+            self._writer = threading.Thread(target=self._write_loop, name="workspace-writer", daemon=True)
+            self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def put(self, workspace_id: str, query: str, workspace_type: str, body: str) -> None:
+        """Store a workspace's JSON body; persisted in the background"""
+        now = time.time()
+        with self._lock:
+            self._remember(workspace_id, (query, workspace_type, body, now))
+        if self._writer is not None:
+            self._pending.put((workspace_id, query_hash(query), workspace_type, query, body, now))
+
+    def get(self, workspace_id: str) -> Optional[str]:
+        """A workspace's JSON body, or None"""
+        with self._lock:
+            entry = self._entries.get(workspace_id)
+            if entry is not None:
+                self._entries.move_to_end(workspace_id)
+                return entry[2]
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                "SELECT query, workspace_type, body, updated_at FROM workspaces WHERE id = ?", (workspace_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._remember(workspace_id, tuple(row))
+            return row[2]
+
+    def get_by_query(self, query: str) -> Optional[str]:
+        return self.get(workspace_id(query))
+
+    def list(self, workspace_type: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        """Most recently updated workspaces (id, query, type, updated_at), optionally of one type"""
+        self.flush()
+        with self._lock:
+            if self._db is None:
+                rows = [(wid, *entry) for wid, entry in self._entries.items()]
+                rows = [
+                    (wid, q, t, updated_at) for wid, q, t, _, updated_at in rows
+                    if workspace_type is None or t == workspace_type
+                ]
+                rows.sort(key=lambda row: row[3], reverse=True)
+                rows = rows[:limit]
+            elif workspace_type is None:
+                rows = self._db.execute(
+                    "SELECT id, query, workspace_type, updated_at FROM workspaces ORDER BY updated_at DESC LIMIT ?",
+                    (limit,),
+                ).fetchall()
+            else:
+                rows = self._db.execute(
+                    "SELECT id, query, workspace_type, updated_at FROM workspaces "
+                    "WHERE workspace_type = ? ORDER BY updated_at DESC LIMIT ?",
+                    (workspace_type, limit),
+                ).fetchall()
+        return [
+            {"id": wid, "query": q, "workspace_type": t, "updated_at": updated_at}
+            for wid, q, t, updated_at in rows
+        ]
+
+    def _remember(self, workspace_id: str, entry: tuple) -> None:
+        self._entries[workspace_id] = entry
+        self._entries.move_to_end(workspace_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _write_loop(self) -> None:
+        db = self._connect()
+        while True:
+            item = self._pending.get()
+            batch, done = [], []
+            while item is not None:
+                if item is self._STOP or isinstance(item, threading.Event):
+                    done.append(item)
+                else:
+                    batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._pending.get_nowait()
+                except queue.Empty:
+                    item = None
+            if batch:
+                try:
+                    self._write(db, batch)
+                except Exception:
+                    # Write one at a time so a single bad row (or a passing lock) only loses itself
+                    for row in batch:
+                        try:
+                            self._write(db, [row])
+                        except Exception:
+                            self.write_errors += 1
+                            logger.exception(f"Failed to persist workspace {row[0]}")
+            for marker in done:
+                if marker is self._STOP:
+                    db.close()
+                    return
+                marker.set()
+
+    def _write(self, db: sqlite3.Connection, batch: List[tuple]) -> None:
+        db.execute("BEGIN")
+        try:
+            db.executemany(
+                "INSERT INTO workspaces (id, query_hash, workspace_type, query, body, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET workspace_type = excluded.workspace_type, "
+                "query = excluded.query, body = excluded.body, updated_at = excluded.updated_at",
+                [(wid, qh, wt, q, body, now, now) for wid, qh, wt, q, body, now in batch],
+            )
+            db.execute("COMMIT")
+        except Exception:
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            raise
+        self.writes += len(batch)
+
+    def flush(self, timeout: Optional[float] = 5.0) -> None:
+        """Wait until everything `put` so far is on disk"""
+        if self._writer is None or not self._writer.is_alive():
+            return
+        flushed = threading.Event()
+        self._pending.put(flushed)
+        flushed.wait(timeout)
+
+    def close(self) -> None:
+        if self._writer is not None and self._writer.is_alive():
+            self._pending.put(self._STOP)
+            self._writer.join(timeout=5.0)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "cached": len(self._entries),
+            "pending_writes": self._pending.qsize(),
+            "writes": self.writes,
+            "write_errors": self.write_errors,
+        }
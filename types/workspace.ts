@@ -58,4 +58,6 @@ export interface Workspace {
   enabled_sources: string[];
   suggestions: Suggestion[];
   saved_items: SavedItem[];
+  // A stage fell back to placeholder content; creating the workspace again retries it
+  degraded?: boolean;
 }